@@ -0,0 +1,371 @@
+"""
+Conversion benchmark of the Khulnasoft backend.
+
+Converts synthetic rule corpora (and optionally a rule directory, e.g. a SigmaHQ checkout) with
+each output format and processing pipeline and reports the throughput in rules per second,
+latency percentiles of the conversion phases and the peak RSS. Each scenario runs in a fresh
+process, so the peak RSS is not influenced by previous scenarios.
+
+    python benchmarks/benchmark_conversion.py --sizes 1000 10000 50000 --save-baseline baseline.json
+    python benchmarks/benchmark_conversion.py --sizes 1000 10000 50000 --baseline baseline.json
+
+With --baseline, the run fails with exit code 1 if the throughput of a scenario dropped or its
+peak RSS grew by more than the tolerance compared to the baseline.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+from sigma.collection import SigmaCollection
+from sigma.correlations import SigmaCorrelationRule
+from sigma.conversion.state import ConversionState
+from sigma.exceptions import SigmaError
+from sigma.rule import SigmaRule
+
+from sigma.backends.khulnasoft import KhulnasoftBackend
+from sigma.pipelines.khulnasoft import pipelines
+
+phases = ("pipeline", "conversion", "finalization", "correlation", "output")
+
+logsources = [
+    (
+        {"product": "windows", "category": "process_creation"},
+        ["CommandLine", "Image", "ParentImage", "OriginalFileName", "User"],
+    ),
+    (
+        {"product": "windows", "category": "registry_set"},
+        ["TargetObject", "Details", "Image"],
+    ),
+    (
+        {"product": "windows", "category": "file_event"},
+        ["TargetFilename", "Image"],
+    ),
+    ({"category": "proxy"}, ["c-uri", "c-useragent", "cs-host"]),
+]
+
+modifiers = ["", "|contains", "|startswith", "|endswith", "|re", "|contains|all"]
+
+
+def synthetic_value(rnd: random.Random, modifier: str) -> str:
+    word = "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(8))
+    if modifier == "|re":
+        return f"{word}[0-9]+\\.exe"
+    return f"\\{word}.exe"
+
+
+def synthetic_rule(rnd: random.Random, index: int) -> Dict[str, Any]:
+    logsource, fields = rnd.choice(logsources)
+    detection = {}
+    for selection in ("selection", "filter")[: rnd.randint(1, 2)]:
+        detection[selection] = {}
+        for field in rnd.sample(fields, rnd.randint(1, len(fields))):
+            modifier = rnd.choice(modifiers)
+            detection[selection][field + modifier] = [
+                synthetic_value(rnd, modifier) for _ in range(rnd.randint(1, 5))
+            ]
+    return {
+        "title": f"Synthetic rule {index}",
+        "name": f"synthetic_rule_{index}",
+        "status": "test",
+        "description": "Synthetic benchmark rule",
+        "logsource": logsource,
+        "detection": {
+            **detection,
+            "condition": (
+                "selection and not filter" if "filter" in detection else "selection"
+            ),
+        },
+    }
+
+
+def synthetic_correlation_rule(rnd: random.Random, index: int) -> Dict[str, Any]:
+    correlation_type = rnd.choice(["event_count", "value_count", "temporal"])
+    correlation = {
+        "type": correlation_type,
+        "rules": [
+            f"synthetic_rule_{index - i}"
+            for i in range(1, 3 if correlation_type == "temporal" else 2)
+        ],
+        "group-by": ["Image"],
+        "timespan": "15m",
+        "condition": {"gte": 5},
+    }
+    if correlation_type == "value_count":
+        correlation["condition"]["field"] = "User"
+    return {
+        "title": f"Synthetic correlation {index}",
+        "status": "test",
+        "correlation": correlation,
+    }
+
+
+def synthetic_corpus(size: int, correlations: bool, seed: int = 0) -> SigmaCollection:
+    """Generate a deterministic rule corpus. Every tenth rule is a correlation rule if enabled."""
+    rnd = random.Random(seed)
+    return SigmaCollection.from_dicts(
+        [
+            (
+                synthetic_correlation_rule(rnd, i)
+                if correlations and i % 10 == 9
+                else synthetic_rule(rnd, i)
+            )
+            for i in range(size)
+        ]
+    )
+
+
+def load_corpus(corpus: str, correlations: bool) -> SigmaCollection:
+    if corpus.startswith("synthetic:"):
+        return synthetic_corpus(int(corpus.split(":", 1)[1]), correlations)
+    return SigmaCollection.load_ruleset([corpus], collect_errors=True)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if len(values) < 2:
+        return {"p50": sum(values), "p90": sum(values), "p99": sum(values)}
+    quantiles = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": quantiles[49], "p90": quantiles[89], "p99": quantiles[98]}
+
+
+def peak_rss_kb() -> Optional[int]:
+    if resource is None:  # pragma: no cover
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def convert_rule_phases(
+    backend: KhulnasoftBackend,
+    rule: SigmaRule,
+    output_format: str,
+    latencies: Dict[str, List[float]],
+) -> List[Any]:
+    """Same steps as Backend.convert_rule, but with timing of each phase."""
+    start = time.perf_counter()
+    pipeline = backend._compose_processing_pipeline(output_format)
+    backend.last_processing_pipeline = pipeline
+    pipeline.apply(rule)
+    processed = time.perf_counter()
+    states = [
+        ConversionState(processing_state=dict(pipeline.state))
+        for _ in rule.detection.parsed_condition
+    ]
+    queries = [
+        backend.convert_condition(cond.parsed, states[index])
+        for index, cond in enumerate(rule.detection.parsed_condition)
+    ]
+    converted = time.perf_counter()
+    finalized_queries = [
+        backend.finalize_query(rule, query, index, states[index], output_format)
+        for index, query in enumerate(queries)
+    ]
+    end = time.perf_counter()
+    rule.set_conversion_result(finalized_queries)
+    rule.set_conversion_states(states)
+    latencies["pipeline"].append(processed - start)
+    latencies["conversion"].append(converted - processed)
+    latencies["finalization"].append(end - converted)
+    return finalized_queries if rule._output else []
+
+
+def convert_correlation_rule(
+    backend: KhulnasoftBackend,
+    rule: SigmaCorrelationRule,
+    output_format: str,
+    latencies: Dict[str, List[float]],
+) -> List[Any]:
+    """
+    Convert a correlation rule of a fresh copy of the corpus. Its rules are converted before, so
+    the processing pipeline is applied once to them and only the correlation is timed.
+    """
+    for rule_reference in rule.rules:
+        if isinstance(rule_reference.rule, SigmaRule):
+            backend.convert_rule(rule_reference.rule, output_format)
+    start = time.perf_counter()
+    queries = backend.convert_correlation_rule(rule, output_format)
+    latencies["correlation"].append(time.perf_counter() - start)
+    return queries
+
+
+def run_scenario(scenario: Dict[str, Any]) -> Dict[str, Any]:
+    rule_collection = load_corpus(scenario["corpus"], scenario["correlations"])
+    rule_collection.resolve_rule_references()
+    # Correlation rules are converted from a separate copy with unprocessed rules.
+    correlation_collection = load_corpus(scenario["corpus"], scenario["correlations"])
+    correlation_collection.resolve_rule_references()
+    backend = KhulnasoftBackend(
+        processing_pipeline=(
+            pipelines[scenario["pipeline"]]() if scenario["pipeline"] else None
+        )
+    )
+    output_format = scenario["format"]
+
+    rules = [
+        (rule, correlation_copy)
+        for rule, correlation_copy in zip(
+            rule_collection.rules, correlation_collection.rules
+        )
+        # Correlation rules are rejected by some output formats and are not counted as errors.
+        if isinstance(rule, SigmaRule)
+        or output_format not in backend.correlation_unsupported_formats
+    ]
+
+    latencies = {phase: [] for phase in phases}
+    errors = 0
+    queries = []
+    start = time.perf_counter()
+    for rule, correlation_copy in rules:
+        try:
+            if isinstance(rule, SigmaRule):
+                queries += convert_rule_phases(backend, rule, output_format, latencies)
+            else:
+                queries += convert_correlation_rule(
+                    backend, correlation_copy, output_format, latencies
+                )
+        except SigmaError:
+            errors += 1
+    output_start = time.perf_counter()
+    try:
+        backend.finalize(queries, output_format)
+    except SigmaError:
+        errors += 1
+    latencies["output"].append(time.perf_counter() - output_start)
+    duration = time.perf_counter() - start
+
+    return {
+        "rules": len(rules),
+        "errors": errors,
+        "seconds": duration,
+        "rules_per_second": len(rules) / duration,
+        "latency": {
+            phase: percentiles(values) for phase, values in latencies.items() if values
+        },
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def scenarios(corpora: List[str], correlations: bool) -> List[Dict[str, Any]]:
+    """All combinations of corpus, output format and processing pipeline that can be converted."""
+    return [
+        {
+            "name": f"{corpus}/{output_format}/{pipeline or 'no_pipeline'}",
+            "corpus": corpus,
+            "format": output_format,
+            "pipeline": pipeline,
+            "correlations": correlations,
+        }
+        for corpus in corpora
+        for output_format in KhulnasoftBackend.formats
+        for pipeline in [None, *pipelines]
+        # The data model output requires the data model set by the CIM pipeline.
+        if not output_format.startswith("data_model") or pipeline == "khulnasoft_cim"
+    ]
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]
+        if result["rules_per_second"] < reference["rules_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['rules_per_second']:.0f} rules/s, baseline {reference['rules_per_second']:.0f} rules/s"
+            )
+        if (
+            result["peak_rss_kb"]
+            and reference.get("peak_rss_kb")
+            and result["peak_rss_kb"] > reference["peak_rss_kb"] * (1 + tolerance)
+        ):
+            regressions.append(
+                f"{name}: peak RSS {result['peak_rss_kb']} kB, baseline {reference['peak_rss_kb']} kB"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Khulnasoft backend conversion."
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=[1000, 10000, 50000],
+        help="Sizes of synthetic rule corpora",
+    )
+    parser.add_argument(
+        "--corpus",
+        action="append",
+        default=[],
+        help="Additional rule directory, e.g. the rules directory of a SigmaHQ checkout",
+    )
+    parser.add_argument(
+        "--no-correlations",
+        dest="correlations",
+        action="store_false",
+        help="Don't add correlation rules to synthetic corpora",
+    )
+    parser.add_argument(
+        "--filter", default="", help="Only run scenarios containing this string"
+    )
+    parser.add_argument("--output", type=Path, help="Write results as JSON")
+    parser.add_argument("--save-baseline", type=Path, help="Store results as baseline")
+    parser.add_argument("--baseline", type=Path, help="Compare results with baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="Accepted relative throughput drop and peak RSS growth (default: 0.3)",
+    )
+    args = parser.parse_args(argv)
+
+    corpora = [f"synthetic:{size}" for size in args.sizes] + args.corpus
+    results = {}
+    context = get_context("spawn")
+    for scenario in scenarios(corpora, args.correlations):
+        if args.filter not in scenario["name"]:
+            continue
+        with context.Pool(1) as pool:
+            result = results[scenario["name"]] = pool.apply(run_scenario, (scenario,))
+        print(
+            f"{scenario['name']:<60} {result['rules_per_second']:>9.0f} rules/s"
+            f" {result['peak_rss_kb'] or 0:>9} kB peak RSS {result['errors']:>6} errors"
+            + "".join(
+                f"  {phase} p50/p99 {latency['p50'] * 1000:.2f}/{latency['p99'] * 1000:.2f} ms"
+                for phase, latency in result["latency"].items()
+            ),
+            flush=True,
+        )
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            path.write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Import and cold start benchmark of the Khulnasoft backend.
+
+Each scenario runs repeatedly in a fresh interpreter and measures the time until the backend and
+pipeline modules are imported and, for the cold start scenarios, until the first rule is
+converted. This is the startup overhead of short-lived conversion processes like serverless
+workers. With --top, the modules with the largest own import time reported by -X importtime are
+listed for each scenario.
+
+    python benchmarks/benchmark_import.py --save-baseline import_baseline.json
+    python benchmarks/benchmark_import.py --baseline import_baseline.json
+
+With --baseline, the run fails with exit code 1 if the median time of a scenario grew by more
+than the tolerance compared to the baseline. Bytecode caches should be written before (i.e.
+PYTHONDONTWRITEBYTECODE not set), otherwise the compilation of the modules is measured too.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+rule = """
+title: Benchmark
+status: test
+logsource:
+    category: process_creation
+    product: windows
+detection:
+    selection:
+        Image|endswith: '\\\\cmd.exe'
+        CommandLine|contains: whoami
+    condition: selection
+"""
+
+scenarios = {
+    "import_backend": "import sigma.backends.khulnasoft",
+    "import_pipelines": "import sigma.pipelines.khulnasoft",
+    "import_all": "import sigma.backends.khulnasoft, sigma.pipelines.khulnasoft",
+    **{
+        f"first_rule/{pipeline or 'no_pipeline'}": f"""
+from sigma.backends.khulnasoft import KhulnasoftBackend
+from sigma.collection import SigmaCollection
+from sigma.pipelines.khulnasoft import pipelines
+backend = KhulnasoftBackend({f"pipelines[{pipeline!r}]()" if pipeline else ""})
+backend.convert(SigmaCollection.from_yaml({rule!r}))
+"""
+        for pipeline in [None, "khulnasoft_windows", "khulnasoft_cim"]
+    },
+}
+
+timer = """
+import time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+"""
+
+
+def run(code: str, importtime: bool = False) -> Tuple[float, str]:
+    """Run code in a fresh interpreter and return its duration and the -X importtime report."""
+    result = subprocess.run(
+        [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def top_modules(report: str, count: int) -> List[Tuple[str, int]]:
+    """Modules with the largest own import time in microseconds from a -X importtime report."""
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, module = line[len("import time:") :].split("|")
+        modules.append((module.strip(), int(self_time)))
+    return sorted(modules, key=lambda module: -module[1])[:count]
+
+
+def run_scenario(code: str, repeat: int, top: int) -> Dict[str, Any]:
+    times = [run(timer.format(code=code))[0] for _ in range(repeat)]
+    result = {
+        "median": statistics.median(times),
+        "min": min(times),
+        "max": max(times),
+    }
+    if top:
+        result["top_modules"] = top_modules(
+            run(timer.format(code=code), importtime=True)[1], top
+        )
+    return result
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    return [
+        f"{name}: median {result['median'] * 1000:.1f} ms, baseline {baseline[name]['median'] * 1000:.1f} ms"
+        for name, result in results.items()
+        if name in baseline
+        and result["median"] > baseline[name]["median"] * (1 + tolerance)
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the import and cold start time of the Khulnasoft backend."
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=10,
+        help="Number of fresh interpreters per scenario (default: 10)",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=0,
+        help="List the modules with the largest own import time per scenario",
+    )
+    parser.add_argument(
+        "--filter", default="", help="Only run scenarios containing this string"
+    )
+    parser.add_argument("--output", type=Path, help="Write results as JSON")
+    parser.add_argument("--save-baseline", type=Path, help="Store results as baseline")
+    parser.add_argument("--baseline", type=Path, help="Compare results with baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="Accepted relative growth of the median time (default: 0.3)",
+    )
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, code in scenarios.items():
+        if args.filter not in name:
+            continue
+        result = results[name] = run_scenario(code, args.repeat, args.top)
+        print(
+            f"{name:<40} median {result['median'] * 1000:>7.1f} ms"
+            f"  min {result['min'] * 1000:>7.1f} ms  max {result['max'] * 1000:>7.1f} ms",
+            flush=True,
+        )
+        for module, self_time in result.get("top_modules", []):
+            print(f"    {module:<50} {self_time / 1000:>7.1f} ms")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            path.write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        regressions = compare(
+            results, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
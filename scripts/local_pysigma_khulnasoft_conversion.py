@@ -1,26 +1,160 @@
+"""
+Convert a directory of Sigma rules into Khulnasoft queries on all CPU cores.
+
+The rule files are split into shards that are converted by a pool of worker processes. One JSON
+object is written per line and rule with the converted queries, the conversion errors and the time
+spent for the conversion of the rule:
+
+    python scripts/local_pysigma_khulnasoft_conversion.py -f savedsearches -p khulnasoft_windows sigma/rules
+
+Correlation rules are converted together with the rules contained in the same file. Rule
+references across files are not resolved. Only the output formats that generate one query string per
+rule are supported, the output formats that combine all rules are finalized by the backend for a
+whole rule collection.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import yaml
 from sigma.collection import SigmaCollection
+from sigma.exceptions import SigmaError
+from sigma.rule import SigmaRule
 
 from sigma.backends.khulnasoft import KhulnasoftBackend
+from sigma.pipelines.khulnasoft import pipelines
+
+khulnasoft_backend: Optional[KhulnasoftBackend] = None
+
+# Output formats with one query string per rule that can be converted independently by the workers.
+output_formats = ["default", "savedsearches", "data_model", "data_model_savedsearches"]
+
+
+def init_worker(pipeline_names: List[str], cache_dir: Optional[Path]) -> None:
+    """Create the backend once per worker process."""
+    global khulnasoft_backend
+    processing_pipeline = (
+        sum(pipelines[name]() for name in pipeline_names) if pipeline_names else None
+    )
+    khulnasoft_backend = KhulnasoftBackend(
+        processing_pipeline=processing_pipeline, cache_dir=cache_dir
+    )
+
+
+def convert_shard(paths: List[Path], output_format: str) -> List[Dict[str, Any]]:
+    """Convert all rules contained in the given rule files into one record per rule."""
+    return [record for path in paths for record in convert_file(path, output_format)]
+
+
+def convert_file(path: Path, output_format: str) -> Iterator[Dict[str, Any]]:
+    try:
+        with path.open(encoding="utf-8") as f:
+            rule_collection = SigmaCollection.from_yaml(f)
+        rule_collection.resolve_rule_references()
+    except (SigmaError, yaml.YAMLError, OSError, UnicodeDecodeError) as e:
+        yield {"path": str(path), "errors": [str(e)]}
+        return
+
+    for rule in rule_collection.rules:
+        record = {
+            "path": str(path),
+            "id": str(rule.id) if rule.id else None,
+            "title": rule.title,
+            "queries": [],
+            "errors": [],
+        }
+        start = time.perf_counter()
+        try:
+            if isinstance(rule, SigmaRule):
+                record["queries"] = khulnasoft_backend.convert_rule(rule, output_format)
+            else:
+                record["queries"] = khulnasoft_backend.convert_correlation_rule(
+                    rule, output_format
+                )
+        except SigmaError as e:
+            record["errors"].append(str(e))
+        except Exception as e:  # an unexpected error must not abort the whole run
+            record["errors"].append(f"{type(e).__name__}: {e}")
+        record["time"] = time.perf_counter() - start
+        yield record
+
 
+def shard(paths: List[Path], size: int) -> Iterator[List[Path]]:
+    for i in range(0, len(paths), size):
+        yield paths[i : i + size]
 
-# Create the Khulnasoft Pipeline and Backend
-khulnasoft_backend = KhulnasoftBackend()
 
-# Load rules from the Sigma repository which can be cloned from https://github.com/SigmaHQ/sigma
-# Add the path to the rule that should be converted to the following list:
-sigma_rules_to_convert = [
-    r"/Users/{your.username}/sigma/sigma/rules/{path/to/rule/to/be/converted}",
-    r"/Users/{your.username}/sigma/sigma/rules/cloud/azure/azure_blocked_account_attempt.yml",  # example rule path
-]
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Convert Sigma rules into Khulnasoft queries with multiple processes and output JSON Lines."
+    )
+    parser.add_argument(
+        "rules", nargs="+", type=Path, help="Sigma rule files or directories"
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=output_formats,
+        default="default",
+        help="Output format of the backend",
+    )
+    parser.add_argument(
+        "-p",
+        "--pipeline",
+        action="append",
+        choices=pipelines.keys(),
+        default=[],
+        help="Processing pipeline, can be given multiple times",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "-s",
+        "--shard-size",
+        type=int,
+        default=50,
+        help="Number of rule files converted by a worker at once",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache-dir",
+        type=Path,
+        help="Directory of the query cache shared by the worker processes",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=argparse.FileType("w", encoding="utf-8"),
+        default=sys.stdout,
+        help="Output file (default: stdout)",
+    )
+    args = parser.parse_args(argv)
 
-sigma_rule_collection = SigmaCollection.load_ruleset(sigma_rules_to_convert)
+    paths = sorted(SigmaCollection.resolve_paths(args.rules))
+    failed = False
+    with Pool(args.jobs, init_worker, (args.pipeline, args.cache_dir)) as pool:
+        for records in pool.imap(
+            partial(convert_shard, output_format=args.format),
+            shard(paths, args.shard_size),
+        ):
+            for record in records:
+                failed = failed or bool(record["errors"])
+                args.output.write(json.dumps(record) + "\n")
+            args.output.flush()
+    return 1 if failed else 0
 
-# Print converted Khulnasoft rule using the `convert_rule` method from the `khulnasoft_backend` from sigma rule reflected in
-# the `sigma_rules_to_convert` list.
-# To convert to a Khulnasoft Cloud SIEM rule, use the "siem_rule" output format
-# To convert a Sigma Rule into a Khulnasoft Query, use the "default" output format.
 
-for sigma_rule in sigma_rule_collection.rules:
-    print(sigma_rule.title + " conversion:")
-    print(khulnasoft_backend.convert_rule(sigma_rule, "siem_rule")[0])
-    print("/n")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Run converted Sigma rules against local event files without a Khulnasoft instance.
+
+The rules are converted into plain SPL queries that are executed by the local search engine on
+events from JSON Lines or CSV files. One JSON object is written per line and query with the number
+of result rows, the share of the events they make up and the row counts and times of each command:
+
+    python scripts/local_pysigma_khulnasoft_search.py -p khulnasoft_windows -e events.jsonl sigma/rules
+
+Correlation rules are converted together with the rules contained in the same file. Rule
+references across files are not resolved.
+
+With --columnar, the rules are converted into columnar matchers instead, which evaluate all
+events at once and are much faster for pre-screening rules against large event archives. Only
+the number of matches and the selectivity are reported and correlation rules are not supported.
+"""
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from sigma.collection import SigmaCollection
+from sigma.exceptions import SigmaError
+from sigma.rule import SigmaRule
+
+from sigma.backends.khulnasoft import KhulnasoftBackend
+from sigma.backends.khulnasoft.columnar import ColumnarBatch
+from sigma.backends.khulnasoft.engine import KhulnasoftSearchEngine
+from sigma.pipelines.khulnasoft import pipelines
+
+
+def search_file(
+    backend: KhulnasoftBackend,
+    engine: KhulnasoftSearchEngine,
+    path: Path,
+    results: bool,
+) -> Iterator[Dict[str, Any]]:
+    """Convert all rules contained in a rule file and run their queries."""
+    try:
+        with path.open(encoding="utf-8") as f:
+            rule_collection = SigmaCollection.from_yaml(f)
+        rule_collection.resolve_rule_references()
+    except SigmaError as e:
+        yield {"path": str(path), "errors": [str(e)]}
+        return
+
+    for rule in rule_collection.rules:
+        record = {
+            "path": str(path),
+            "id": str(rule.id) if rule.id else None,
+            "title": rule.title,
+            "searches": [],
+            "errors": [],
+        }
+        start = time.perf_counter()
+        try:
+            queries = (
+                backend.convert_rule(rule)
+                if isinstance(rule, SigmaRule)
+                else backend.convert_correlation_rule(rule)
+            )
+            record["conversion_time"] = time.perf_counter() - start
+            for query in queries:
+                result = engine.search(query)
+                search = {
+                    "query": query,
+                    "matches": len(result.rows),
+                    "selectivity": (
+                        len(result.rows) / len(engine.events) if engine.events else 0.0
+                    ),
+                    "time": result.seconds,
+                    "stages": [asdict(stage) for stage in result.stages],
+                }
+                if results:
+                    search["results"] = result.rows
+                record["searches"].append(search)
+        except SigmaError as e:
+            record["errors"].append(str(e))
+        yield record
+
+
+def prescreen_file(
+    backend: KhulnasoftBackend, batch: ColumnarBatch, path: Path
+) -> Iterator[Dict[str, Any]]:
+    """Convert all rules contained in a rule file into columnar matchers and match the batch."""
+    try:
+        with path.open(encoding="utf-8") as f:
+            rule_collection = SigmaCollection.from_yaml(f)
+        rule_collection.resolve_rule_references()
+    except SigmaError as e:
+        yield {"path": str(path), "errors": [str(e)]}
+        return
+
+    for rule in rule_collection.rules:
+        record = {
+            "path": str(path),
+            "id": str(rule.id) if rule.id else None,
+            "title": rule.title,
+            "searches": [],
+            "errors": [],
+        }
+        try:
+            matchers = (
+                backend.convert_rule(rule, "columnar")
+                if isinstance(rule, SigmaRule)
+                else backend.convert_correlation_rule(rule, "columnar")
+            )
+            for matcher in matchers:
+                start = time.perf_counter()
+                matches = batch.count(matcher.match(batch))
+                record["searches"].append(
+                    {
+                        "matches": matches,
+                        "selectivity": matches / batch.size if batch.size else 0.0,
+                        "time": time.perf_counter() - start,
+                    }
+                )
+        except SigmaError as e:
+            record["errors"].append(str(e))
+        yield record
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Run converted Sigma rules against local JSON Lines or CSV event files."
+    )
+    parser.add_argument(
+        "rules", nargs="+", type=Path, help="Sigma rule files or directories"
+    )
+    parser.add_argument(
+        "-e",
+        "--events",
+        action="append",
+        type=Path,
+        required=True,
+        help="JSON Lines or CSV (.csv) event file, can be given multiple times",
+    )
+    parser.add_argument(
+        "-p",
+        "--pipeline",
+        action="append",
+        choices=pipelines.keys(),
+        default=[],
+        help="Processing pipeline, can be given multiple times",
+    )
+    parser.add_argument(
+        "-r",
+        "--results",
+        action="store_true",
+        help="Include the result rows of each query",
+    )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="Match columnar matchers instead of running SPL queries",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=argparse.FileType("w", encoding="utf-8"),
+        default=sys.stdout,
+        help="Output file (default: stdout)",
+    )
+    args = parser.parse_args(argv)
+
+    backend = KhulnasoftBackend(
+        processing_pipeline=(
+            sum(pipelines[name]() for name in args.pipeline) if args.pipeline else None
+        )
+    )
+    try:
+        if args.columnar:
+            batch = ColumnarBatch.from_files(args.events)
+        else:
+            engine = KhulnasoftSearchEngine.from_files(args.events)
+    except (OSError, SigmaError) as e:
+        parser.error(str(e))
+
+    failed = False
+    for path in sorted(SigmaCollection.resolve_paths(args.rules)):
+        records = (
+            prescreen_file(backend, batch, path)
+            if args.columnar
+            else search_file(backend, engine, path, args.results)
+        )
+        for record in records:
+            failed = failed or bool(record["errors"])
+            args.output.write(json.dumps(record, default=str) + "\n")
+        args.output.flush()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Watch Sigma rule directories and keep a savedsearches.conf up to date.
+
+Only rule files that were added, changed or removed are converted and their stanzas are spliced
+into the existing savedsearches.conf, including its [default] stanza:
+
+    python scripts/local_pysigma_khulnasoft_watch.py -p khulnasoft_windows -o savedsearches.conf sigma/rules
+"""
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from sigma.backends.khulnasoft import KhulnasoftBackend
+from sigma.backends.khulnasoft.savedsearches import SavedSearchesWatcher
+from sigma.pipelines.khulnasoft import pipelines
+
+logger = logging.getLogger("khulnasoft_watch")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Incrementally update a savedsearches.conf from changed Sigma rules."
+    )
+    parser.add_argument(
+        "rules", nargs="+", type=Path, help="Sigma rule files or directories"
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, required=True, help="savedsearches.conf file"
+    )
+    parser.add_argument(
+        "-p",
+        "--pipeline",
+        action="append",
+        choices=pipelines.keys(),
+        default=[],
+        help="Processing pipeline, can be given multiple times",
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=1.0,
+        help="Seconds between checks for rule changes",
+    )
+    parser.add_argument(
+        "-c", "--cache-dir", type=Path, help="Directory of the query cache"
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Update savedsearches.conf once and exit",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    watcher = SavedSearchesWatcher(
+        KhulnasoftBackend(
+            processing_pipeline=(
+                sum(pipelines[name]() for name in args.pipeline)
+                if args.pipeline
+                else None
+            ),
+            cache_dir=args.cache_dir,
+        ),
+        args.rules,
+        args.output,
+    )
+    reported_errors = {}
+    while True:
+        start = time.perf_counter()
+        changes = watcher.poll()
+        if any(changes.values()):
+            logger.info(
+                "%d added, %d changed, %d removed rule files in %.3fs",
+                len(changes["added"]),
+                len(changes["changed"]),
+                len(changes["removed"]),
+                time.perf_counter() - start,
+            )
+        for path, error in watcher.errors.items():
+            if reported_errors.get(path) is not error:
+                logger.error("%s: %s", path, error)
+        reported_errors = dict(watcher.errors)
+        if args.once:
+            return 1 if watcher.errors else 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
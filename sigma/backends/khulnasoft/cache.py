@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, List, Optional, Union
+
+from sigma.rule import SigmaRule
+import sigma
+
+
+def _package_version(package: str) -> str:
+    # importlib.metadata is slow to import and only needed once a cache is created.
+    from importlib.metadata import version, PackageNotFoundError
+
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return ""
+
+
+class KhulnasoftQueryCache:
+    """
+    Content-addressed on-disk cache of converted queries.
+
+    Each entry is stored as JSON file named by the SHA-256 hash of everything that influences the
+    conversion result: the normalized rule, the resolved processing pipeline, the backend options,
+    the output format and the pySigma and backend versions. The cache directory is bounded to
+    max_size bytes, least recently used entries are evicted first. Multiple processes can share a
+    cache directory, entries evicted by another process are treated as cache misses.
+    """
+
+    cache_format_version = 1
+    # AddConditionTransformation generates random detection names that don't influence the query.
+    volatile_repr = re.compile(r"name='_cond_\w+'|\bat 0x[0-9a-f]+")
+
+    def __init__(self, directory: Union[str, Path], max_size: int = 256 * 1024**2):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = int(max_size)
+        self.lock = threading.Lock()
+        self.versions = [
+            self.cache_format_version,
+            _package_version("pysigma"),
+            _package_version("pysigma-backend-khulnasoft"),
+        ]
+
+        # Entries ordered from least to most recently used with their file sizes.
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.size = 0
+        for path, stat in sorted(
+            ((path, path.stat()) for path in self.directory.glob("*.json")),
+            key=lambda entry: entry[1].st_mtime,
+        ):
+            self.entries[path.stem] = stat.st_size
+            self.size += stat.st_size
+
+    def key(
+        self,
+        rule: SigmaRule,
+        pipeline: "sigma.processing.pipeline.ProcessingPipeline",
+        options: Any,
+        output_format: str,
+    ) -> str:
+        """Calculate the cache key of a rule before the processing pipeline was applied to it."""
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    self.versions,
+                    rule.to_dict(),
+                    self.volatile_repr.sub("", repr(pipeline)),
+                    options,
+                    output_format,
+                ],
+                sort_keys=True,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / (key + ".json")
+
+    def get(self, key: str) -> Optional[List[Any]]:
+        """Return cached conversion result or None if it is not contained in the cache."""
+        path = self.path(key)
+        try:
+            with path.open(encoding="utf-8") as f:
+                queries = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.size -= self.entries.pop(key, 0)
+            return None
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        return queries
+
+    def put(self, key: str, queries: List[Any]) -> None:
+        """Store conversion result. Results that can't be represented as JSON are not cached."""
+        try:
+            content = json.dumps(queries).encode("utf-8")
+        except (TypeError, ValueError):
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, self.path(key))
+
+        with self.lock:
+            self.size += len(content) - self.entries.pop(key, 0)
+            self.entries[key] = len(content)
+            while self.size > self.max_size and len(self.entries) > 1:
+                evicted, size = self.entries.popitem(last=False)
+                self.size -= size
+                try:
+                    self.path(evicted).unlink()
+                except FileNotFoundError:
+                    pass
+
+    def clear(self) -> None:
+        with self.lock:
+            for key in self.entries:
+                try:
+                    self.path(key).unlink()
+                except FileNotFoundError:
+                    pass
+            self.entries.clear()
+            self.size = 0
@@ -0,0 +1,317 @@
+import re
+from dataclasses import dataclass
+from ipaddress import ip_address
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from sigma.conditions import (
+    ConditionAND,
+    ConditionFieldEqualsValueExpression,
+    ConditionItem,
+    ConditionNOT,
+    ConditionOR,
+    ConditionValueExpression,
+)
+from sigma.exceptions import SigmaFeatureNotSupportedByBackendError
+from sigma.rule import SigmaRule
+from sigma.types import (
+    SigmaBool,
+    SigmaCIDRExpression,
+    SigmaCompareExpression,
+    SigmaNull,
+    SigmaNumber,
+    SigmaRegularExpression,
+    SigmaString,
+    SpecialChars,
+)
+
+from sigma.backends.khulnasoft.events import (
+    load_events,
+    normalize_event,
+    number,
+    text,
+    values,
+)
+
+Selector = Callable[["ColumnarBatch"], int]
+
+compare_functions: Dict[SigmaCompareExpression.CompareOperators, Callable] = {
+    SigmaCompareExpression.CompareOperators.LT: lambda a, b: a < b,
+    SigmaCompareExpression.CompareOperators.LTE: lambda a, b: a <= b,
+    SigmaCompareExpression.CompareOperators.GT: lambda a, b: a > b,
+    SigmaCompareExpression.CompareOperators.GTE: lambda a, b: a >= b,
+}
+
+
+class ColumnarBatch:
+    """
+    Batch of events stored column by column. Each column maps the distinct values of a field to the
+    positions of the events containing them. Predicates are evaluated once per distinct value and
+    their results are bitmasks with one bit per event (Python integers), which are combined by the
+    condition operators at once for the whole batch.
+    """
+
+    def __init__(self, events: Iterable[Dict[str, Any]]):
+        self.columns: Dict[str, Dict[str, List[int]]] = {}
+        self.size = 0
+        for position, event in enumerate(events):
+            for name, value in event.items():
+                # Plain string values are the common case and don't need normalization.
+                if type(value) is str and name != "_time":
+                    if value:
+                        self.add(name, value, position)
+                    continue
+                for normalized_name, normalized in normalize_event(
+                    {name: value}
+                ).items():
+                    for v in values(normalized):
+                        self.add(normalized_name, text(v), position)
+            self.size = position + 1
+        self.all = (1 << self.size) - 1
+        self.folded_columns: Dict[str, Dict[str, List[List[int]]]] = {}
+        self.present_masks: Dict[str, int] = {}
+
+    def add(self, field: str, value: str, position: int) -> None:
+        column = self.columns.get(field)
+        if column is None:
+            column = self.columns[field] = {}
+        positions = column.get(value)
+        if positions is None:
+            column[value] = [position]
+        else:
+            positions.append(position)
+
+    @classmethod
+    def from_files(cls, paths: Iterable[Union[str, Path]]) -> "ColumnarBatch":
+        return cls(event for path in paths for event in load_events(path))
+
+    def mask(self, positions: Iterable[List[int]]) -> int:
+        bits = bytearray((self.size + 7) // 8)
+        for value_positions in positions:
+            for position in value_positions:
+                bits[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(bits, "little")
+
+    def select(self, field: str, predicate: Callable[[str], bool]) -> int:
+        """Events with a value of the field that fulfills the predicate."""
+        return self.mask(
+            positions
+            for value, positions in self.columns.get(field, {}).items()
+            if predicate(value)
+        )
+
+    def lookup(self, field: str, folded_values: Iterable[str]) -> int:
+        """Events with one of the given casefolded values in the field."""
+        folded_column = self.folded_columns.get(field)
+        if folded_column is None:
+            folded_column = self.folded_columns[field] = {}
+            for value, positions in self.columns.get(field, {}).items():
+                folded_column.setdefault(value.casefold(), []).append(positions)
+        return self.mask(
+            positions
+            for value in folded_values
+            for positions in folded_column.get(value, [])
+        )
+
+    def present(self, field: str) -> int:
+        """Events containing the field."""
+        if field not in self.present_masks:
+            self.present_masks[field] = self.mask(self.columns.get(field, {}).values())
+        return self.present_masks[field]
+
+    def keyword_fields(self) -> List[str]:
+        """Fields searched by keywords: _raw if the events contain it, else all fields."""
+        return ["_raw"] if "_raw" in self.columns else list(self.columns)
+
+    @staticmethod
+    def positions(mask: int) -> List[int]:
+        return [i for i, bit in enumerate(reversed(bin(mask)[2:])) if bit == "1"]
+
+    @staticmethod
+    def count(mask: int) -> int:
+        return bin(mask).count("1")
+
+
+def string_pattern(value: SigmaString) -> Optional[str]:
+    """
+    Regular expression of a string value with wildcards or None for plain strings. Single
+    character wildcards match any number of characters like in the generated SPL.
+    """
+    if not value.contains_special():
+        return None
+    return "".join(
+        ".*" if isinstance(part, SpecialChars) else re.escape(part) for part in value.s
+    )
+
+
+def string_selector(field: str, string_values: List[SigmaString]) -> Selector:
+    """
+    Case-insensitive match of a field against a set of string values. Plain strings are looked up
+    in the casefolded column, values with wildcards are combined into one regular expression.
+    """
+    literals = set()
+    patterns = []
+    for value in string_values:
+        pattern = string_pattern(value)
+        if pattern is None:
+            literals.add(str(value).casefold())
+        else:
+            patterns.append(pattern)
+    regex = (
+        re.compile("|".join(patterns), re.IGNORECASE | re.DOTALL) if patterns else None
+    )
+
+    def select(batch: ColumnarBatch) -> int:
+        mask = batch.lookup(field, literals) if literals else 0
+        if regex is not None:
+            mask |= batch.select(field, lambda v: regex.fullmatch(v) is not None)
+        return mask
+
+    return select
+
+
+def keyword_selector(value: Any) -> Selector:
+    if isinstance(value, SigmaRegularExpression):
+        regex = re.compile(value.regexp, regex_flags(value))
+        predicate = lambda v: regex.search(v) is not None
+    elif isinstance(value, (SigmaString, SigmaNumber)):
+        keyword = str(value)
+        if isinstance(value, SigmaString) and value.contains_special():
+            keyword = string_pattern(value)
+        else:
+            keyword = re.escape(keyword)
+        regex = re.compile(keyword, re.IGNORECASE | re.DOTALL)
+        predicate = lambda v: regex.search(v) is not None
+    else:
+        raise SigmaFeatureNotSupportedByBackendError(
+            f"Keyword values of type {type(value).__name__} are not supported by the columnar output format"
+        )
+
+    def select(batch: ColumnarBatch) -> int:
+        mask = 0
+        for field in batch.keyword_fields():
+            mask |= batch.select(field, predicate)
+        return mask
+
+    return select
+
+
+def regex_flags(value: SigmaRegularExpression) -> int:
+    flags = 0
+    for flag in value.flags:
+        flags |= value.sigma_to_python_flags[flag]
+    return flags
+
+
+def field_selector(field: str, value: Any) -> Selector:
+    if isinstance(value, SigmaString):
+        return string_selector(field, [value])
+    if isinstance(value, SigmaNumber):
+        expected = value.number
+        return lambda batch: batch.select(field, lambda v: number(v) == expected)
+    if isinstance(value, SigmaBool):
+        return lambda batch: batch.lookup(field, [text(value.boolean)])
+    if isinstance(value, SigmaRegularExpression):
+        regex = re.compile(value.regexp, regex_flags(value))
+        return lambda batch: batch.select(field, lambda v: regex.search(v) is not None)
+    if isinstance(value, SigmaCIDRExpression):
+        network = value.network
+
+        def in_network(v: str) -> bool:
+            try:
+                return ip_address(v) in network
+            except ValueError:
+                return False
+
+        return lambda batch: batch.select(field, in_network)
+    if isinstance(value, SigmaCompareExpression):
+        compare = compare_functions[value.op]
+        expected = value.number.number
+        return lambda batch: batch.select(
+            field, lambda v: number(v) is not None and compare(number(v), expected)
+        )
+    if isinstance(value, SigmaNull):
+        return lambda batch: batch.all ^ batch.present(field)
+    raise SigmaFeatureNotSupportedByBackendError(
+        f"Values of type {type(value).__name__} are not supported by the columnar output format"
+    )
+
+
+def compile_condition(cond: ConditionItem) -> Selector:
+    """Compile a condition tree into a function that selects the matching events of a batch."""
+    if isinstance(cond, ConditionOR):
+        # String values of the same field are matched by one lookup and regular expression.
+        string_values: Dict[str, List[SigmaString]] = {}
+        selectors = []
+        for arg in cond.args:
+            if isinstance(arg, ConditionFieldEqualsValueExpression) and isinstance(
+                arg.value, SigmaString
+            ):
+                string_values.setdefault(arg.field, []).append(arg.value)
+            else:
+                selectors.append(compile_condition(arg))
+        selectors += [
+            string_selector(field, field_values)
+            for field, field_values in string_values.items()
+        ]
+
+        def select_or(batch: ColumnarBatch) -> int:
+            mask = 0
+            for selector in selectors:
+                mask |= selector(batch)
+                if mask == batch.all:
+                    break
+            return mask
+
+        return select_or
+    if isinstance(cond, ConditionAND):
+        selectors = [compile_condition(arg) for arg in cond.args]
+
+        def select_and(batch: ColumnarBatch) -> int:
+            mask = batch.all
+            for selector in selectors:
+                mask &= selector(batch)
+                if not mask:
+                    break
+            return mask
+
+        return select_and
+    if isinstance(cond, ConditionNOT):
+        selector = compile_condition(cond.args[0])
+        return lambda batch: batch.all ^ selector(batch)
+    if isinstance(cond, ConditionFieldEqualsValueExpression):
+        return field_selector(cond.field, cond.value)
+    if isinstance(cond, ConditionValueExpression):
+        return keyword_selector(cond.value)
+    raise SigmaFeatureNotSupportedByBackendError(
+        f"Condition {type(cond).__name__} is not supported by the columnar output format"
+    )
+
+
+@dataclass
+class ColumnarMatcher:
+    """
+    Matcher of one condition of a rule generated by the columnar output format. It is compiled from
+    the condition after the processing pipeline was applied, so it expects the field names of the
+    generated queries.
+    """
+
+    title: str
+    id: Optional[str]
+    selector: Selector
+
+    @classmethod
+    def from_rule(cls, rule: SigmaRule, index: int) -> "ColumnarMatcher":
+        return cls(
+            rule.title,
+            str(rule.id) if rule.id else None,
+            compile_condition(rule.detection.parsed_condition[index].parsed),
+        )
+
+    def match(self, batch: ColumnarBatch) -> int:
+        """Bitmask of the matching events of the batch."""
+        return self.selector(batch)
+
+    def positions(self, batch: ColumnarBatch) -> List[int]:
+        """Positions of the matching events in the batch."""
+        return batch.positions(self.match(batch))
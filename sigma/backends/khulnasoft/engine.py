@@ -0,0 +1,1122 @@
+import itertools
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from ipaddress import ip_address, ip_network
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
+
+from sigma.exceptions import SigmaFeatureNotSupportedByBackendError, SigmaValueError
+
+from sigma.backends.khulnasoft.events import (
+    Event,
+    load_events,
+    normalize_event,
+    number,
+    raw_text,
+    text,
+    values,
+)
+from sigma.backends.khulnasoft.khulnasoft import KhulnasoftBackend
+
+Command = Callable[[List[Event]], List[Event]]
+Expression = Callable[[Event], Any]
+
+quoted_string = r'"(?:[^"\\]|\\.)*"'
+search_token_pattern = re.compile(
+    rf"""\s*(?:
+    (?P<string>{quoted_string})
+    |(?P<op><=|>=|!=|==|=|<|>)
+    |(?P<paren>[(),])
+    |(?P<word>(?:[^\s"()=<>!,\\]|\\.|!(?!=))+)
+    )""",
+    re.VERBOSE,
+)
+eval_token_pattern = re.compile(
+    rf"""\s*(?:
+    (?P<number>\d+(?:\.\d+)?(?![\w.]))
+    |(?P<string>{quoted_string})
+    |(?P<field>'(?:[^'\\]|\\.)*')
+    |(?P<name>[A-Za-z_]\w*)
+    |(?P<op>==|!=|<=|>=|[=<>+\-*/.(),])
+    )""",
+    re.VERBOSE,
+)
+option_pattern = re.compile(r"\s*(\w+)=([^\s\",]+|" + quoted_string + r")")
+span_pattern = re.compile(r"(\d+)(s|sec|m|min|h|hr|d|day|w|mon|y)?")
+span_seconds = {
+    None: 1,
+    "s": 1,
+    "sec": 1,
+    "m": 60,
+    "min": 60,
+    "h": 3600,
+    "hr": 3600,
+    "d": 86400,
+    "day": 86400,
+    "w": 604800,
+}
+span_months = {"mon": 1, "y": 12}
+
+
+def unquote(value: str, escaped: str = '"\\') -> str:
+    """Strip the quotes of a quoted string and resolve the escapes of the given characters."""
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        value = value[1:-1]
+        return re.sub(r"\\([" + re.escape(escaped) + "])", r"\1", value)
+    return value
+
+
+inline_flags_pattern = re.compile(r"\(\?([a-zA-Z]+(?:-[a-zA-Z]+)?|-[a-zA-Z]+)\)")
+group_opener_pattern = re.compile(
+    r"\((?:\?(?:P<\w+>|<[=!]|[:=!>]|[a-zA-Z]*(?:-[a-zA-Z]+)?:))?"
+)
+group_atom_pattern = re.compile(r"\(\?(?:P=\w+|#[^)]*)\)")
+
+
+def scope_inline_flags(
+    pattern: str, start: int = 0, top: bool = True
+) -> Tuple[str, int]:
+    """
+    Translate PCRE inline flags like (?i) that aren't at the start of the pattern into scoped
+    groups, which Python doesn't allow as global flags. In PCRE, the flags apply until the end of
+    the enclosing group including the following alternatives, so the rest of the current branch
+    and each following branch are wrapped into (?i:...). Returns the translated group body and the
+    position of its closing parenthesis.
+    """
+    result = []
+    scoped: List[str] = (
+        []
+    )  # flags of the current group that apply to the following branches
+    open_scopes = 0
+    i = start
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            result.append(pattern[i : i + 2])
+            i += 2
+        elif c == "[":
+            end = i + 1
+            if end < len(pattern) and pattern[end] == "^":
+                end += 1
+            if end < len(pattern) and pattern[end] == "]":
+                end += 1
+            while end < len(pattern) and pattern[end] != "]":
+                end += 2 if pattern[end] == "\\" else 1
+            result.append(pattern[i : end + 1])
+            i = end + 1
+        elif c == "|":
+            result.append(
+                ")" * open_scopes + "|" + "".join(f"(?{flags}:" for flags in scoped)
+            )
+            open_scopes = len(scoped)
+            i += 1
+        elif c == ")" and not top:
+            break
+        elif c == "(":
+            flags = inline_flags_pattern.match(pattern, i)
+            atom = group_atom_pattern.match(pattern, i)
+            if flags and (i > 0 or not top or "-" in flags.group(1)):
+                result.append(f"(?{flags.group(1)}:")
+                scoped.append(flags.group(1))
+                open_scopes += 1
+                i = flags.end()
+            elif flags or atom:
+                result.append((flags or atom).group(0))
+                i = (flags or atom).end()
+            else:
+                opener = group_opener_pattern.match(pattern, i).group(0)
+                body, i = scope_inline_flags(pattern, i + len(opener), False)
+                result.append(opener + body + ")")
+                i += 1
+        else:
+            result.append(c)
+            i += 1
+    return "".join(result) + ")" * open_scopes, i
+
+
+@lru_cache(maxsize=4096)
+def python_regex(pattern: str) -> Pattern:
+    """
+    Compile a PCRE pattern as used by SPL with the named group syntax and inline flags of Python.
+    """
+    translated = re.sub(r"\(\?<(?=[A-Za-z_])", "(?P<", pattern)
+    translated = re.sub(r"\\k<(\w+)>", r"(?P=\1)", translated)
+    if inline_flags_pattern.search(translated, 1):
+        translated = scope_inline_flags(translated)[0]
+    try:
+        return re.compile(translated)
+    except re.error as e:
+        raise SigmaValueError(f"Invalid regular expression '{pattern}': {e}")
+
+
+@lru_cache(maxsize=4096)
+def value_matcher(value: str) -> Callable[[str], bool]:
+    """
+    Case-insensitive matcher of a search value with unescaped * as wildcard. Backslashes escape
+    backslashes, quotes and asterisks.
+    """
+    parts = [""]
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c == "\\" and i + 1 < len(value) and value[i + 1] in '\\"*':
+            parts[-1] += value[i + 1]
+            i += 2
+            continue
+        if c == "*":
+            parts.append("")
+        else:
+            parts[-1] += c
+        i += 1
+    if len(parts) == 1:
+        literal = parts[0].casefold()
+        return lambda v: v.casefold() == literal
+    pattern = re.compile(
+        ".*".join(re.escape(part) for part in parts), re.IGNORECASE | re.DOTALL
+    )
+    return lambda v: pattern.fullmatch(v) is not None
+
+
+def compare(left: Any, operator: str, right: Any) -> bool:
+    """Compare numerically if both values are numbers, else as text."""
+    left_number, right_number = number(left), number(right)
+    if left_number is not None and right_number is not None:
+        left, right = left_number, right_number
+    else:
+        left, right = text(left), text(right)
+    if operator in ("=", "=="):
+        return left == right
+    if operator == "!=":
+        return left != right
+    if operator == "<":
+        return left < right
+    if operator == "<=":
+        return left <= right
+    if operator == ">":
+        return left > right
+    return left >= right
+
+
+def cidrmatch(network: Any, address: Any) -> bool:
+    try:
+        network = ip_network(text(network), strict=False)
+    except ValueError:
+        return False
+    for value in values(address):
+        try:
+            if ip_address(text(value)) in network:
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def match_regex(value: Any, pattern: Any) -> Optional[bool]:
+    if value is None:
+        return None
+    regex = python_regex(text(pattern))
+    return any(regex.search(text(v)) for v in values(value))
+
+
+def like(value: Any, pattern: Any) -> Optional[bool]:
+    if value is None:
+        return None
+    regex = re.compile(
+        "".join(
+            ".*" if c == "%" else "." if c == "_" else re.escape(c)
+            for c in text(pattern)
+        ),
+        re.DOTALL,
+    )
+    return any(regex.fullmatch(text(v)) for v in values(value))
+
+
+def mvappend(*args: Any) -> Optional[List[Any]]:
+    appended = [v for arg in args for v in values(arg)]
+    return appended or None
+
+
+def tonumber(value: Any) -> Optional[float]:
+    return None if value is None else number(value)
+
+
+eval_functions: Dict[str, Callable[..., Any]] = {
+    "if": lambda condition, then, otherwise: then if condition is True else otherwise,
+    "isnull": lambda value: value is None,
+    "isnotnull": lambda value: value is not None,
+    "null": lambda: None,
+    "true": lambda: True,
+    "false": lambda: False,
+    "cidrmatch": cidrmatch,
+    "match": match_regex,
+    "like": like,
+    "mvcount": lambda value: None if value is None else len(values(value)),
+    "mvappend": mvappend,
+    "coalesce": lambda *args: next((arg for arg in args if arg is not None), None),
+    "lower": lambda value: None if value is None else text(value).lower(),
+    "upper": lambda value: None if value is None else text(value).upper(),
+    "len": lambda value: None if value is None else len(text(value)),
+    "tostring": lambda value: None if value is None else text(value),
+    "tonumber": tonumber,
+}
+
+
+def aggregate_values(
+    function: str, rows_values: Optional[List[List[Any]]], rows: int
+) -> Any:
+    """Aggregate the values of the rows of a group. count without argument counts rows."""
+    if rows_values is None:
+        return rows
+    flat = [v for row_values in rows_values for v in row_values]
+    if function == "count":
+        return len(flat)
+    if function == "dc":
+        return len({text(v) for v in flat})
+    if function in ("values", "list"):
+        texts = [text(v) for v in flat]
+        return sorted(set(texts)) if function == "values" else texts
+    if not flat:
+        return None
+    numbers = [number(v) for v in flat]
+    if function in ("sum", "avg"):
+        total = sum(n for n in numbers if n is not None)
+        return total if function == "sum" else total / len(flat)
+    if all(n is not None for n in numbers):
+        flat = numbers
+    else:
+        flat = [text(v) for v in flat]
+    if function == "min":
+        return min(flat)
+    if function == "max":
+        return max(flat)
+    raise SigmaFeatureNotSupportedByBackendError(
+        f"Aggregation function {function} is not supported by the local search engine"
+    )
+
+
+class ExpressionParser:
+    """Recursive descent parser of the expressions of eval and where commands into closures."""
+
+    precedence: ClassVar[List[Tuple[str, ...]]] = [("+", "-", "."), ("*", "/")]
+    comparisons: ClassVar[Tuple[str, ...]] = ("=", "==", "!=", "<", "<=", ">", ">=")
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens: List[Tuple[str, str]] = []
+        position = 0
+        while expression[position:].strip():
+            token = eval_token_pattern.match(expression, position)
+            if token is None:
+                raise SigmaValueError(
+                    f"Unexpected character in expression '{expression}' at position {position}"
+                )
+            self.tokens.append((token.lastgroup, token.group(token.lastgroup)))
+            position = token.end()
+        self.position = 0
+
+    def peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        if self.position + offset < len(self.tokens):
+            return self.tokens[self.position + offset]
+        return None, None
+
+    def next(self) -> Tuple[Optional[str], Optional[str]]:
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def expect(self, value: str) -> None:
+        if self.next()[1] != value:
+            raise SigmaValueError(
+                f"Expected '{value}' in expression '{self.expression}'"
+            )
+
+    def keyword(self, keyword: str) -> bool:
+        kind, value = self.peek()
+        if kind == "name" and value.upper() == keyword:
+            self.position += 1
+            return True
+        return False
+
+    def parse(self) -> Expression:
+        expression = self.parse_or()
+        if self.position < len(self.tokens):
+            raise SigmaValueError(
+                f"Unexpected '{self.peek()[1]}' in expression '{self.expression}'"
+            )
+        return expression
+
+    def parse_assignment(self) -> Tuple[str, Expression]:
+        """Parse field=expression and skip the comma separating it from the next assignment."""
+        kind, name = self.next()
+        if kind not in ("name", "field"):
+            raise SigmaValueError(f"Expected field name in '{self.expression}'")
+        self.expect("=")
+        expression = self.parse_or()
+        if self.peek()[1] == ",":
+            self.position += 1
+        return unquote(name, "'\\"), expression
+
+    def parse_or(self) -> Expression:
+        operands = [self.parse_and()]
+        while self.keyword("OR"):
+            operands.append(self.parse_and())
+        if len(operands) == 1:
+            return operands[0]
+
+        def evaluate(event: Event) -> Optional[bool]:
+            results = [operand(event) for operand in operands]
+            if True in results:
+                return True
+            return None if None in results else False
+
+        return evaluate
+
+    def parse_and(self) -> Expression:
+        operands = [self.parse_not()]
+        while self.keyword("AND"):
+            operands.append(self.parse_not())
+        if len(operands) == 1:
+            return operands[0]
+
+        def evaluate(event: Event) -> Optional[bool]:
+            results = [operand(event) for operand in operands]
+            if False in results:
+                return False
+            return None if None in results else True
+
+        return evaluate
+
+    def parse_not(self) -> Expression:
+        if self.keyword("NOT"):
+            operand = self.parse_not()
+
+            def evaluate(event: Event) -> Optional[bool]:
+                result = operand(event)
+                return None if result is None else not result
+
+            return evaluate
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> Expression:
+        left = self.parse_binary(0)
+        kind, operator = self.peek()
+        if kind != "op" or operator not in self.comparisons:
+            return left
+        self.position += 1
+        right = self.parse_binary(0)
+
+        def evaluate(event: Event) -> Optional[bool]:
+            left_value, right_value = left(event), right(event)
+            if left_value is None or right_value is None:
+                return None
+            return any(
+                compare(l, operator, r)
+                for l in values(left_value)
+                for r in values(right_value)
+            )
+
+        return evaluate
+
+    def parse_binary(self, level: int) -> Expression:
+        if level == len(self.precedence):
+            return self.parse_unary()
+        left = self.parse_binary(level + 1)
+        while self.peek() in (("op", operator) for operator in self.precedence[level]):
+            operator = self.next()[1]
+            left = self.binary(operator, left, self.parse_binary(level + 1))
+        return left
+
+    @staticmethod
+    def binary(operator: str, left: Expression, right: Expression) -> Expression:
+        def evaluate(event: Event) -> Any:
+            left_value, right_value = left(event), right(event)
+            if left_value is None or right_value is None:
+                return None
+            if operator == ".":
+                return text(left_value) + text(right_value)
+            left_number, right_number = number(left_value), number(right_value)
+            if left_number is None or right_number is None:
+                if operator == "+":
+                    return text(left_value) + text(right_value)
+                return None
+            if operator == "+":
+                return left_number + right_number
+            if operator == "-":
+                return left_number - right_number
+            if operator == "*":
+                return left_number * right_number
+            return left_number / right_number if right_number else None
+
+        return evaluate
+
+    def parse_unary(self) -> Expression:
+        if self.peek() == ("op", "-"):
+            self.position += 1
+            operand = self.parse_unary()
+
+            def evaluate(event: Event) -> Optional[float]:
+                value = number(operand(event))
+                return None if value is None else -value
+
+            return evaluate
+        return self.parse_primary()
+
+    def parse_primary(self) -> Expression:
+        kind, value = self.next()
+        if kind == "number":
+            constant = number(value)
+            return lambda event: constant
+        if kind == "string":
+            constant = unquote(value)
+            return lambda event: constant
+        if kind == "field":
+            name = unquote(value, "'\\")
+            return lambda event: event.get(name)
+        if kind == "name" and self.peek() == ("op", "("):
+            return self.parse_function(value)
+        if kind == "name":
+            return lambda event: event.get(value)
+        if (kind, value) == ("op", "("):
+            expression = self.parse_or()
+            self.expect(")")
+            return expression
+        raise SigmaValueError(f"Unexpected '{value}' in expression '{self.expression}'")
+
+    def parse_function(self, name: str) -> Expression:
+        function = eval_functions.get(name.lower())
+        if function is None:
+            raise SigmaFeatureNotSupportedByBackendError(
+                f"Eval function {name} is not supported by the local search engine"
+            )
+        self.expect("(")
+        args = []
+        while self.peek()[1] != ")":
+            args.append(self.parse_or())
+            if self.peek()[1] == ",":
+                self.position += 1
+        self.expect(")")
+        return lambda event: function(*(arg(event) for arg in args))
+
+
+class SearchParser:
+    """
+    Parser of the search language into a predicate on events. OR binds stronger than the implicit
+    AND, like in the queries generated by the backend.
+    """
+
+    def __init__(self, search: str):
+        self.search = search
+        self.tokens: List[Tuple[str, str]] = []
+        position = 0
+        while search[position:].strip():
+            token = search_token_pattern.match(search, position)
+            if token is None:
+                raise SigmaValueError(
+                    f"Unexpected character in search '{search}' at position {position}"
+                )
+            self.tokens.append((token.lastgroup, token.group(token.lastgroup)))
+            position = token.end()
+        self.position = 0
+
+    def peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        if self.position + offset < len(self.tokens):
+            return self.tokens[self.position + offset]
+        return None, None
+
+    def next(self) -> Tuple[Optional[str], Optional[str]]:
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self) -> Callable[[Event], bool]:
+        predicate = self.parse_and()
+        if self.position < len(self.tokens):
+            raise SigmaValueError(
+                f"Unexpected '{self.peek()[1]}' in search '{self.search}'"
+            )
+        return predicate
+
+    def parse_and(self) -> Callable[[Event], bool]:
+        operands = []
+        while self.peek()[0] is not None and self.peek() != ("paren", ")"):
+            if self.peek() == ("word", "AND"):
+                self.position += 1
+                continue
+            operands.append(self.parse_or())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda event: all(operand(event) for operand in operands)
+
+    def parse_or(self) -> Callable[[Event], bool]:
+        operands = [self.parse_not()]
+        while self.peek() == ("word", "OR"):
+            self.position += 1
+            operands.append(self.parse_not())
+        if len(operands) == 1:
+            return operands[0]
+        return lambda event: any(operand(event) for operand in operands)
+
+    def parse_not(self) -> Callable[[Event], bool]:
+        if self.peek() == ("word", "NOT"):
+            self.position += 1
+            operand = self.parse_not()
+            return lambda event: not operand(event)
+        return self.parse_term()
+
+    def parse_value(self) -> str:
+        kind, value = self.next()
+        if kind == "string":
+            return value[1:-1]
+        if kind == "word":
+            return value
+        raise SigmaValueError(f"Expected value in search '{self.search}'")
+
+    def parse_term(self) -> Callable[[Event], bool]:
+        kind, value = self.next()
+        if (kind, value) == ("paren", "("):
+            predicate = self.parse_and()
+            if self.next() != ("paren", ")"):
+                raise SigmaValueError(
+                    f"Unbalanced parentheses in search '{self.search}'"
+                )
+            return predicate
+        if kind not in ("word", "string"):
+            raise SigmaValueError(f"Unexpected '{value}' in search '{self.search}'")
+
+        name = unquote(value)
+        next_kind, next_value = self.peek()
+        if next_kind == "op":
+            self.position += 1
+            return self.field_predicate(name, next_value, [self.parse_value()])
+        if (
+            kind == "word"
+            and next_kind == "word"
+            and next_value.upper() == "IN"
+            and self.peek(1) == ("paren", "(")
+        ):
+            self.position += 2
+            in_values = []
+            while self.peek() != ("paren", ")"):
+                if self.peek()[0] is None:
+                    raise SigmaValueError(
+                        f"Unterminated IN list in search '{self.search}'"
+                    )
+                if self.peek() == ("paren", ","):
+                    self.position += 1
+                    continue
+                in_values.append(self.parse_value())
+            self.position += 1
+            return self.field_predicate(name, "=", in_values)
+        if kind == "word" and value.upper() in ("TERM", "CASE") and next_value == "(":
+            self.position += 1
+            keyword = self.parse_value()
+            if self.next() != ("paren", ")"):
+                raise SigmaValueError(
+                    f"Unbalanced parentheses in search '{self.search}'"
+                )
+            return self.keyword_predicate(keyword)
+        return self.keyword_predicate(value if kind == "word" else value[1:-1])
+
+    @staticmethod
+    def keyword_predicate(keyword: str) -> Callable[[Event], bool]:
+        if keyword == "*":
+            return lambda event: True
+        matcher = value_matcher("*" + keyword + "*")
+        return lambda event: matcher(raw_text(event))
+
+    @staticmethod
+    def field_predicate(
+        name: str, operator: str, field_values: List[str]
+    ) -> Callable[[Event], bool]:
+        """
+        Field comparison. field!=value is the negation of field=value and therefore also matches
+        events without the field, which is what the backend expects from its field!=* null check.
+        """
+        if operator in ("=", "==", "!="):
+            matchers = [value_matcher(value) for value in field_values]
+            literals = [unquote('"' + value + '"') for value in field_values]
+
+            def equals(event: Event) -> bool:
+                for event_value in values(event.get(name)):
+                    event_text = text(event_value)
+                    if any(matcher(event_text) for matcher in matchers):
+                        return True
+                    if isinstance(event_value, (int, float)) and any(
+                        number(literal) == event_value for literal in literals
+                    ):
+                        return True
+                return False
+
+            if operator == "!=":
+                return lambda event: not equals(event)
+            return equals
+
+        literal = unquote('"' + field_values[0] + '"')
+        return lambda event: any(
+            compare(event_value, operator, literal)
+            for event_value in values(event.get(name))
+        )
+
+
+def split_arguments(arguments: str) -> List[str]:
+    return [argument for argument in re.split(r"[\s,]+", arguments) if argument]
+
+
+def balanced_end(text: str, start: int, opening: str, closing: str) -> int:
+    """Position after the bracket closing the one at start, ignoring brackets in quoted strings."""
+    depth = 0
+    quoted = False
+    escaped = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if escaped:
+            escaped = False
+        elif c == "\\":
+            escaped = True
+        elif c == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif c == opening:
+            depth += 1
+        elif c == closing:
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    raise SigmaValueError(f"Unbalanced '{opening}' in '{text}'")
+
+
+@dataclass
+class Aggregation:
+    """Aggregation function of stats, eventstats and streamstats with its argument and result name."""
+
+    function: str
+    name: str
+    argument: Optional[Expression] = None
+
+    def __call__(self, rows: List[Event]) -> Any:
+        if self.argument is None:
+            return aggregate_values(self.function, None, len(rows))
+        return aggregate_values(
+            self.function, [values(self.argument(row)) for row in rows], len(rows)
+        )
+
+
+def parse_aggregations(
+    arguments: str,
+) -> Tuple[Dict[str, str], List[Aggregation], List[str]]:
+    """Split the arguments of a stats command into options, aggregations and group-by fields."""
+    options = {}
+    aggregations = []
+    group_by: List[str] = []
+    position = 0
+    while position < len(arguments):
+        rest = arguments[position:]
+        if not rest.strip(" \t\n,"):
+            break
+        if rest.strip(" \t\n,") != rest:
+            position += len(rest) - len(rest.lstrip(" \t\n,"))
+            continue
+        by = re.match(r"by\s", rest, re.IGNORECASE)
+        if by:
+            group_by = split_arguments(rest[by.end() :])
+            break
+        option = option_pattern.match(rest)
+        if option:
+            options[option.group(1)] = unquote(option.group(2))
+            position += option.end()
+            continue
+        function = re.match(r"\w+", rest)
+        if function is None:
+            raise SigmaValueError(f"Invalid aggregation in '{arguments}'")
+        end = function.end()
+        argument = None
+        if rest[end : end + 1] == "(":
+            end = balanced_end(rest, end, "(", ")")
+            argument_text = rest[function.end() + 1 : end - 1].strip()
+            eval_argument = re.fullmatch(r"eval\((.*)\)", argument_text, re.DOTALL)
+            if eval_argument:
+                argument = ExpressionParser(eval_argument.group(1)).parse()
+            else:
+                field_name = unquote(argument_text)
+                argument = lambda event, field_name=field_name: event.get(field_name)
+        alias = re.match(r"\s+as\s+(\"[^\"]*\"|[^\s,]+)", rest[end:], re.IGNORECASE)
+        name = unquote(alias.group(1)) if alias else rest[:end]
+        if alias:
+            end += alias.end()
+        aggregations.append(Aggregation(function.group(0).lower(), name, argument))
+        position += end
+    return options, aggregations, group_by
+
+
+def group_keys(row: Event, group_by: List[str]) -> List[Tuple[Any, ...]]:
+    """
+    Group keys of a row, one per combination of the values of multivalued group-by fields. Rows
+    without a group-by field don't belong to any group.
+    """
+    return list(itertools.product(*(values(row.get(name)) for name in group_by)))
+
+
+def parse_span(span: str) -> Tuple[int, int]:
+    """Span as (seconds, months), where one of both is zero."""
+    match = span_pattern.fullmatch(span)
+    if match is None:
+        raise SigmaValueError(f"Invalid span '{span}'")
+    count, unit = int(match.group(1)), match.group(2)
+    if unit in span_months:
+        return 0, count * span_months[unit]
+    return count * span_seconds[unit], 0
+
+
+def bin_value(value: Any, seconds: int, months: int) -> Any:
+    value = number(value)
+    if value is None:
+        return None
+    if months:
+        timestamp = datetime.fromtimestamp(value, timezone.utc)
+        index = (timestamp.year - 1970) * 12 + timestamp.month - 1
+        index -= index % months
+        return datetime(
+            1970 + index // 12, index % 12 + 1, 1, tzinfo=timezone.utc
+        ).timestamp()
+    return value - value % seconds
+
+
+@dataclass
+class SearchStage:
+    """Execution statistics of one command of a search."""
+
+    command: str
+    input_rows: int
+    output_rows: int
+    seconds: float
+
+
+@dataclass
+class SearchResult:
+    """Result rows of a search together with the execution statistics of its commands."""
+
+    query: str
+    rows: List[Event]
+    stages: List[SearchStage] = field(default_factory=list)
+
+    @property
+    def seconds(self) -> float:
+        return sum(stage.seconds for stage in self.stages)
+
+
+class KhulnasoftSearchEngine:
+    """
+    Local execution of the SPL subset generated by the Khulnasoft backend against a list of events,
+    e.g. loaded from JSON lines or CSV files with load_events. It can be used to verify conversions
+    and to measure the selectivity of rules without a Khulnasoft instance.
+
+    Searches are evaluated like in Khulnasoft: values of search terms are case-insensitive and may
+    contain * wildcards, keywords are matched against the _raw field and regular expressions are
+    evaluated with the re module after translation of the PCRE named group syntax. Each command is
+    implemented by a method command_<name> that compiles the command arguments into a function
+    from input rows to output rows. Commands that are not implemented raise a
+    SigmaFeatureNotSupportedByBackendError.
+    """
+
+    def __init__(self, events: Iterable[Dict[str, Any]]):
+        self.events = [normalize_event(event) for event in events]
+
+    @classmethod
+    def from_files(cls, paths: Iterable[Union[str, Path]]) -> "KhulnasoftSearchEngine":
+        return cls(event for path in paths for event in load_events(path))
+
+    @staticmethod
+    def commands(query: str) -> List[str]:
+        commands = KhulnasoftBackend.query_commands(query)
+        if commands and commands[0].startswith("search search "):
+            commands[0] = commands[0][len("search ") :]
+        return commands
+
+    def compile(self, command: str) -> Command:
+        name, arguments = (re.split(r"\s+", command, 1) + [""])[:2]
+        method = getattr(self, "command_" + name, None)
+        if method is None:
+            raise SigmaFeatureNotSupportedByBackendError(
+                f"Command {name} is not supported by the local search engine"
+            )
+        return method(arguments.strip())
+
+    def search(self, query: str) -> SearchResult:
+        """Run a query on all events. Each command is compiled and run as one stage."""
+        result = SearchResult(query, self.events)
+        for command in self.commands(query):
+            start = time.perf_counter()
+            rows = self.compile(command)(result.rows)
+            result.stages.append(
+                SearchStage(
+                    command, len(result.rows), len(rows), time.perf_counter() - start
+                )
+            )
+            result.rows = rows
+        return result
+
+    def command_search(self, arguments: str) -> Command:
+        predicate = SearchParser(arguments).parse()
+        return lambda rows: [row for row in rows if predicate(row)]
+
+    def command_where(self, arguments: str) -> Command:
+        expression = ExpressionParser(arguments).parse()
+        return lambda rows: [row for row in rows if expression(row) is True]
+
+    def command_eval(self, arguments: str) -> Command:
+        parser = ExpressionParser(arguments)
+        assignments = []
+        while parser.position < len(parser.tokens):
+            assignments.append(parser.parse_assignment())
+
+        def run(rows: List[Event]) -> List[Event]:
+            result = []
+            for row in rows:
+                row = dict(row)
+                for name, expression in assignments:
+                    value = expression(row)
+                    if value is None:
+                        row.pop(name, None)
+                    else:
+                        row[name] = value
+                result.append(row)
+            return result
+
+        return run
+
+    def command_regex(self, arguments: str) -> Command:
+        match = re.fullmatch(
+            r"(?:([^\s=!\"]+)\s*(!?=)\s*)?(" + quoted_string + r")",
+            arguments,
+            re.DOTALL,
+        )
+        if match is None:
+            raise SigmaValueError(f"Invalid regex command arguments '{arguments}'")
+        name = match.group(1) or "_raw"
+        negated = match.group(2) == "!="
+        regex = python_regex(unquote(match.group(3)))
+
+        def matches(row: Event) -> bool:
+            return any(regex.search(text(v)) for v in values(row.get(name)))
+
+        return lambda rows: [row for row in rows if matches(row) != negated]
+
+    def command_rex(self, arguments: str) -> Command:
+        options = {}
+        position = 0
+        while True:
+            option = option_pattern.match(arguments, position)
+            if option is None:
+                break
+            options[option.group(1)] = unquote(option.group(2))
+            position = option.end()
+        pattern = arguments[position:].strip()
+        if not re.fullmatch(quoted_string, pattern, re.DOTALL):
+            raise SigmaValueError(f"Invalid rex command arguments '{arguments}'")
+        regex = python_regex(unquote(pattern))
+        name = options.get("field", "_raw")
+
+        def run(rows: List[Event]) -> List[Event]:
+            result = []
+            for row in rows:
+                for value in values(row.get(name)):
+                    match = regex.search(text(value))
+                    if match:
+                        row = dict(row)
+                        row.update(
+                            (group, extracted)
+                            for group, extracted in match.groupdict().items()
+                            if extracted is not None
+                        )
+                        break
+                result.append(row)
+            return result
+
+        return run
+
+    def command_bin(self, arguments: str) -> Command:
+        options = dict(
+            (option.group(1), option.group(2))
+            for option in option_pattern.finditer(arguments)
+        )
+        names = split_arguments(option_pattern.sub("", arguments))
+        if "span" not in options or len(names) != 1:
+            raise SigmaFeatureNotSupportedByBackendError(
+                "The bin command of the local search engine requires one field and a span"
+            )
+        name = names[0]
+        seconds, months = parse_span(options["span"])
+
+        def run(rows: List[Event]) -> List[Event]:
+            result = []
+            for row in rows:
+                if name in row:
+                    row = dict(row)
+                    row[name] = bin_value(row[name], seconds, months)
+                result.append(row)
+            return result
+
+        return run
+
+    def command_stats(self, arguments: str) -> Command:
+        _, aggregations, group_by = parse_aggregations(arguments)
+
+        def run(rows: List[Event]) -> List[Event]:
+            groups: Dict[Tuple[Any, ...], List[Event]] = {}
+            if not group_by:
+                groups[()] = rows
+            for row in rows if group_by else []:
+                for key in group_keys(row, group_by):
+                    groups.setdefault(key, []).append(row)
+            return [
+                {
+                    **dict(zip(group_by, key)),
+                    **{
+                        aggregation.name: aggregation(group_rows)
+                        for aggregation in aggregations
+                    },
+                }
+                for key, group_rows in groups.items()
+            ]
+
+        return run
+
+    def command_eventstats(self, arguments: str) -> Command:
+        _, aggregations, group_by = parse_aggregations(arguments)
+
+        def run(rows: List[Event]) -> List[Event]:
+            groups: Dict[Tuple[Any, ...], List[Event]] = {}
+            for row in rows:
+                for key in group_keys(row, group_by):
+                    groups.setdefault(key, []).append(row)
+            results = {
+                key: {
+                    aggregation.name: aggregation(group_rows)
+                    for aggregation in aggregations
+                }
+                for key, group_rows in groups.items()
+            }
+            result = []
+            for row in rows:
+                keys = group_keys(row, group_by)
+                if keys:
+                    row = dict(row)
+                    row.update(
+                        (name, value)
+                        for name, value in results[keys[0]].items()
+                        if value is not None
+                    )
+                result.append(row)
+            return result
+
+        return run
+
+    def command_streamstats(self, arguments: str) -> Command:
+        """Aggregation over the events preceding each event in time order within time_window."""
+        options, aggregations, group_by = parse_aggregations(arguments)
+        window = (
+            parse_span(options["time_window"]) if "time_window" in options else None
+        )
+        if window is not None and window[1]:
+            raise SigmaFeatureNotSupportedByBackendError(
+                "The time window of streamstats must not be given in months or years"
+            )
+
+        def run(rows: List[Event]) -> List[Event]:
+            windows: Dict[Tuple[Any, ...], deque] = {}
+            result = []
+            for row in sorted(rows, key=lambda row: number(row.get("_time")) or 0):
+                keys = group_keys(row, group_by)
+                if not keys:
+                    result.append(row)
+                    continue
+                group_rows = windows.setdefault(keys[0], deque())
+                group_rows.append(row)
+                if window is not None:
+                    now = number(row.get("_time")) or 0
+                    while now - (number(group_rows[0].get("_time")) or 0) >= window[0]:
+                        group_rows.popleft()
+                row = dict(row)
+                for aggregation in aggregations:
+                    value = aggregation(list(group_rows))
+                    if value is not None:
+                        row[aggregation.name] = value
+                result.append(row)
+            return result
+
+        return run
+
+    def command_multisearch(self, arguments: str) -> Command:
+        subsearches = []
+        position = arguments.find("[")
+        while position >= 0:
+            end = balanced_end(arguments, position, "[", "]")
+            subsearch = arguments[position + 1 : end - 1].strip()
+            subsearches.append(re.sub(r"^search\s+", "", subsearch))
+            position = arguments.find("[", end)
+        if not subsearches:
+            raise SigmaValueError("The multisearch command requires subsearches")
+
+        def run(rows: List[Event]) -> List[Event]:
+            result = [row for query in subsearches for row in self.search(query).rows]
+            return sorted(
+                result, key=lambda row: number(row.get("_time")) or 0, reverse=True
+            )
+
+        return run
+
+    def command_table(self, arguments: str) -> Command:
+        names = split_arguments(arguments)
+        return lambda rows: [
+            {name: row[name] for name in names if name in row} for row in rows
+        ]
+
+    def command_fields(self, arguments: str) -> Command:
+        """Keep or remove (fields - ...) fields. Like in Khulnasoft, _time and _raw are kept."""
+        names = split_arguments(arguments)
+        if names[:1] == ["-"]:
+            removed = set(names[1:])
+            return lambda rows: [
+                {name: value for name, value in row.items() if name not in removed}
+                for row in rows
+            ]
+        kept = set(names) - {"+"} | {"_time", "_raw"}
+        return lambda rows: [
+            {name: value for name, value in row.items() if name in kept} for row in rows
+        ]
+
+    def command_rename(self, arguments: str) -> Command:
+        renames = re.findall(
+            r"(\"[^\"]*\"|[^\s,]+)\s+as\s+(\"[^\"]*\"|[^\s,]+)",
+            arguments,
+            re.IGNORECASE,
+        )
+        renames = [(unquote(source), unquote(target)) for source, target in renames]
+
+        def run(rows: List[Event]) -> List[Event]:
+            result = []
+            for row in rows:
+                row = dict(row)
+                for source, target in renames:
+                    if source in row:
+                        row[target] = row.pop(source)
+                result.append(row)
+            return result
+
+        return run
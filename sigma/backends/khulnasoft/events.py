@@ -0,0 +1,102 @@
+import csv
+import json
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from sigma.exceptions import SigmaValueError
+
+Event = Dict[str, Any]
+
+
+def values(value: Any) -> List[Any]:
+    """Values of a possibly multivalued field."""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [v for v in value if v is not None]
+    return [value]
+
+
+def text(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_time(value: Any) -> float:
+    """Convert epoch seconds or an ISO 8601 timestamp into epoch seconds."""
+    seconds = number(value)
+    if seconds is not None:
+        return seconds
+    try:
+        timestamp = datetime.fromisoformat(re.sub(r"Z$", "+00:00", str(value)))
+    except ValueError:
+        raise SigmaValueError(f"Invalid event time '{value}'")
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def normalize_event(event: Dict[str, Any], prefix: str = "") -> Event:
+    """
+    Flatten nested objects into dotted field names. Lists become multivalued fields, empty values
+    are dropped like in indexed events.
+    """
+    normalized = {}
+    for key, value in event.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            normalized.update(normalize_event(value, name + "."))
+        elif isinstance(value, list):
+            normalized[name] = [
+                json.dumps(v) if isinstance(v, (dict, list)) else text(v)
+                for v in value
+                if v is not None
+            ]
+        elif value is not None and value != "":
+            normalized[name] = text(value) if isinstance(value, bool) else value
+    if not prefix and "_time" in normalized:
+        normalized["_time"] = parse_time(normalized["_time"])
+    return normalized
+
+
+def load_events(path: Union[str, Path]) -> Iterator[Event]:
+    """Read events from a CSV file with header or a file with one JSON object per line."""
+    path = Path(path)
+    with path.open(encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            yield from csv.DictReader(f)
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise SigmaValueError(f"{path}:{line_number}: invalid event: {e}")
+
+
+def raw_text(event: Event) -> str:
+    """Text searched by keywords. Events without _raw field are searched in their field values."""
+    if "_raw" in event:
+        return text(event["_raw"])
+    return " ".join(
+        f"{name}={text(value)}"
+        for name, field_values in event.items()
+        for value in values(field_values)
+    )
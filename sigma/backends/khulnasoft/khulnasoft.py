@@ -1,48 +1,167 @@
+import copy
 import re
+import threading
+from ipaddress import IPv4Network, IPv6Network, collapse_addresses
 from sigma.conversion.state import ConversionState
 from sigma.modifiers import SigmaRegularExpression
 from sigma.rule import SigmaRule, SigmaDetection
-from sigma.conversion.base import TextQueryBackend, DeferredQueryExpression
+from sigma.collection import SigmaCollection
+from sigma.correlations import (
+    SigmaCorrelationRule,
+    SigmaCorrelationTypeLiteral,
+    SigmaRuleReference,
+)
+from sigma.conversion.base import Backend, TextQueryBackend, DeferredQueryExpression
 from sigma.conversion.deferred import DeferredTextQueryExpression
 from sigma.conditions import (
     ConditionFieldEqualsValueExpression,
+    ConditionValueExpression,
     ConditionOR,
     ConditionAND,
     ConditionNOT,
     ConditionItem,
 )
-from sigma.types import SigmaCompareExpression, SigmaString
-from sigma.exceptions import SigmaFeatureNotSupportedByBackendError, SigmaError
-from sigma.pipelines.khulnasoft.khulnasoft import (
-    khulnasoft_sysmon_process_creation_cim_mapping,
-    khulnasoft_windows_registry_cim_mapping,
-    khulnasoft_windows_file_event_cim_mapping,
-    khulnasoft_web_proxy_cim_mapping,
+from sigma.types import (
+    SigmaCompareExpression,
+    SigmaString,
+    SigmaCIDRExpression,
+    SigmaCasedString,
+    SpecialChars,
+)
+from sigma.exceptions import (
+    SigmaFeatureNotSupportedByBackendError,
+    SigmaConversionError,
+    SigmaError,
 )
+from sigma.backends.khulnasoft.cache import KhulnasoftQueryCache
 import sigma
-from typing import Any, Callable, ClassVar, Dict, List, Optional, Pattern, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Pattern,
+    Set,
+    Tuple,
+    Union,
+)
+
+
+def eval_field(field: str) -> str:
+    """Reference a field in eval and where expressions, where dots and other characters are operators."""
+    if re.fullmatch(r"[A-Za-z_]\w*", field):
+        return field
+    return "'" + field.replace("'", "\\'") + "'"
+
+
+class KhulnasoftDeferredTextQueryExpression(DeferredTextQueryExpression):
+    """
+    Deferred expression that can also filter the aggregated rows of a tstats data model query with
+    data_model_template. In this template, {field} is a field reference usable in eval and where
+    expressions and {name} the plain field name.
+    """
+
+    data_model_template: ClassVar[str]
+    data_model_operators: ClassVar[Dict[bool, str]] = {
+        True: "NOT ",
+        False: "",
+    }
+
+    def finalize_data_model_expression(self) -> str:
+        return self.data_model_template.format(
+            field=eval_field(self.field),
+            name=self.field,
+            op=self.data_model_operators[self.negated],
+            value=self.value,
+        )
 
 
-class KhulnasoftDeferredRegularExpression(DeferredTextQueryExpression):
+class KhulnasoftDeferredRegularExpression(KhulnasoftDeferredTextQueryExpression):
     template = 'regex {field}{op}"{value}"'
+    data_model_template = 'where {op}match({field}, "{value}")'
     operators = {
         True: "!=",
         False: "=",
     }
     default_field = "_raw"
+    # Backreferences, named groups and subroutine calls depend on the group numbering and names
+    # of a single pattern and prevent merging of patterns.
+    unmergeable_pattern: ClassVar[Pattern] = re.compile(
+        r"\\[1-9gk]|\(\?(?:P?<(?![=!])|P?'|P=|P>|&|R|[+-]?\d)"
+    )
+
+    def mergeable(self) -> bool:
+        return self.unmergeable_pattern.search(self.value) is None
+
+    @classmethod
+    def merge(
+        cls,
+        state: ConversionState,
+        expressions: List["KhulnasoftDeferredRegularExpression"],
+    ) -> "KhulnasoftDeferredRegularExpression":
+        """
+        Merge regular expressions on the same field with the same negation state into one regex
+        command. All patterns must match: lookahead for each pattern from the beginning of the
+        value. No pattern must match (negated): alternation of the patterns.
+        """
+        if expressions[0].negated:
+            value = "|".join(f"(?:{expression.value})" for expression in expressions)
+        else:
+            value = "^" + "".join(
+                f"(?=[\\s\\S]*?(?:{expression.value}))" for expression in expressions
+            )
+        merged = cls(state, expressions[0].field, value)
+        merged.negated = expressions[0].negated
+        return merged
 
 
-class KhulnasoftDeferredORRegularExpression(DeferredTextQueryExpression):
-    field_counts = {}
+class KhulnasoftDeferredORExpression(KhulnasoftDeferredTextQueryExpression):
+    """
+    Base class of deferred expressions that can't be filtered after the main search because they
+    are part of an OR condition. They are evaluated into {field}...Condition fields before the main
+    search, which then checks these fields. The counters of the field suffixes are kept per query
+    in the conversion state.
+    """
+
+    field_counts_key: ClassVar[str]
     default_field = "_raw"
     operators = {
         True: "!=",
         False: "=",
     }
 
+    @classmethod
+    def field_counts(cls, state: ConversionState) -> Dict[str, int]:
+        return state.processing_state.setdefault(cls.field_counts_key, {})
+
+    @classmethod
+    def add_field(cls, state: ConversionState, field):
+        field_counts = cls.field_counts(state)
+        field_counts[field] = (
+            field_counts.get(field, 0) + 1
+        )  # increment the field count
+
+    @classmethod
+    def get_index_suffix(cls, state: ConversionState, field):
+
+        index_suffix = cls.field_counts(state).get(field, 0)
+        if index_suffix == 1:
+            # return nothing for the first field use
+            return ""
+        return str(index_suffix)
+
+
+class KhulnasoftDeferredORRegularExpression(KhulnasoftDeferredORExpression):
+    field_counts_key = "regex_or_field_counts"
+
     def __init__(self, state, field, arg) -> None:
-        KhulnasoftDeferredORRegularExpression.add_field(field)
-        index_suffix = KhulnasoftDeferredORRegularExpression.get_index_suffix(field)
+        KhulnasoftDeferredORRegularExpression.add_field(state, field)
+        index_suffix = KhulnasoftDeferredORRegularExpression.get_index_suffix(
+            state, field
+        )
         self.template = (
             'rex field={field} "(?<{field}Match'
             + index_suffix
@@ -52,30 +171,42 @@ class KhulnasoftDeferredORRegularExpression(DeferredTextQueryExpression):
             + index_suffix
             + '), "true", "false")'
         )
+        self.data_model_template = (
+            "eval {name}Condition"
+            + index_suffix
+            + '=if(match({field}, "{value}"), "true", "false")'
+        )
         return super().__init__(state, field, arg)
 
-    @classmethod
-    def add_field(cls, field):
-        cls.field_counts[field] = (
-            cls.field_counts.get(field, 0) + 1
-        )  # increment the field count
-
-    @classmethod
-    def get_index_suffix(cls, field):
 
-        index_suffix = cls.field_counts.get(field, 0)
-        if index_suffix == 1:
-            # return nothing for the first field use
-            return ""
-        return str(index_suffix)
+class KhulnasoftDeferredORCIDRExpression(KhulnasoftDeferredORExpression):
+    field_counts_key = "cidr_or_field_counts"
 
-    @classmethod
-    def reset(cls):
-        cls.field_counts = {}
+    def __init__(self, state, field, arg) -> None:
+        KhulnasoftDeferredORCIDRExpression.add_field(state, field)
+        index_suffix = KhulnasoftDeferredORCIDRExpression.get_index_suffix(state, field)
+        self.template = (
+            "eval {field}CidrCondition" + index_suffix + '=if({value}, "true", "false")'
+        )
+        self.data_model_template = (
+            "eval {name}CidrCondition" + index_suffix + '=if({value}, "true", "false")'
+        )
+        return super().__init__(state, field, arg)
 
 
-class KhulnasoftDeferredCIDRExpression(DeferredTextQueryExpression):
+class KhulnasoftDeferredCIDRExpression(KhulnasoftDeferredTextQueryExpression):
     template = 'where {op}cidrmatch("{value}", {field})'
+    data_model_template = template
+    operators = {
+        True: "NOT ",
+        False: "",
+    }
+    default_field = "_raw"
+
+
+class KhulnasoftDeferredCIDRListExpression(KhulnasoftDeferredTextQueryExpression):
+    template = "where {op}({value})"
+    data_model_template = template
     operators = {
         True: "NOT ",
         False: "",
@@ -94,6 +225,11 @@ class KhulnasoftBackend(TextQueryBackend):
             "default": "Plain SPL queries",
             "savedsearches": "Plain SPL in a savedsearches.conf file",
             "data_model": "Data model queries with tstats",
+            "data_model_savedsearches": "Data model queries with tstats in a savedsearches.conf file",
+            "data_model_batch": "One tstats query per data model matching all rules of the data model",
+            "consolidated_savedsearches": "One search per log source matching all rules of the log source in a savedsearches.conf file",
+            "explain": "Static cost estimate and execution stages of plain SPL queries",
+            "columnar": "Matchers evaluating batches of events locally instead of SPL queries",
         }
     )
     requires_pipeline: ClassVar[bool] = (
@@ -155,19 +291,27 @@ class KhulnasoftBackend(TextQueryBackend):
     # Correlations
     correlation_methods: ClassVar[Dict[str, str]] = {
         "stats": "Correlation using stats command (more efficient, static time window)",
+        "streamstats": "Correlation using streamstats command (sliding time window)",
         # "transaction": "Correlation using transaction command (less efficient, sliding time window",
     }
     default_correlation_method: ClassVar[str] = "stats"
     default_correlation_query: ClassVar[str] = {
+        "stats": "{search}\n\n{aggregate}\n\n{condition}",
+        "streamstats": "{search}\n\n{aggregate}\n\n{condition}",
+    }
+    temporal_ordered_correlation_query: ClassVar[Dict[str, str]] = {
         "stats": "{search}\n\n{aggregate}\n\n{condition}"
     }
 
     correlation_search_single_rule_expression: ClassVar[str] = "{query}"
     correlation_search_multi_rule_expression: ClassVar[str] = "| multisearch\n{queries}"
     correlation_search_multi_rule_query_expression: ClassVar[str] = (
-        '[ search {query} | eval event_type="{ruleid}"{normalization} ]'
+        '[ search {query} | eval event_type="{ruleid}"{normalization}{projection} ]'
     )
     correlation_search_multi_rule_query_expression_joiner: ClassVar[str] = "\n"
+    # Subsearches of multi-rule correlations only pass the fields used by the aggregation to the
+    # search head.
+    correlation_search_projection_expression: ClassVar[str] = " | fields {fields}"
 
     correlation_search_field_normalization_expression: ClassVar[str] = (
         " | rename {field} as {alias}"
@@ -176,31 +320,169 @@ class KhulnasoftBackend(TextQueryBackend):
 
     event_count_aggregation_expression: ClassVar[Dict[str, str]] = {
         "stats": "| bin _time span={timespan}\n| stats count as event_count by _time{groupby}",
+        "streamstats": "| streamstats time_window={timespan} count as event_count{groupby}",
     }
     value_count_aggregation_expression: ClassVar[Dict[str, str]] = {
         "stats": "| bin _time span={timespan}\n| stats dc({field}) as value_count by _time{groupby}",
+        "streamstats": "| streamstats time_window={timespan} dc({field}) as value_count{groupby}",
     }
     temporal_aggregation_expression: ClassVar[Dict[str, str]] = {
         "stats": "| bin _time span={timespan}\n| stats dc(event_type) as event_type_count by _time{groupby}",
+        "streamstats": "| streamstats time_window={timespan} dc(event_type) as event_type_count{groupby}",
+    }
+    # Ordered temporal correlations determine the time of the first event of each rule after the
+    # step of the previous rule in one eventstats pass per rule. The number of steps that were
+    # reached in order is counted as event_type_count.
+    temporal_ordered_aggregation_expression: ClassVar[Dict[str, str]] = {
+        "stats": "| eval event_time=_time\n| bin _time span={timespan}\n{steps}\n| stats max(eval(mvcount(mvappend({step_times})))) as event_type_count by _time{groupby}",
+    }
+    temporal_ordered_step_expression: ClassVar[Dict[str, str]] = {
+        "stats": '| eventstats min(eval(if(event_type="{ruleid}"{after}, event_time, null()))) as step_time_{step} by _time{groupby}',
+    }
+    temporal_ordered_step_after_expression: ClassVar[Dict[str, str]] = {
+        "stats": " AND event_time>=step_time_{previous}",
     }
 
     timespan_mapping: ClassVar[Dict[str, str]] = {
         "M": "mon",
     }
 
-    groupby_expression: ClassVar[Dict[str, str]] = {"stats": " {fields}"}
-    groupby_field_expression: ClassVar[Dict[str, str]] = {"stats": "{field}"}
-    groupby_field_expression_joiner: ClassVar[Dict[str, str]] = {"stats": " "}
+    groupby_expression: ClassVar[Dict[str, str]] = {
+        "stats": " {fields}",
+        "streamstats": " by {fields}",
+    }
+    groupby_expression_nofield: ClassVar[Dict[str, str]] = {
+        "stats": "",
+        "streamstats": "",
+    }
+    groupby_field_expression: ClassVar[Dict[str, str]] = {
+        "stats": "{field}",
+        "streamstats": "{field}",
+    }
+    groupby_field_expression_joiner: ClassVar[Dict[str, str]] = {
+        "stats": " ",
+        "streamstats": " ",
+    }
 
     event_count_condition_expression: ClassVar[Dict[str, str]] = {
-        "stats": "| search event_count {op} {count}"
+        "stats": "| search event_count {op} {count}",
+        "streamstats": "| search event_count {op} {count}",
     }
     value_count_condition_expression: ClassVar[Dict[str, str]] = {
-        "stats": "| search value_count {op} {count}"
+        "stats": "| search value_count {op} {count}",
+        "streamstats": "| search value_count {op} {count}",
     }
     temporal_condition_expression: ClassVar[Dict[str, str]] = {
-        "stats": "| search event_type_count {op} {count}"
+        "stats": "| search event_type_count {op} {count}",
+        "streamstats": "| search event_type_count {op} {count}",
+    }
+    temporal_ordered_condition_expression: ClassVar[Dict[str, str]] = {
+        "stats": "| search event_type_count {op} {count}",
+    }
+
+    # Prefilters: literal tokens that must occur in every matching event are added as keywords
+    # in front of the query, so the indexers can skip buckets by their bloom filters and lexicons.
+    term_prefilter_modes: ClassVar[Dict[str, str]] = {
+        "keyword": "{token}",
+        "term": "TERM({token})",
+    }
+    # Major and minor breakers. Tokens are delimited by them, but must not contain them.
+    term_prefilter_breakers: ClassVar[Pattern] = re.compile(
+        r"[\s\[\]<>(){}|!;,'\"*&?+/:=@.\-$#%\\_]"
+    )
+    term_prefilter_token_pattern: ClassVar[Pattern] = re.compile(r"[^\W_]+")
+    # TERM() only matches whole tokens delimited by major breakers, which can contain minor breakers.
+    # Value boundaries aren't used as delimiters, because the value can be preceded or followed by
+    # minor breakers in the raw event, e.g. User=foo.
+    term_prefilter_major_breakers: ClassVar[Pattern] = re.compile(
+        r"[\s\[\]<>(){}|!;,'\"*&?+]"
+    )
+    term_prefilter_term_pattern: ClassVar[Pattern] = re.compile(
+        r"(?=.*[^\W_])[\w.\-/:@#$%]+"
+    )
+    term_prefilter_min_length: ClassVar[int] = 3
+    # Bare keywords with these names are boolean operators of the search command.
+    term_prefilter_operators: ClassVar[Set[str]] = {"AND", "OR", "NOT"}
+    term_prefilter_max_tokens: ClassVar[int] = 5
+    # Values of these fields are not contained in the raw event.
+    metadata_fields: ClassVar[Set[str]] = {
+        "source",
+        "sourcetype",
+        "host",
+        "index",
+        "eventtype",
+        "tag",
+        "khulnasoft_server",
     }
+    term_prefilter_formats: ClassVar[Set[str]] = {"default", "savedsearches", "explain"}
+
+    data_model_formats: ClassVar[Set[str]] = {
+        "data_model",
+        "data_model_savedsearches",
+        "data_model_batch",
+    }
+    # Output formats whose per-rule results can't be embedded into correlation queries.
+    correlation_unsupported_formats: ClassVar[Set[str]] = {
+        "columnar",
+        "explain",
+        "consolidated_savedsearches",
+    }
+    # Ordering of deferred filters, see order_deferred_expressions: relative evaluation cost per
+    # event and estimated share of events passing a filter depending on its negation.
+    deferred_filter_costs: ClassVar[Dict[str, int]] = {
+        "cidr": 1,
+        "regex": 5,
+        "raw_regex": 20,
+    }
+    deferred_filter_pass_rates: ClassVar[Dict[bool, float]] = {
+        False: 0.1,
+        True: 0.9,
+    }
+    # Static query cost estimation: cost of each finding, see query_cost.
+    query_cost_weights: ClassVar[Dict[str, int]] = {
+        "leading_wildcard": 10,
+        "raw_regex": 20,
+        "or_regex_eval": 10,
+        "not_only": 20,
+        "unscoped": 5,
+        "large_in_list": 5,
+        "search_head_stage": 1,
+    }
+    query_cost_scope_fields: ClassVar[Set[str]] = {
+        "index",
+        "source",
+        "sourcetype",
+        "eventtype",
+    }
+    query_cost_large_in_list: ClassVar[int] = 100
+    # Commands that run on the indexers if all preceding commands do. Macros are assumed to expand
+    # to such commands.
+    distributable_commands: ClassVar[Set[str]] = {
+        "search",
+        "where",
+        "eval",
+        "rex",
+        "regex",
+        "rename",
+        "fields",
+        "convert",
+        "bin",
+        "fillnull",
+        "multisearch",
+        "macro",
+    }
+    # Commands that are pre-aggregated on the indexers, all following commands run on the search head.
+    reporting_commands: ClassVar[Set[str]] = {
+        "tstats",
+        "stats",
+        "chart",
+        "timechart",
+        "top",
+        "rare",
+    }
+    acceleration_lag_pattern: ClassVar[Pattern] = re.compile(
+        r"-?(\d+)(s|m|h|d|w|mon|y)"
+    )
 
     def __init__(
         self,
@@ -212,8 +494,18 @@ class KhulnasoftBackend(TextQueryBackend):
         max_time: str = "now",
         query_settings: Callable[[SigmaRule], Dict[str, str]] = lambda x: {},
         output_settings: Dict = {},
+        cache_dir: Optional[str] = None,
+        cache_max_size: int = 256 * 1024**2,
+        term_prefilters: Union[bool, str] = False,
+        data_model_identity_fields: Union[str, Iterable[str]] = ("dest", "user"),
+        data_model_summariesonly: Union[bool, str] = False,
+        data_model_acceleration_lag: Optional[str] = None,
+        data_model_batch_size: Optional[int] = None,
+        cost_metadata: Union[bool, str] = False,
+        cost_threshold: Optional[int] = None,
         **kwargs,
     ):
+        self._thread_state = threading.local()
         super().__init__(processing_pipeline, collect_errors, **kwargs)
         self.query_settings = query_settings
         self.output_settings = {
@@ -221,16 +513,202 @@ class KhulnasoftBackend(TextQueryBackend):
             "dispatch.latest_time": max_time,
         }
         self.output_settings.update(output_settings)
+        self.cache = (
+            KhulnasoftQueryCache(cache_dir, int(cache_max_size)) if cache_dir else None
+        )
+        # Backend options passed on the command line are strings.
+        if term_prefilters in (True, "true", "True", "yes", "1"):
+            term_prefilters = "keyword"
+        elif term_prefilters in (False, None, "", "false", "False", "no", "0"):
+            term_prefilters = None
+        if (
+            term_prefilters is not None
+            and term_prefilters not in self.term_prefilter_modes
+        ):
+            raise SigmaFeatureNotSupportedByBackendError(
+                f"Unknown term prefilter mode '{term_prefilters}', supported modes: "
+                + ", ".join(self.term_prefilter_modes)
+            )
+        self.term_prefilters = term_prefilters
+        if isinstance(data_model_identity_fields, str):
+            data_model_identity_fields = [
+                field.strip()
+                for field in data_model_identity_fields.split(",")
+                if field.strip()
+            ]
+        self.data_model_identity_fields = list(data_model_identity_fields)
+        self.data_model_summariesonly = data_model_summariesonly in (
+            True,
+            "true",
+            "True",
+            "yes",
+            "1",
+        )
+        if data_model_acceleration_lag:
+            lag = self.acceleration_lag_pattern.fullmatch(data_model_acceleration_lag)
+            if lag is None:
+                raise SigmaFeatureNotSupportedByBackendError(
+                    f"Invalid data model acceleration lag '{data_model_acceleration_lag}', expected a relative time like 15m"
+                )
+            data_model_acceleration_lag = "-" + lag.group(1) + lag.group(2)
+        self.data_model_acceleration_lag = data_model_acceleration_lag or None
+        self.data_model_batch_size = (
+            int(data_model_batch_size) if data_model_batch_size else None
+        )
+        self.cost_metadata = cost_metadata in (True, "true", "True", "yes", "1")
+        self.cost_threshold = (
+            int(cost_threshold) if cost_threshold not in (None, "") else None
+        )
+
+    @property
+    def last_processing_pipeline(
+        self,
+    ) -> "sigma.processing.pipeline.ProcessingPipeline":
+        """Processing pipeline used for the last rule converted in the current thread."""
+        try:
+            return self._thread_state.last_processing_pipeline
+        except AttributeError:
+            raise AttributeError(
+                "No rule was converted by this backend in the current thread yet"
+            )
+
+    @last_processing_pipeline.setter
+    def last_processing_pipeline(
+        self, pipeline: "sigma.processing.pipeline.ProcessingPipeline"
+    ) -> None:
+        self._thread_state.last_processing_pipeline = pipeline
+
+    def convert_rule(
+        self, rule: SigmaRule, output_format: Optional[str] = None
+    ) -> List[Any]:
+        """Convert a single Sigma rule. Conversion results are looked up in and stored into the query cache if configured."""
+        if self.cache is None:
+            return super().convert_rule(rule, output_format)
+
+        output_format = output_format or self.default_format
+        pipeline = self._compose_processing_pipeline(output_format)
+        key = self.cache.key(
+            rule,
+            pipeline,
+            [
+                type(self).__name__,
+                self.output_settings,
+                self.query_settings(rule),
+                self.term_prefilters,
+                self.data_model_identity_fields,
+                self.data_model_summariesonly,
+                self.data_model_acceleration_lag,
+                self.cost_metadata,
+                self.cost_threshold,
+            ],
+            output_format,
+        )
+        queries = self.cache.get(key)
+        if queries is None:
+            rule.set_conversion_result(None)
+            result = super().convert_rule(rule, output_format)
+            try:
+                self.cache.put(key, rule.get_conversion_result())
+            except SigmaConversionError:  # conversion error was collected
+                pass
+            return result
+
+        self.last_processing_pipeline = pipeline
+        rule.set_conversion_result(queries)
+        return queries if rule._output else []
+
+    def convert_many(
+        self,
+        rule_collection: SigmaCollection,
+        output_format: Optional[str] = None,
+        correlation_method: Optional[str] = None,
+        workers: Optional[int] = None,
+    ) -> Any:
+        """
+        Convert a Sigma ruleset like convert(), but convert the rules concurrently on a thread pool with
+        the given number of workers. The result is identical to convert(), the order of the queries and
+        collected errors follows the order of the rules in the collection.
+
+        Correlation rules are converted afterwards in the calling thread, because they refer to the
+        conversion results of their base rules. Each worker thread converts with its own copy of the
+        backend, see worker_backend.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        output_format = output_format or self.default_format
+        rule_collection.resolve_rule_references()
+        rules = rule_collection.rules
+        base_rules = [rule for rule in rules if isinstance(rule, SigmaRule)]
+        errors_offset = len(self.errors)
+        worker_state = threading.local()
+
+        def convert_rule(rule: SigmaRule) -> List[Any]:
+            try:
+                backend = worker_state.backend
+            except AttributeError:
+                backend = worker_state.backend = self.worker_backend()
+            return backend.convert_rule(rule, output_format)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(
+                zip(map(id, base_rules), executor.map(convert_rule, base_rules))
+            )
+
+        # Errors are appended by the workers in completion order, restore the order of the rule collection.
+        rule_positions = {id(rule): index for index, rule in enumerate(rules)}
+        self.errors[errors_offset:] = sorted(
+            self.errors[errors_offset:],
+            key=lambda error: rule_positions.get(id(error[0]), len(rules)),
+        )
+
+        self.last_processing_pipeline = self._compose_processing_pipeline(output_format)
+        queries = [
+            query
+            for rule in rules
+            for query in (
+                results[id(rule)]
+                if isinstance(rule, SigmaRule)
+                else self.convert_correlation_rule(
+                    rule, output_format, correlation_method
+                )
+            )
+        ]
+        return self.finalize(queries, output_format)
+
+    def worker_backend(self) -> "KhulnasoftBackend":
+        """
+        Copy of the backend for a worker thread with its own processing pipelines. pySigma
+        transformations store the pipeline they are applied by, so the same pipeline objects can't be
+        applied by multiple threads at once. The errors and the query cache are shared.
+        """
+        backend = copy.copy(self)
+        backend._thread_state = threading.local()
+        backend.backend_processing_pipeline = copy.deepcopy(
+            self.backend_processing_pipeline
+        )
+        backend.processing_pipeline = copy.deepcopy(self.processing_pipeline)
+        backend.output_format_processing_pipeline = copy.deepcopy(
+            self.output_format_processing_pipeline
+        )
+        return backend
+
+    def _compose_processing_pipeline(
+        self, output_format: str
+    ) -> "sigma.processing.pipeline.ProcessingPipeline":
+        """Compose the processing pipeline that is applied to rules converted into the given output format."""
+        return (
+            self.backend_processing_pipeline
+            + self.processing_pipeline
+            + self.output_format_processing_pipeline[output_format]
+        )
 
     @staticmethod
     def _generate_settings(settings):
         """Format a settings dict into newline separated k=v string. Escape multi-line values."""
-        output = ""
-        for k, v in settings.items():
-            output += f"\n{k} = " + " \\\n".join(
-                v.split("\n")
-            )  # cannot use \ in f-strings
-        return output
+        return "".join(
+            f"\n{k} = " + " \\\n".join(v.split("\n"))  # cannot use \ in f-strings
+            for k, v in settings.items()
+        )
 
     def convert_condition_field_eq_val_re(
         self,
@@ -250,8 +728,8 @@ class KhulnasoftBackend(TextQueryBackend):
             cond_true = ConditionFieldEqualsValueExpression(
                 cond.field
                 + "Condition"
-                + str(
-                    KhulnasoftDeferredORRegularExpression.get_index_suffix(cond.field)
+                + KhulnasoftDeferredORRegularExpression.get_index_suffix(
+                    state, cond.field
                 ),
                 SigmaString("true"),
             )
@@ -265,17 +743,393 @@ class KhulnasoftBackend(TextQueryBackend):
         self,
         cond: ConditionFieldEqualsValueExpression,
         state: "sigma.conversion.state.ConversionState",
-    ) -> KhulnasoftDeferredCIDRExpression:
+    ) -> Union[str, KhulnasoftDeferredCIDRExpression]:
         """Defer CIDR network range matching to pipelined where cidrmatch command after main search expression."""
         if cond.parent_condition_chain_contains(ConditionOR):
-            raise SigmaFeatureNotSupportedByBackendError(
-                "ORing CIDR matching is not yet supported by Khulnasoft backend",
-                source=cond.source,
+            return self.convert_condition_field_eq_val_cidr_or(
+                cond, cond.field, [cond.value.network], state
             )
         return KhulnasoftDeferredCIDRExpression(
             state, cond.field, super().convert_condition_field_eq_val_cidr(cond, state)
         ).postprocess(None, cond)
 
+    @staticmethod
+    def is_cidr_list(cond: ConditionOR) -> bool:
+        """Check if all arguments of an OR condition match CIDR network ranges of the same field."""
+        return (
+            all(
+                isinstance(arg, ConditionFieldEqualsValueExpression)
+                and isinstance(arg.value, SigmaCIDRExpression)
+                for arg in cond.args
+            )
+            and len({arg.field for arg in cond.args}) == 1
+        )
+
+    @staticmethod
+    def collapse_networks(
+        networks: Iterable[Union[IPv4Network, IPv6Network]]
+    ) -> List[Union[IPv4Network, IPv6Network]]:
+        """Merge overlapping and adjacent networks separately for each IP version."""
+        networks = list(networks)
+        return [
+            network
+            for version in (4, 6)
+            for network in collapse_addresses(
+                network for network in networks if network.version == version
+            )
+        ]
+
+    def convert_condition_field_eq_val_cidr_list(
+        self,
+        cond: ConditionOR,
+        state: "sigma.conversion.state.ConversionState",
+    ) -> Union[str, KhulnasoftDeferredCIDRExpression]:
+        """Collapse the CIDR network ranges of an OR condition into a single where cidrmatch command."""
+        field = cond.args[0].field
+        networks = self.collapse_networks(arg.value.network for arg in cond.args)
+        if cond.parent_condition_chain_contains(ConditionOR):
+            return self.convert_condition_field_eq_val_cidr_or(
+                cond, field, networks, state
+            )
+        if len(networks) == 1:
+            return KhulnasoftDeferredCIDRExpression(
+                state, field, str(networks[0])
+            ).postprocess(None, cond)
+        return KhulnasoftDeferredCIDRListExpression(
+            state, field, self.cidrmatch_expression(field, networks)
+        ).postprocess(None, cond)
+
+    def convert_condition_field_eq_val_cidr_or(
+        self,
+        cond: Union[ConditionOR, ConditionFieldEqualsValueExpression],
+        field: Optional[str],
+        networks: List[Union[IPv4Network, IPv6Network]],
+        state: "sigma.conversion.state.ConversionState",
+    ) -> str:
+        """Evaluate CIDR matching that is part of an OR condition into a field checked by the main search."""
+        deferred_expression = KhulnasoftDeferredORCIDRExpression(
+            state,
+            field,
+            self.cidrmatch_expression(
+                field or KhulnasoftDeferredORCIDRExpression.default_field, networks
+            ),
+        ).postprocess(None, cond)
+        cond_true = ConditionFieldEqualsValueExpression(
+            deferred_expression.field
+            + "CidrCondition"
+            + KhulnasoftDeferredORCIDRExpression.get_index_suffix(
+                state, deferred_expression.field
+            ),
+            SigmaString("true"),
+        )
+        # returning fieldCidrCondition=true
+        return super().convert_condition_field_eq_val_str(cond_true, state)
+
+    @staticmethod
+    def cidrmatch_expression(
+        field: str, networks: List[Union[IPv4Network, IPv6Network]]
+    ) -> str:
+        return " OR ".join(
+            f'cidrmatch("{network}", {eval_field(field)})' for network in networks
+        )
+
+    def convert_condition_or(
+        self, cond: ConditionOR, state: "sigma.conversion.state.ConversionState"
+    ) -> Union[str, DeferredQueryExpression]:
+        if self.is_cidr_list(cond):
+            return self.convert_condition_field_eq_val_cidr_list(cond, state)
+        return super().convert_condition_or(cond, state)
+
+    def convert_condition_not(
+        self, cond: ConditionNOT, state: "sigma.conversion.state.ConversionState"
+    ) -> Union[str, DeferredQueryExpression]:
+        arg = cond.args[0]
+        if isinstance(arg, ConditionOR) and self.is_cidr_list(arg):
+            expr = self.convert_condition(arg, state)
+            if isinstance(expr, DeferredQueryExpression):
+                return expr.negate()
+            return self.not_token + self.token_separator + expr
+        return super().convert_condition_not(cond, state)
+
+    def convert_condition_as_in_expression(
+        self, cond: Union[ConditionOR, ConditionAND], state: ConversionState
+    ) -> Union[str, DeferredQueryExpression]:
+        if isinstance(cond, ConditionOR):
+            args = self.prune_in_list(cond.args)
+            if len(args) == 1:
+                return self.convert_condition(args[0], state)
+            if len(args) < len(cond.args):
+                cond = ConditionOR(args, cond.source)
+        return super().convert_condition_as_in_expression(cond, state)
+
+    @staticmethod
+    def value_pattern(value: Any) -> Optional[Tuple[str, ...]]:
+        """
+        Lower-cased literal parts of a string value between its wildcards, e.g. ("", "abc", "") for
+        *abc*. Consecutive wildcards are collapsed and single character wildcards are treated like
+        multi character wildcards, like SPL does. None if the value isn't a plain string.
+        """
+        if not isinstance(value, SigmaString) or isinstance(value, SigmaCasedString):
+            return None
+        pattern = [""]
+        for part in value.s:
+            if isinstance(part, str):
+                pieces = part.lower().split("*")
+                if "\0" in part:
+                    return None
+            elif part in (SpecialChars.WILDCARD_MULTI, SpecialChars.WILDCARD_SINGLE):
+                pieces = ["", ""]
+            else:
+                return None
+            pattern[-1] += pieces[0]
+            for piece in pieces[1:]:
+                if pattern[-1] or len(pattern) == 1:
+                    pattern.append(piece)
+                else:  # collapse consecutive wildcards
+                    pattern[-1] = piece
+        return tuple(pattern)
+
+    def prune_in_list(
+        self, args: List[ConditionFieldEqualsValueExpression]
+    ) -> List[ConditionFieldEqualsValueExpression]:
+        """
+        Remove values from a value list that are case-insensitive duplicates of other values or that
+        only match values that are also matched by another wildcard pattern of the list, e.g.
+        *\\windows\\system32\\powershell.exe is covered by *\\powershell.exe and *xabcx* by *abc*.
+
+        A value is covered by a pattern if the pattern matches the value with each wildcard of the
+        value replaced by a character that only wildcards of the pattern can match. Patterns of the
+        forms *suffix, prefix* and *infix* are looked up by the parts of the value, other patterns are
+        matched against all values.
+        """
+        patterns: Dict[Any, ConditionFieldEqualsValueExpression] = {}
+        for arg in args:
+            pattern = self.value_pattern(arg.value)
+            patterns.setdefault(pattern if pattern is not None else str(arg.value), arg)
+        if ("", "") in patterns:  # * matches everything
+            return [patterns[("", "")]]
+
+        suffixes = set()
+        prefixes = set()
+        infixes = set()
+        other_patterns = []
+        for pattern in patterns:
+            if not isinstance(pattern, tuple) or len(pattern) == 1:
+                continue
+            if len(pattern) == 2 and pattern[0] == "":
+                suffixes.add(pattern[1])
+            elif len(pattern) == 2 and pattern[1] == "":
+                prefixes.add(pattern[0])
+            elif len(pattern) == 3 and pattern[0] == pattern[2] == "":
+                infixes.add(pattern[1])
+            else:
+                other_patterns.append(
+                    (
+                        pattern,
+                        re.compile(
+                            ".*".join(re.escape(part) for part in pattern), re.DOTALL
+                        ),
+                    )
+                )
+        infix_lengths = {len(infix) for infix in infixes}
+
+        def covered(pattern: Tuple[str, ...]) -> bool:
+            head, tail = pattern[0], pattern[-1]
+            if any(
+                ("", tail[i:]) != pattern and tail[i:] in suffixes
+                for i in range(len(tail))
+            ) or any(
+                (head[:i], "") != pattern and head[:i] in prefixes
+                for i in range(1, len(head) + 1)
+            ):
+                return True
+            for part in pattern:
+                for length in infix_lengths:
+                    for i in range(len(part) - length + 1):
+                        if (
+                            part[i : i + length] in infixes
+                            and ("", part[i : i + length], "") != pattern
+                        ):
+                            return True
+            value = "\0".join(pattern)
+            return any(
+                other != pattern and regex.fullmatch(value)
+                for other, regex in other_patterns
+            )
+
+        kept = {
+            id(arg)
+            for pattern, arg in patterns.items()
+            if not isinstance(pattern, tuple) or not covered(pattern)
+        }
+        return [arg for arg in args if id(arg) in kept]
+
+    def merge_deferred_regular_expressions(self, state: ConversionState) -> None:
+        """
+        Replace multiple deferred regex commands on the same field by a single one, so each event is
+        only evaluated once. The merged command takes the position of the first merged one.
+        """
+        groups: Dict[Tuple[str, bool], List[KhulnasoftDeferredRegularExpression]] = {}
+        for deferred_expression in state.deferred:
+            if (
+                type(deferred_expression) == KhulnasoftDeferredRegularExpression
+                and deferred_expression.mergeable()
+            ):
+                groups.setdefault(
+                    (deferred_expression.field, deferred_expression.negated), []
+                ).append(deferred_expression)
+
+        deferred = list(state.deferred)
+        for expressions in groups.values():
+            if len(expressions) > 1:
+                merged = KhulnasoftDeferredRegularExpression.merge(state, expressions)
+                merged_ids = {id(expression) for expression in expressions}
+                deferred = [
+                    (
+                        merged
+                        if deferred_expression is expressions[0]
+                        else deferred_expression
+                    )
+                    for deferred_expression in deferred
+                    if id(deferred_expression) not in merged_ids
+                    or deferred_expression is expressions[0]
+                ]
+        state.deferred = deferred
+
+    def deferred_expression_rank(
+        self, deferred_expression: DeferredQueryExpression
+    ) -> float:
+        """
+        Rank of a deferred filter: its cost divided by the share of events it removes. Running
+        filters by increasing rank minimizes the expected cost of the filter pipeline.
+        """
+        if isinstance(deferred_expression, KhulnasoftDeferredCIDRListExpression):
+            cost = self.deferred_filter_costs["cidr"] * max(
+                1, deferred_expression.value.count("cidrmatch(")
+            )
+        elif isinstance(deferred_expression, KhulnasoftDeferredCIDRExpression):
+            cost = self.deferred_filter_costs["cidr"]
+        elif deferred_expression.field == deferred_expression.default_field:
+            cost = self.deferred_filter_costs["raw_regex"]
+        else:
+            cost = self.deferred_filter_costs["regex"]
+        return cost / (1 - self.deferred_filter_pass_rates[deferred_expression.negated])
+
+    def order_deferred_expressions(self, state: ConversionState) -> None:
+        """
+        Order the deferred filters by their rank, so cheap filters that remove most events run
+        before expensive ones. All filters must match, so their order doesn't change the result.
+        Expressions of OR conditions don't filter and keep their positions.
+        """
+        filters = iter(
+            sorted(
+                (
+                    deferred_expression
+                    for deferred_expression in state.deferred
+                    if not isinstance(
+                        deferred_expression, KhulnasoftDeferredORExpression
+                    )
+                ),
+                key=self.deferred_expression_rank,
+            )
+        )
+        state.deferred = [
+            (
+                deferred_expression
+                if isinstance(deferred_expression, KhulnasoftDeferredORExpression)
+                else next(filters)
+            )
+            for deferred_expression in state.deferred
+        ]
+
+    def term_prefilter_value_tokens(self, value: SigmaString) -> List[str]:
+        """
+        Tokens of a string value that are delimited by breakers or by the value boundaries. Tokens
+        adjacent to wildcards are ignored, because they could be part of a longer token. In the
+        term mode, only whole terms delimited by major breakers inside the value are used.
+        """
+        if self.term_prefilters == "term":
+            return [
+                segment
+                for part in value.s
+                if isinstance(part, str)
+                for segment in self.term_prefilter_major_breakers.split(part)[1:-1]
+                if len(segment) >= self.term_prefilter_min_length
+                and self.term_prefilter_term_pattern.fullmatch(segment)
+            ]
+        tokens = []
+        parts = value.s
+        for i, part in enumerate(parts):
+            if not isinstance(part, str):
+                continue
+            segments = self.term_prefilter_breakers.split(part)
+            for j, segment in enumerate(segments):
+                delimited_left = j > 0 or i == 0
+                delimited_right = j < len(segments) - 1 or i == len(parts) - 1
+                if (
+                    delimited_left
+                    and delimited_right
+                    and len(segment) >= self.term_prefilter_min_length
+                    and self.term_prefilter_token_pattern.fullmatch(segment)
+                    and segment not in self.term_prefilter_operators
+                ):
+                    tokens.append(segment)
+        return tokens
+
+    def term_prefilter_tokens(self, cond: ConditionItem) -> Dict[str, str]:
+        """
+        Tokens that are contained in every event matched by the condition, keyed by their lower
+        case form because the lexicon is case-insensitive. Keywords are already searched in the
+        lexicon and are not used.
+        """
+        if isinstance(cond, ConditionAND):
+            tokens = {}
+            for arg in cond.args:
+                for key, token in self.term_prefilter_tokens(arg).items():
+                    tokens.setdefault(key, token)
+            return tokens
+        elif isinstance(cond, ConditionOR):
+            tokens = self.term_prefilter_tokens(cond.args[0])
+            for arg in cond.args[1:]:
+                arg_tokens = self.term_prefilter_tokens(arg)
+                tokens = {
+                    key: token for key, token in tokens.items() if key in arg_tokens
+                }
+            return tokens
+        elif (
+            isinstance(cond, ConditionFieldEqualsValueExpression)
+            and cond.field is not None
+            and cond.field not in self.metadata_fields
+            and isinstance(cond.value, SigmaString)
+        ):
+            return {
+                token.lower(): token
+                for token in self.term_prefilter_value_tokens(cond.value)
+            }
+        return {}
+
+    def term_prefilter(self, rule: SigmaRule, index: int, output_format: str) -> str:
+        """Prefilter keywords for the query generated from the condition with the given index."""
+        if (
+            self.term_prefilters is None
+            or output_format not in self.term_prefilter_formats
+        ):
+            return ""
+        tokens = list(
+            self.term_prefilter_tokens(
+                rule.detection.parsed_condition[index].parsed
+            ).values()
+        )
+        # Longer tokens are rarer and so prune more buckets.
+        selected = sorted(tokens, key=len, reverse=True)[
+            : self.term_prefilter_max_tokens
+        ]
+        return " ".join(
+            self.term_prefilter_modes[self.term_prefilters].format(token=token)
+            for token in tokens
+            if token in selected
+        )
+
     def finalize_query(
         self,
         rule: SigmaRule,
@@ -284,30 +1138,51 @@ class KhulnasoftBackend(TextQueryBackend):
         state: ConversionState,
         output_format: str,
     ) -> Union[str, DeferredQueryExpression]:
+        if output_format == "columnar":
+            # The matcher is compiled from the condition, the SPL query isn't used.
+            return Backend.finalize_query(
+                self, rule, query, index, state, output_format
+            )
+        if output_format == "consolidated_savedsearches" and state.has_deferred():
+            # Deferred expressions are pipelined after the main search and can't be consolidated.
+            output_format = "savedsearches"
+        if output_format in self.data_model_formats:
+            # Deferred expressions filter the aggregated rows after the tstats command instead of
+            # being appended to the query, see finalize_query_data_model.
+            if state.has_deferred():
+                self.merge_deferred_regular_expressions(state)
+                self.order_deferred_expressions(state)
+            return Backend.finalize_query(
+                self, rule, query, index, state, output_format
+            )
+
+        prefilter = self.term_prefilter(rule, index, output_format)
 
         if state.has_deferred():
-            deferred_regex_or_expressions = []
-            no_regex_oring_deferred_expressions = []
+            self.merge_deferred_regular_expressions(state)
+            self.order_deferred_expressions(state)
+            deferred_or_expressions = []
+            no_oring_deferred_expressions = []
 
-            for index, deferred_expression in enumerate(state.deferred):
+            for deferred_expression in state.deferred:
 
-                if type(deferred_expression) == KhulnasoftDeferredORRegularExpression:
-                    deferred_regex_or_expressions.append(
+                if isinstance(deferred_expression, KhulnasoftDeferredORExpression):
+                    deferred_or_expressions.append(
                         deferred_expression.finalize_expression()
                     )
                 else:
-                    no_regex_oring_deferred_expressions.append(deferred_expression)
+                    no_oring_deferred_expressions.append(deferred_expression)
 
-            if len(deferred_regex_or_expressions) > 0:
-                KhulnasoftDeferredORRegularExpression.reset()  # need to reset class for potential future conversions
-                # remove deferred oring regex expressions from the state
+            if len(deferred_or_expressions) > 0:
+                # remove deferred oring expressions from the state
                 # as they will be taken into account by the super().finalize_query
-                state.deferred = no_regex_oring_deferred_expressions
+                state.deferred = no_oring_deferred_expressions
 
                 return super().finalize_query(
                     rule,
-                    self.deferred_start
-                    + self.deferred_separator.join(deferred_regex_or_expressions)
+                    prefilter
+                    + self.deferred_start
+                    + self.deferred_separator.join(deferred_or_expressions)
                     + "\n| search "
                     + query,
                     index,
@@ -315,82 +1190,480 @@ class KhulnasoftBackend(TextQueryBackend):
                     output_format,
                 )
 
+        if prefilter:
+            if isinstance(query, DeferredQueryExpression) or not query:
+                query = prefilter
+            else:
+                query = prefilter + self.token_separator + query
         return super().finalize_query(rule, query, index, state, output_format)
 
     def finalize_query_default(
         self, rule: SigmaRule, query: str, index: int, state: ConversionState
     ) -> str:
+        query = self.default_query(rule, query)
+        self.check_query_cost(rule, query, index, state)
+        return query
+
+    @staticmethod
+    def default_query(rule: SigmaRule, query: str) -> str:
         table_fields = " | table " + ",".join(rule.fields) if rule.fields else ""
         return query + table_fields
 
-    def finalize_query_savedsearches(
+    def finalize_query_explain(
         self, rule: SigmaRule, query: str, index: int, state: ConversionState
-    ) -> str:
-        clean_title = rule.title.translate(
+    ) -> Dict[str, Any]:
+        return self.query_cost(rule, self.default_query(rule, query), index, state)
+
+    def finalize_output_explain(
+        self, queries: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        return queries
+
+    def finalize_query_columnar(
+        self, rule: SigmaRule, query: str, index: int, state: ConversionState
+    ) -> "sigma.backends.khulnasoft.columnar.ColumnarMatcher":
+        from sigma.backends.khulnasoft.columnar import ColumnarMatcher
+
+        return ColumnarMatcher.from_rule(rule, index)
+
+    def finalize_output_columnar(
+        self, queries: List["sigma.backends.khulnasoft.columnar.ColumnarMatcher"]
+    ) -> List["sigma.backends.khulnasoft.columnar.ColumnarMatcher"]:
+        return queries
+
+    @classmethod
+    def condition_nodes(cls, cond: ConditionItem) -> Iterable[ConditionItem]:
+        """All nodes of a condition tree in depth-first order."""
+        yield cond
+        for arg in getattr(cond, "args", []):
+            yield from cls.condition_nodes(arg)
+
+    @staticmethod
+    def query_commands(query: str) -> List[str]:
+        """Split a query at the pipes that are not part of a quoted string or a subsearch."""
+        commands = []
+        start = 0
+        depth = 0
+        quoted = False
+        escaped = False
+        for i, c in enumerate(query):
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                quoted = not quoted
+            elif quoted:
+                continue
+            elif c == "[":
+                depth += 1
+            elif c == "]":
+                depth -= 1
+            elif c == "|" and depth == 0:
+                commands.append(query[start:i])
+                start = i + 1
+        commands.append(query[start:])
+        commands = [command.strip() for command in commands]
+        if commands[0]:  # the query starts with an implicit search command
+            commands[0] = "search " + commands[0]
+        return [command for command in commands if command]
+
+    def query_stages(self, query: str) -> List[Dict[str, str]]:
+        """Commands of a query and whether they run on the indexers or on the search head."""
+        stages = []
+        location = "indexer"
+        for command in self.query_commands(query):
+            name = "macro" if command.startswith("`") else command.split(None, 1)[0]
+            if name in self.reporting_commands:
+                stages.append({"command": name, "location": location})
+                location = "search_head"
+                continue
+            if name not in self.distributable_commands:
+                location = "search_head"
+            stages.append({"command": name, "location": location})
+        return stages
+
+    def query_cost(
+        self, rule: SigmaRule, query: str, index: int, state: ConversionState
+    ) -> Dict[str, Any]:
+        """
+        Static cost estimate of a query. Each finding of an expensive construct adds the weight of
+        its check from query_cost_weights to the score.
+        """
+        findings = []
+
+        def finding(check: str, message: str) -> None:
+            findings.append(
+                {
+                    "check": check,
+                    "message": message,
+                    "cost": self.query_cost_weights[check],
+                }
+            )
+
+        condition = rule.detection.parsed_condition[index].parsed
+        for node in self.condition_nodes(condition):
+            if (
+                isinstance(
+                    node,
+                    (ConditionFieldEqualsValueExpression, ConditionValueExpression),
+                )
+                and isinstance(node.value, SigmaString)
+                and (
+                    node.value.startswith(SpecialChars.WILDCARD_MULTI)
+                    or node.value.startswith(SpecialChars.WILDCARD_SINGLE)
+                )
+            ):
+                finding(
+                    "leading_wildcard",
+                    f"Leading wildcard in {getattr(node, 'field', None) or 'keyword'} value {node.value}",
+                )
+            elif (
+                isinstance(node, ConditionOR)
+                and len(node.args) > self.query_cost_large_in_list
+                and all(
+                    isinstance(arg, ConditionFieldEqualsValueExpression)
+                    and arg.field == node.args[0].field
+                    for arg in node.args
+                )
+            ):
+                finding(
+                    "large_in_list",
+                    f"{len(node.args)} values of {node.args[0].field} in one list",
+                )
+
+        for deferred_expression in state.deferred:
+            if (
+                isinstance(deferred_expression, KhulnasoftDeferredRegularExpression)
+                and deferred_expression.field == deferred_expression.default_field
+            ):
+                finding(
+                    "raw_regex",
+                    f"Regular expression on {deferred_expression.default_field}",
+                )
+
+        conjuncts = self.conjuncts(condition)
+        if all(isinstance(conjunct, ConditionNOT) for conjunct in conjuncts):
+            finding("not_only", "Search consists of negated conditions only")
+        if not any(
+            set(self.referenced_fields(conjunct)) & self.query_cost_scope_fields
+            for conjunct in conjuncts
+        ):
+            finding(
+                "unscoped",
+                "Search isn't restricted by "
+                + ", ".join(sorted(self.query_cost_scope_fields)),
+            )
+
+        # OR'd regular expressions were already prepended to the query as rex and eval commands.
+        for command in self.query_commands(query):
+            if command.startswith("rex "):
+                field = re.match(r"rex field=(\S+)", command)
+                field = field.group(1) if field else "_raw"
+                finding(
+                    "or_regex_eval",
+                    f"OR'd regular expression on {field} evaluated per event with rex and eval",
+                )
+                if field == KhulnasoftDeferredRegularExpression.default_field:
+                    finding("raw_regex", f"Regular expression on {field}")
+
+        stages = self.query_stages(query)
+        for stage in stages:
+            if stage["location"] == "search_head":
+                finding(
+                    "search_head_stage",
+                    f"{stage['command']} runs on the search head",
+                )
+
+        score = sum(finding["cost"] for finding in findings)
+        return {
+            "rule": str(rule.id) if rule.id else rule.title,
+            "title": rule.title,
+            "query": query,
+            "score": score,
+            "exceeds_threshold": self.cost_threshold is not None
+            and score > self.cost_threshold,
+            "findings": findings,
+            "stages": stages,
+        }
+
+    def check_query_cost(
+        self, rule: SigmaRule, query: str, index: int, state: ConversionState
+    ) -> Optional[Dict[str, Any]]:
+        """Estimate the query cost if required and fail the conversion if it exceeds the cost threshold."""
+        if self.cost_threshold is None and not self.cost_metadata:
+            return None
+        cost = self.query_cost(rule, query, index, state)
+        if cost["exceeds_threshold"]:
+            raise SigmaConversionError(
+                f"Query cost {cost['score']} exceeds threshold {self.cost_threshold}: "
+                + "; ".join(finding["message"] for finding in cost["findings"])
+            )
+        return cost
+
+    @staticmethod
+    def savedsearches_stanza_title(rule: SigmaRule) -> str:
+        """Stanza name of a rule in savedsearches.conf."""
+        return rule.title.translate(
             {ord(c): None for c in "[]"}
         )  # remove brackets from title
+
+    def savedsearches_stanza(
+        self,
+        rule: SigmaRule,
+        search: str,
+        title: Optional[str] = None,
+        settings: Dict[str, str] = {},
+        comments: List[str] = [],
+    ) -> str:
         query_settings = self.query_settings(rule)
+        query_settings.update(settings)
         query_settings["description"] = (
             rule.description.strip() if rule.description else ""
         )
-        query_settings["search"] = query + (
-            "\n| table " + ",".join(rule.fields) if rule.fields else ""
+        query_settings["search"] = search
+
+        return (
+            f"\n[{title or self.savedsearches_stanza_title(rule)}]"
+            + "".join(f"\n# {comment}" for comment in comments)
+            + self._generate_settings(query_settings)
+        )
+
+    def finalize_query_savedsearches(
+        self, rule: SigmaRule, query: str, index: int, state: ConversionState
+    ) -> str:
+        search = query + ("\n| table " + ",".join(rule.fields) if rule.fields else "")
+        cost = self.check_query_cost(rule, search, index, state)
+        return self.savedsearches_stanza(
+            rule,
+            search,
+            comments=(
+                [
+                    f"cost.score = {cost['score']}",
+                    "cost.findings = "
+                    + ", ".join(
+                        dict.fromkeys(finding["check"] for finding in cost["findings"])
+                    ),
+                    "cost.search_head_stages = "
+                    + ", ".join(
+                        stage["command"]
+                        for stage in cost["stages"]
+                        if stage["location"] == "search_head"
+                    ),
+                ]
+                if self.cost_metadata
+                else []
+            ),
         )
 
-        return f"\n[{clean_title}]" + self._generate_settings(query_settings)
+    def conjuncts(self, cond: ConditionItem) -> List[ConditionItem]:
+        """Flatten nested AND conditions."""
+        if isinstance(cond, ConditionAND):
+            return [conjunct for arg in cond.args for conjunct in self.conjuncts(arg)]
+        return [cond]
+
+    def is_scope_condition(self, cond: ConditionItem) -> bool:
+        """Check if a condition only restricts metadata fields, like source conditions added by processing pipelines."""
+        fields = self.referenced_fields(cond)
+        return bool(fields) and all(field in self.metadata_fields for field in fields)
+
+    def finalize_query_consolidated_savedsearches(
+        self, rule: SigmaRule, query: str, index: int, state: ConversionState
+    ) -> Dict[str, Any]:
+        """
+        Split the query of a rule into its scope, the top-level conditions on metadata fields, and
+        the remaining rule query. Rules with the same scope are consolidated into one search.
+        """
+        scope = []
+        rule_query = []
+        for conjunct in self.conjuncts(rule.detection.parsed_condition[index].parsed):
+            converted = self.convert_condition(
+                conjunct,
+                ConversionState(processing_state=dict(state.processing_state)),
+            )
+            if self.is_scope_condition(conjunct):
+                scope.append(converted)
+            else:
+                rule_query.append(converted)
+        return {
+            "scope": self.token_separator.join(scope),
+            "query": self.token_separator.join(rule_query) or "*",
+            "rule": str(rule.id) if rule.id else rule.title,
+            "title": rule.title,
+        }
+
+    def finalize_output_consolidated_savedsearches(
+        self, queries: List[Union[str, Dict[str, Any]]]
+    ) -> str:
+        """
+        Emit one stanza per scope that matches the OR of the queries of all rules in the scope. The
+        rule_id field of each event contains the rules whose query matched the event.
+        """
+        stanzas = []
+        for item in self.group_batches(queries, "scope"):
+            if isinstance(item, str):
+                stanzas.append(item)
+                continue
+            scope = item[0]["scope"]
+            title = "Consolidated search " + (scope or "all events")
+            search = (
+                (scope + self.token_separator if scope else "")
+                + f" {self.or_token} ".join(f"({query['query']})" for query in item)
+                + "\n| eval rule_id="
+                + self.rule_tags_expression(item)
+            )
+            stanzas.append(
+                f"\n[{title.translate({ord(c): None for c in '[]'})}]"
+                + self._generate_settings(
+                    {
+                        "description": "Rules: "
+                        + ", ".join(query["title"] for query in item),
+                        "search": search,
+                    }
+                )
+            )
+        return self.finalize_output_savedsearches(stanzas)
+
+    def savedsearches_header(self) -> str:
+        """savedsearches.conf content preceding the rule stanzas."""
+        return f"\n[default]" + self._generate_settings(self.output_settings) + "\n"
 
     def finalize_output_savedsearches(self, queries: List[str]) -> str:
-        return (
-            f"\n[default]"
-            + self._generate_settings(self.output_settings)
-            + "\n"
-            + "\n".join(queries)
+        return self.savedsearches_header() + "\n".join(queries)
+
+    def data_model_filters(
+        self, query: Union[str, DeferredQueryExpression], state: ConversionState
+    ) -> Tuple[str, str]:
+        """
+        Split a query into the where clause of the tstats command and the pipeline that filters the
+        aggregated rows with the deferred expressions. If deferred expressions are part of an OR
+        condition, the whole condition is evaluated on the aggregated rows.
+        """
+        if isinstance(query, DeferredQueryExpression):
+            query = ""
+        if not state.has_deferred():
+            return query, ""
+        for deferred_expression in state.deferred:
+            if deferred_expression.field == deferred_expression.default_field:
+                raise SigmaFeatureNotSupportedByBackendError(
+                    "Regular expression and CIDR matching without field name is not supported by data model queries"
+                )
+
+        stages = [
+            deferred_expression.finalize_data_model_expression()
+            for deferred_expression in state.deferred
+            if isinstance(deferred_expression, KhulnasoftDeferredORExpression)
+        ]
+        if stages:
+            stages.append("search " + query)
+            query = ""
+        stages.extend(
+            deferred_expression.finalize_data_model_expression()
+            for deferred_expression in state.deferred
+            if not isinstance(deferred_expression, KhulnasoftDeferredORExpression)
         )
+        return query, self.deferred_start + self.deferred_separator.join(stages)
+
+    @classmethod
+    def referenced_fields(cls, cond: ConditionItem) -> List[str]:
+        """Names of all fields referenced by a condition in order of their appearance."""
+        if isinstance(cond, ConditionFieldEqualsValueExpression):
+            return [cond.field]
+        return [
+            field
+            for arg in getattr(cond, "args", [])
+            for field in cls.referenced_fields(arg)
+        ]
+
+    def data_model_group_by_fields(
+        self, rule: SigmaRule, index: int, data_set: str, data_model_fields: List[str]
+    ) -> List[str]:
+        """
+        Fields of the tstats by clause: the data model fields referenced by the rule condition and
+        the rule fields list plus the identity fields. Grouping by other fields only inflates the
+        number of aggregated rows.
+        """
+        required = set(
+            self.referenced_fields(rule.detection.parsed_condition[index].parsed)
+        )
+        required.update(rule.fields)
+        required.update(
+            field if "." in field else f"{data_set}.{field}"
+            for field in self.data_model_identity_fields
+        )
+        required.discard(None)
+        fields = [field for field in data_model_fields if field in required]
+        return fields + sorted(required.difference(fields))
 
     def finalize_query_data_model(
-        self, rule: SigmaRule, query: str, index: int, state: ConversionState
+        self,
+        rule: SigmaRule,
+        query: Union[str, DeferredQueryExpression],
+        index: int,
+        state: ConversionState,
     ) -> str:
-        data_model = None
-        data_set = None
-        cim_fields = None
-        if rule.logsource.product and rule.logsource.category:
-            if rule.logsource.product == "windows":
-                if rule.logsource.category == "process_creation":
-                    data_model = "Endpoint"
-                    data_set = "Processes"
-                    cim_fields = " ".join(
-                        khulnasoft_sysmon_process_creation_cim_mapping.values()
-                    )
-                elif rule.logsource.category in [
-                    "registry_add",
-                    "registry_delete",
-                    "registry_event",
-                    "registry_set",
-                ]:
-                    data_model = "Endpoint"
-                    data_set = "Registry"
-                    cim_fields = " ".join(
-                        khulnasoft_windows_registry_cim_mapping.values()
-                    )
-                elif rule.logsource.category == "file_event":
-                    data_model = "Endpoint"
-                    data_set = "Filesystem"
-                    cim_fields = " ".join(
-                        khulnasoft_windows_file_event_cim_mapping.values()
-                    )
-            elif rule.logsource.product == "linux":
-                if rule.logsource.category == "process_creation":
-                    data_model = "Endpoint"
-                    data_set = "Processes"
-                    cim_fields = " ".join(
-                        khulnasoft_sysmon_process_creation_cim_mapping.values()
-                    )
+        return self.data_model_query(
+            rule, query, index, state, self.data_model_summariesonly
+        )
+
+    def finalize_query_data_model_savedsearches(
+        self,
+        rule: SigmaRule,
+        query: Union[str, DeferredQueryExpression],
+        index: int,
+        state: ConversionState,
+    ) -> str:
+        return self.data_model_savedsearches_stanzas(
+            rule,
+            lambda summariesonly: self.data_model_query(
+                rule, query, index, state, summariesonly
+            ),
+        )
+
+    def data_model_savedsearches_stanzas(
+        self,
+        rule: Union[SigmaRule, SigmaCorrelationRule],
+        search: Callable[[bool], str],
+    ) -> str:
+        """
+        Stanza with the tstats search returned by search(summariesonly). With summariesonly and an
+        acceleration lag, the search only covers the time range that is already summarized and is
+        paired with a fallback stanza that searches the not yet summarized time range without
+        summariesonly.
+        """
+        if not (self.data_model_summariesonly and self.data_model_acceleration_lag):
+            return self.savedsearches_stanza(
+                rule, search(self.data_model_summariesonly)
+            )
+        return (
+            self.savedsearches_stanza(
+                rule,
+                search(True),
+                settings={"dispatch.latest_time": self.data_model_acceleration_lag},
+            )
+            + "\n"
+            + self.savedsearches_stanza(
+                rule,
+                search(False),
+                title=self.savedsearches_stanza_title(rule) + " - Fallback",
+                settings={
+                    "dispatch.earliest_time": self.data_model_acceleration_lag,
+                    "dispatch.latest_time": "now",
+                },
+            )
+        )
 
-        elif rule.logsource.category == "proxy":
-            data_model = "Web"
-            data_set = "Proxy"
-            cim_fields = " ".join(khulnasoft_web_proxy_cim_mapping.values())
+    def finalize_output_data_model_savedsearches(self, queries: List[str]) -> str:
+        return self.finalize_output_savedsearches(queries)
 
+    def data_model_source(
+        self, rule: SigmaRule, index: int, state: ConversionState
+    ) -> Tuple[str, str, List[str]]:
+        """
+        Data model set, data set and group by fields of a data model query. The data set is the
+        object whose name prefixes the fields, which is the root object of the data model for
+        child data sets like Web.Proxy (Web.url).
+        """
         try:
             data_model_set = state.processing_state["data_model_set"]
         except KeyError:
@@ -406,13 +1679,48 @@ class KhulnasoftBackend(TextQueryBackend):
             )
 
         try:
-            fields = " ".join(state.processing_state["fields"])
+            data_model_fields = list(state.processing_state["fields"])
         except KeyError:
             raise SigmaFeatureNotSupportedByBackendError(
                 "No fields specified by processing pipeline"
             )
+        prefixes = {field.split(".")[0] for field in data_model_fields if "." in field}
+        if len(prefixes) == 1:
+            data_set = prefixes.pop()
+        fields = self.data_model_group_by_fields(
+            rule, index, data_set, data_model_fields
+        )
+
+        return data_model_set, data_set, fields
 
-        return f"""| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel={data_model_set} where {query} by {fields}
+    def data_model_query(
+        self,
+        rule: SigmaRule,
+        query: Union[str, DeferredQueryExpression],
+        index: int,
+        state: ConversionState,
+        summariesonly: bool,
+    ) -> str:
+        data_model_set, data_set, fields = self.data_model_source(rule, index, state)
+        query, filters = self.data_model_filters(query, state)
+        return self.tstats_search(
+            data_model_set, data_set, query, fields, summariesonly, filters
+        )
+
+    def tstats_search(
+        self,
+        data_model_set: str,
+        data_set: str,
+        query: str,
+        fields: List[str],
+        summariesonly: bool,
+        filters: str = "",
+    ) -> str:
+        where = f" where {query}" if query else ""
+        fields = " ".join(fields)
+        summariesonly = "true" if summariesonly else "false"
+
+        return f"""| tstats summariesonly={summariesonly} allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel={data_model_set}{where} by {fields}{filters}
 | `drop_dm_object_name({data_set})`
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
@@ -422,3 +1730,453 @@ class KhulnasoftBackend(TextQueryBackend):
 
     def finalize_output_data_model(self, queries: List[str]) -> List[str]:
         return queries
+
+    def finalize_query_data_model_batch(
+        self,
+        rule: SigmaRule,
+        query: Union[str, DeferredQueryExpression],
+        index: int,
+        state: ConversionState,
+    ) -> Union[str, Dict[str, Any]]:
+        """
+        Collect the predicate of a rule for a batched tstats search of its data model. Rules with
+        regular expression or CIDR matching filter the aggregated rows of their own search and are
+        not batched.
+        """
+        if state.has_deferred():
+            return self.finalize_query_data_model(rule, query, index, state)
+        data_model_set, data_set, fields = self.data_model_source(rule, index, state)
+        return {
+            "data_model_set": data_model_set,
+            "data_set": data_set,
+            "fields": fields,
+            "query": query,
+            "rule": str(rule.id) if rule.id else rule.title,
+        }
+
+    @staticmethod
+    def eval_string(value: str) -> str:
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+    def finalize_output_data_model_batch(
+        self, queries: List[Union[str, Dict[str, Any]]]
+    ) -> List[str]:
+        """
+        Emit one tstats search per data model set that matches the OR of the predicates of all its
+        rules. The rule_id field of each row contains the rules whose predicate matched the row.
+        """
+        return [
+            search
+            for item in self.group_batches(queries, "data_model_set")
+            for search in (
+                [item]
+                if isinstance(item, str)
+                else self.data_model_batch_searches(item)
+            )
+        ]
+
+    @staticmethod
+    def group_batches(
+        queries: List[Union[str, Dict[str, Any]]], key: str
+    ) -> List[Union[str, List[Dict[str, Any]]]]:
+        """
+        Group batchable queries by the given key. Queries that can't be batched are kept as they
+        are. Batches are placed at the position of their first query.
+        """
+        items: List[Union[str, List[Dict[str, Any]]]] = []
+        batches: Dict[Any, List[Dict[str, Any]]] = {}
+        for query in queries:
+            if isinstance(query, str):
+                items.append(query)
+            elif query[key] in batches:
+                batches[query[key]].append(query)
+            else:
+                batches[query[key]] = [query]
+                items.append(batches[query[key]])
+        return items
+
+    def rule_tags_expression(self, batch: List[Dict[str, Any]]) -> str:
+        """eval expression with the identifiers of all rules of the batch whose query matches."""
+        return "mvappend({})".format(
+            ", ".join(
+                f"if(searchmatch({self.eval_string(query['query'])}), {self.eval_string(query['rule'])}, null())"
+                for query in batch
+            )
+        )
+
+    def data_model_batch_searches(self, batch: List[Dict[str, Any]]) -> List[str]:
+        """tstats searches of the rules of one data model set with at most data_model_batch_size rules each."""
+        searches = []
+        size = self.data_model_batch_size or len(batch)
+        for start in range(0, len(batch), size):
+            chunk = batch[start : start + size]
+            fields = []
+            for query in chunk:
+                fields += [field for field in query["fields"] if field not in fields]
+            searches.append(
+                self.tstats_search(
+                    chunk[0]["data_model_set"],
+                    chunk[0]["data_set"],
+                    " OR ".join(f"({query['query']})" for query in chunk),
+                    fields,
+                    self.data_model_summariesonly,
+                    "\n| eval rule_id=" + self.rule_tags_expression(chunk),
+                )
+            )
+        return searches
+
+    def convert_correlation_rule(
+        self,
+        rule: SigmaCorrelationRule,
+        output_format: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> List[Any]:
+        if output_format in self.correlation_unsupported_formats:
+            raise SigmaFeatureNotSupportedByBackendError(
+                f"Correlation rules are not supported by the {output_format} output format"
+            )
+        return super().convert_correlation_rule(rule, output_format, method)
+
+    def convert_correlation_event_count_rule(
+        self,
+        rule: SigmaCorrelationRule,
+        output_format: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> List[str]:
+        if output_format in self.data_model_formats:
+            return self.convert_correlation_data_model_rule(
+                rule, "event_count", output_format, method
+            )
+        return super().convert_correlation_event_count_rule(rule, output_format, method)
+
+    def convert_correlation_value_count_rule(
+        self,
+        rule: SigmaCorrelationRule,
+        output_format: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> List[str]:
+        if output_format in self.data_model_formats:
+            return self.convert_correlation_data_model_rule(
+                rule, "value_count", output_format, method
+            )
+        return super().convert_correlation_value_count_rule(rule, output_format, method)
+
+    def convert_correlation_temporal_rule(
+        self,
+        rule: SigmaCorrelationRule,
+        output_format: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> List[str]:
+        if output_format in self.data_model_formats:
+            return self.convert_correlation_data_model_rule(
+                rule, "temporal", output_format, method
+            )
+        return super().convert_correlation_temporal_rule(rule, output_format, method)
+
+    def correlation_search_fields(self, rule: SigmaCorrelationRule) -> List[str]:
+        """Fields of the correlation search that are used by the aggregation."""
+        fields = ["_time", "event_type"]
+        fields += rule.group_by or []
+        fields += [alias.alias for alias in rule.aliases]
+        if rule.condition.fieldref:
+            fields.append(rule.condition.fieldref)
+        return list(
+            dict.fromkeys(self.escape_and_quote_field(field) for field in fields)
+        )
+
+    def convert_correlation_search(self, rule: SigmaCorrelationRule, **kwargs) -> str:
+        if (
+            len(rule.rules) == 1
+            and len(rule.rules[0].rule.get_conversion_result()) == 1
+        ):
+            return super().convert_correlation_search(rule, **kwargs)
+        projection = self.correlation_search_projection_expression.format(
+            fields=" ".join(self.correlation_search_fields(rule))
+        )
+        return self.correlation_search_multi_rule_expression.format(
+            queries=self.correlation_search_multi_rule_query_expression_joiner.join(
+                self.correlation_search_multi_rule_query_expression.format(
+                    rule=rule_reference.rule,
+                    ruleid=rule_reference.rule.name or rule_reference.rule.id,
+                    query=self.convert_correlation_search_multi_rule_query_postprocess(
+                        query
+                    ),
+                    normalization=self.convert_correlation_search_field_normalization_expression(
+                        rule.aliases, rule_reference
+                    ),
+                    projection=projection,
+                )
+                for rule_reference in rule.rules
+                for query in rule_reference.rule.get_conversion_result()
+            ),
+            **kwargs,
+        )
+
+    def convert_correlation_temporal_ordered_rule(
+        self,
+        rule: SigmaCorrelationRule,
+        output_format: Optional[str] = None,
+        method: Optional[str] = None,
+    ) -> List[str]:
+        if output_format in self.data_model_formats:
+            # tstats aggregates events into time buckets and loses the order of the events.
+            raise SigmaFeatureNotSupportedByBackendError(
+                "Ordered temporal correlations are not supported by data model output formats"
+            )
+        return super().convert_correlation_temporal_ordered_rule(
+            rule, output_format, method
+        )
+
+    def convert_correlation_aggregation_from_template(
+        self,
+        rule: SigmaCorrelationRule,
+        correlation_type: SigmaCorrelationTypeLiteral,
+        method: str,
+    ) -> str:
+        if correlation_type != "temporal_ordered":
+            return super().convert_correlation_aggregation_from_template(
+                rule, correlation_type, method
+            )
+        groupby = self.convert_correlation_aggregation_groupby_from_template(
+            rule.group_by, method
+        )
+        return self.temporal_ordered_aggregation_expression[method].format(
+            timespan=self.convert_timespan(rule.timespan, method),
+            groupby=groupby,
+            steps="\n".join(
+                self.temporal_ordered_step_expression[method].format(
+                    ruleid=rule_reference.rule.name or rule_reference.rule.id,
+                    after=(
+                        self.temporal_ordered_step_after_expression[method].format(
+                            previous=step - 1
+                        )
+                        if step > 1
+                        else ""
+                    ),
+                    step=step,
+                    groupby=groupby,
+                )
+                for step, rule_reference in enumerate(rule.rules, 1)
+            ),
+            step_times=", ".join(
+                f"step_time_{step}" for step in range(1, len(rule.rules) + 1)
+            ),
+        )
+
+    def convert_correlation_data_model_rule(
+        self,
+        rule: SigmaCorrelationRule,
+        correlation_type: SigmaCorrelationTypeLiteral,
+        output_format: str,
+        method: str,
+    ) -> List[str]:
+        """
+        Correlation rules in data model output formats aggregate the data models of their rules with
+        tstats in buckets of the timespan instead of searching the raw events.
+        """
+        if method != "stats":
+            raise SigmaFeatureNotSupportedByBackendError(
+                f"Correlation method '{method}' is not supported by data model output formats"
+            )
+        search = lambda summariesonly: self.data_model_correlation_query(
+            rule, correlation_type, output_format, summariesonly
+        )
+        if output_format == "data_model_savedsearches":
+            return [self.data_model_savedsearches_stanzas(rule, search)]
+        return [search(self.data_model_summariesonly)]
+
+    def data_model_correlation_field(
+        self,
+        rule: SigmaCorrelationRule,
+        rule_reference: SigmaRuleReference,
+        field: str,
+        data_set: str,
+        state: ConversionState,
+    ) -> Tuple[str, str]:
+        """
+        Data model field of a correlation rule field (group-by field, value count field or alias) in
+        a referenced rule and the name of the field in the aggregated rows.
+        """
+        alias = rule.aliases.aliases.get(field)
+        if alias is not None:
+            field = next(
+                (
+                    alias_field
+                    for alias_reference, alias_field in alias.mapping.items()
+                    if alias_reference == rule_reference
+                ),
+                field,
+            )
+        field = state.processing_state.get("field_mapping", {}).get(field, field)
+        if "." not in field:
+            field = f"{data_set}.{field}"
+        if alias is not None:
+            return field, alias.alias
+        return field, self.drop_data_set(field, data_set)
+
+    @staticmethod
+    def drop_data_set(field: str, data_set: str) -> str:
+        """Field name after drop_dm_object_name(data_set)."""
+        return field[len(data_set) + 1 :] if field.startswith(data_set + ".") else field
+
+    def data_model_correlation_sources(
+        self,
+        rule: SigmaCorrelationRule,
+        rule_reference: SigmaRuleReference,
+        output_format: str,
+        fields: List[str],
+    ) -> List[Dict[str, Any]]:
+        """
+        Data model, where clause and row filters of all queries of a rule referenced by a correlation
+        rule together with the data model fields of the correlation fields.
+        """
+        base_rule = rule_reference.rule
+        if not isinstance(base_rule, SigmaRule):
+            raise SigmaFeatureNotSupportedByBackendError(
+                "Correlation rules referring to correlation rules are not supported by data model output formats"
+            )
+        try:
+            states = base_rule.get_conversion_states()
+        except SigmaConversionError:  # conversion result was taken from the query cache
+            Backend.convert_rule(self, base_rule, output_format)
+            states = base_rule.get_conversion_states()
+
+        sources = []
+        for index, condition in enumerate(base_rule.detection.parsed_condition):
+            state = ConversionState(
+                processing_state=dict(states[index].processing_state)
+            )
+            data_model_set, data_set, _ = self.data_model_source(
+                base_rule, index, state
+            )
+            query = self.convert_condition(condition.parsed, state)
+            if state.has_deferred():
+                self.merge_deferred_regular_expressions(state)
+            query, filters = self.data_model_filters(query, state)
+            sources.append(
+                {
+                    "data_model_set": data_model_set,
+                    "data_set": data_set,
+                    "query": query,
+                    "filters": filters,
+                    # Row filters are evaluated on the fields referenced by the rule.
+                    "filter_fields": (
+                        self.referenced_fields(condition.parsed) if filters else []
+                    ),
+                    "fields": {
+                        field: self.data_model_correlation_field(
+                            rule, rule_reference, field, data_set, state
+                        )
+                        for field in fields
+                    },
+                    "rule": base_rule.name or str(base_rule.id),
+                }
+            )
+        return sources
+
+    def data_model_correlation_tstats(
+        self,
+        source: Dict[str, Any],
+        aggregation: str,
+        fields: List[str],
+        timespan: str,
+        summariesonly: bool,
+    ) -> List[str]:
+        """tstats command that aggregates a source by time bucket and the given correlation fields followed by the commands that filter and rename its rows."""
+        by_fields = []
+        for field in [source["fields"][field][0] for field in fields] + source[
+            "filter_fields"
+        ]:
+            if field not in by_fields:
+                by_fields.append(field)
+        where = f" where {source['query']}" if source["query"] else ""
+        summariesonly = "true" if summariesonly else "false"
+        commands = [
+            f"| tstats summariesonly={summariesonly} allow_old_summaries=true {aggregation} from datamodel={source['data_model_set']}{where} by "
+            + " ".join([f"_time span={timespan}"] + by_fields)
+            + source["filters"],
+            f"| `drop_dm_object_name({source['data_set']})`",
+        ]
+        for field, name in (source["fields"][field] for field in fields):
+            if self.drop_data_set(field, source["data_set"]) != name:
+                commands.append(
+                    f"| rename {self.drop_data_set(field, source['data_set'])} as {name}"
+                )
+        return commands
+
+    def data_model_correlation_query(
+        self,
+        rule: SigmaCorrelationRule,
+        correlation_type: SigmaCorrelationTypeLiteral,
+        output_format: str,
+        summariesonly: bool,
+    ) -> str:
+        """
+        Correlation query over the data models of the referenced rules. A single query without row
+        filters is aggregated by tstats itself. Otherwise, the event counts of all queries by time
+        bucket and correlation fields are appended and aggregated by stats.
+        """
+        timespan = self.convert_timespan(rule.timespan)
+        group_by = list(rule.group_by or [])
+        fields = group_by + (
+            [rule.condition.fieldref] if correlation_type == "value_count" else []
+        )
+        sources = [
+            source
+            for rule_reference in rule.rules
+            for source in self.data_model_correlation_sources(
+                rule, rule_reference, output_format, fields
+            )
+        ]
+        # Rows of different data sets are only merged if their fields have the same names.
+        for field in fields:
+            if len({source["fields"][field][1] for source in sources}) > 1:
+                for source in sources:
+                    source["fields"][field] = (source["fields"][field][0], field)
+        names = {field: sources[0]["fields"][field][1] for field in fields}
+        condition = self.convert_correlation_condition_from_template(
+            rule.condition, rule.rules, correlation_type, "stats"
+        )
+
+        if (
+            correlation_type != "temporal"
+            and len(sources) == 1
+            and not sources[0]["filters"]
+        ):
+            aggregation = (
+                "count as event_count"
+                if correlation_type == "event_count"
+                else f"dc({sources[0]['fields'][rule.condition.fieldref][0]}) as value_count"
+            )
+            return "\n".join(
+                self.data_model_correlation_tstats(
+                    sources[0], aggregation, group_by, timespan, summariesonly
+                )
+                + ["", condition]
+            )
+
+        searches = []
+        for source in sources:
+            commands = self.data_model_correlation_tstats(
+                source, "count", fields, timespan, summariesonly
+            )
+            if correlation_type == "temporal":
+                commands.append(f"| eval event_type={self.eval_string(source['rule'])}")
+            searches.append(commands)
+        search = "\n".join(
+            searches[0]
+            + [
+                "| append [" + " ".join(commands).replace("\n", " ") + "]"
+                for commands in searches[1:]
+            ]
+        )
+        groupby = "".join(" " + names[field] for field in group_by)
+        if correlation_type == "event_count":
+            aggregate = f"| stats sum(count) as event_count by _time{groupby}"
+        elif correlation_type == "value_count":
+            aggregate = f"| stats dc({names[rule.condition.fieldref]}) as value_count by _time{groupby}"
+        else:
+            aggregate = f"| stats dc(event_type) as event_type_count by _time{groupby}"
+        return self.default_correlation_query["stats"].format(
+            search=search, aggregate=aggregate, condition=condition
+        )
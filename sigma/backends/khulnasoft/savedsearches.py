@@ -0,0 +1,267 @@
+import os
+import re
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, TextIO, Tuple, Union
+
+import yaml
+
+from sigma.collection import SigmaCollection
+from sigma.exceptions import SigmaError, SigmaFeatureNotSupportedByBackendError
+from sigma.rule import SigmaRule
+
+from sigma.backends.khulnasoft.khulnasoft import KhulnasoftBackend
+
+stanza_header_pattern = re.compile(r"\n\[([^\n]*)\](?=\n|$)")
+
+
+def stanza_title(stanza: str) -> str:
+    """Title of a stanza as generated by finalize_query_savedsearches."""
+    return stanza_header_pattern.match(stanza).group(1)
+
+
+def strip_joiner(stanza: str) -> str:
+    """Remove the newline that joins the stanzas in finalize_output_savedsearches."""
+    return stanza[:-1] if stanza.endswith("\n") else stanza
+
+
+@dataclass
+class SavedSearchesConf:
+    """
+    Content of a savedsearches.conf file generated by the savedsearches output format: a header
+    containing the [default] stanza followed by the stanzas of the converted rules. Stanzas are
+    kept in order together with the path of the rule file they were generated from.
+    """
+
+    header: str
+    stanzas: List[Tuple[Optional[Path], str]] = field(default_factory=list)
+
+    @classmethod
+    def parse(cls, text: str) -> "SavedSearchesConf":
+        """Split savedsearches.conf content into header and stanzas. Stanza owners are unknown."""
+        # Lines of multi-line values are continued with a backslash and can't start a stanza.
+        starts = [
+            match.start()
+            for match in stanza_header_pattern.finditer(text)
+            if text[match.start() - 1 : match.start()] != "\\"
+        ]
+        if not starts or starts[0] != 0:
+            starts.insert(0, 0)
+        starts.append(len(text))
+        header_end = starts[1] if len(starts) > 2 else len(text)
+        return cls(
+            header=text[:header_end],
+            stanzas=[
+                (None, strip_joiner(text[start:end]))
+                for start, end in zip(starts[1:], starts[2:])
+            ],
+        )
+
+    def render(self) -> str:
+        """Render the same output as finalize_output_savedsearches."""
+        return self.header + "\n".join(stanza for _, stanza in self.stanzas)
+
+    def write(self, stream: TextIO) -> None:
+        """Write rendered content to a text stream without building it in memory."""
+        stream.write(self.header)
+        for i, (_, stanza) in enumerate(self.stanzas):
+            if i > 0:
+                stream.write("\n")
+            stream.write(stanza)
+
+    def replace(self, path: Path, stanzas: List[str]) -> bool:
+        """
+        Replace all stanzas generated from the rule file at path by the given stanzas. The new
+        stanzas are inserted at the position of the first replaced stanza or appended if the file
+        didn't generated stanzas before. Returns True if the content changed.
+        """
+        positions = [i for i, (owner, _) in enumerate(self.stanzas) if owner == path]
+        if [self.stanzas[i][1] for i in positions] == stanzas:
+            return False
+        position = positions[0] if positions else len(self.stanzas)
+        self.stanzas = (
+            [stanza for stanza in self.stanzas[:position] if stanza[0] != path]
+            + [(path, stanza) for stanza in stanzas]
+            + [stanza for stanza in self.stanzas[position:] if stanza[0] != path]
+        )
+        return True
+
+
+class SavedSearchesWriter:
+    """
+    Write the savedsearches output format to a text stream (e.g. a file or socket.makefile("w"))
+    while the rules are converted. The written content is identical to the output of
+    convert(rule_collection, "savedsearches"), but neither the whole output nor all stanzas are
+    kept in memory. Processing pipelines with finalizers are not supported, because finalizers
+    operate on the complete output.
+    """
+
+    def __init__(self, backend: KhulnasoftBackend, stream: TextIO):
+        if backend.processing_pipeline is not None and (
+            backend.processing_pipeline.finalizers
+        ):
+            raise SigmaFeatureNotSupportedByBackendError(
+                "Streaming savedsearches output doesn't support processing pipeline finalizers"
+            )
+        self.backend = backend
+        self.stream = stream
+        self.stanza_count = 0
+        self.stream.write(self.backend.savedsearches_header())
+
+    def write_stanza(self, stanza: str) -> None:
+        if self.stanza_count > 0:
+            self.stream.write("\n")
+        self.stream.write(stanza)
+        self.stanza_count += 1
+
+    def write(self, rule_collection: SigmaCollection) -> None:
+        """Convert all rules of the collection and write their stanzas immediately."""
+        rule_collection.resolve_rule_references()
+        for rule in rule_collection.rules:
+            for stanza in (
+                self.backend.convert_rule(rule, "savedsearches")
+                if isinstance(rule, SigmaRule)
+                else self.backend.convert_correlation_rule(rule, "savedsearches")
+            ):
+                self.write_stanza(stanza)
+
+    def write_files(
+        self, paths: Iterable[Union[str, Path]], recursion_pattern: str = "**/*.yml"
+    ) -> None:
+        """
+        Load and convert rule files one after another, so only the rules of one file are kept in
+        memory. Correlation rules can only refer to rules contained in the same file.
+        """
+        for path in sorted(SigmaCollection.resolve_paths(paths, recursion_pattern)):
+            self.write(SigmaCollection.load_ruleset([path]))
+
+
+@dataclass
+class SavedSearchesWatcher:
+    """
+    Keep a savedsearches.conf file up to date with Sigma rule files in the given paths. Each call of
+    poll() detects added, changed and removed rule files by their modification time, converts
+    only these rule files and splices the resulting stanzas into the existing savedsearches.conf.
+
+    On the first poll, stanzas of an existing savedsearches.conf are assigned to the rule files by
+    their title and only rule files that are newer than the savedsearches.conf or that are missing
+    in it are converted. The [default] stanza and stanzas that don't belong to any rule file are
+    kept.
+    """
+
+    backend: KhulnasoftBackend
+    paths: List[Union[str, Path]]
+    output: Path
+    recursion_pattern: str = "**/*.yml"
+    conf: Optional[SavedSearchesConf] = field(init=False, default=None)
+    mtimes: Dict[Path, float] = field(init=False, default_factory=dict)
+    errors: Dict[Path, Exception] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        self.output = Path(self.output)
+
+    def scan(self) -> Dict[Path, float]:
+        """Modification times of the rule files. Rule files that disappear while scanning are skipped."""
+        mtimes = dict()
+        for path in sorted(
+            SigmaCollection.resolve_paths(self.paths, self.recursion_pattern)
+        ):
+            try:
+                mtimes[path] = path.stat().st_mtime
+            except OSError:
+                continue
+        return mtimes
+
+    def load(self, mtimes: Dict[Path, float]) -> None:
+        """Load existing savedsearches.conf and mark rule files that are already contained in it as unchanged."""
+        try:
+            self.conf = SavedSearchesConf.parse(self.output.read_text(encoding="utf-8"))
+            conf_mtime = self.output.stat().st_mtime
+        except FileNotFoundError:
+            self.conf = SavedSearchesConf(
+                self.backend.finalize_output_savedsearches([])
+            )
+            return
+
+        unassigned: Dict[str, List[int]] = dict()
+        for i, (_, stanza) in enumerate(self.conf.stanzas):
+            unassigned.setdefault(stanza_title(stanza), []).append(i)
+        for path, mtime in mtimes.items():
+            try:
+                titles = [
+                    self.backend.savedsearches_stanza_title(rule)
+                    for rule in SigmaCollection.load_ruleset([path]).rules
+                    if isinstance(rule, SigmaRule)
+                ]
+            except (SigmaError, yaml.YAMLError, OSError):
+                continue
+            if all(unassigned.get(title) for title in titles):
+                for title in titles:
+                    i = unassigned[title].pop(0)
+                    self.conf.stanzas[i] = (path, self.conf.stanzas[i][1])
+                if mtime <= conf_mtime:
+                    self.mtimes[path] = mtime
+
+    def convert(self, path: Path) -> List[str]:
+        rule_collection = SigmaCollection.load_ruleset([path])
+        rule_collection.resolve_rule_references()
+        return [
+            stanza
+            for rule in rule_collection.rules
+            for stanza in (
+                self.backend.convert_rule(rule, "savedsearches")
+                if isinstance(rule, SigmaRule)
+                else self.backend.convert_correlation_rule(rule, "savedsearches")
+            )
+        ]
+
+    def poll(self) -> Dict[str, List[Path]]:
+        """
+        Process rule file changes since the last poll and rewrite savedsearches.conf if required.
+        Returns the added, changed and removed rule files. Rule files that can't be parsed or
+        converted keep their previous stanzas, the error is stored in the errors attribute. This
+        includes rule files that disappear before they are converted, they are removed by the next
+        poll.
+        """
+        mtimes = self.scan()
+        if self.conf is None:
+            self.load(mtimes)
+
+        changes = {
+            "added": [path for path in mtimes if path not in self.mtimes],
+            "changed": [
+                path
+                for path, mtime in mtimes.items()
+                if path in self.mtimes and self.mtimes[path] != mtime
+            ],
+            "removed": [path for path in self.mtimes if path not in mtimes],
+        }
+
+        modified = False
+        for path in changes["removed"]:
+            modified |= self.conf.replace(path, [])
+            del self.mtimes[path]
+            self.errors.pop(path, None)
+        for path in changes["added"] + changes["changed"]:
+            self.mtimes[path] = mtimes[path]
+            try:
+                stanzas = self.convert(path)
+            except (SigmaError, yaml.YAMLError, OSError) as e:
+                self.errors[path] = e
+                continue
+            self.errors.pop(path, None)
+            modified |= self.conf.replace(path, stanzas)
+
+        if modified or not self.output.exists():
+            self.write()
+        return changes
+
+    def write(self) -> None:
+        """Atomically replace savedsearches.conf with the current content."""
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.output.parent, prefix=self.output.name, suffix=".tmp"
+        )
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            self.conf.write(f)
+        os.replace(tmp_path, self.output)
@@ -1,11 +1,33 @@
-from .khulnasoft import (
-    khulnasoft_windows_pipeline,
-    khulnasoft_windows_sysmon_acceleration_keywords,
-    khulnasoft_cim_data_model,
-)
-
-pipelines = {
-    "khulnasoft_windows": khulnasoft_windows_pipeline,
-    "khulnasoft_sysmon_acceleration": khulnasoft_windows_sysmon_acceleration_keywords,
-    "khulnasoft_cim": khulnasoft_cim_data_model,
+from typing import Callable, Dict
+
+# Pipeline factories are registered by name and their module is only imported once a pipeline is
+# built, so importing the backend or discovering the plugin doesn't load the pipeline definitions.
+pipeline_factories = {
+    "khulnasoft_windows": "khulnasoft_windows_pipeline",
+    "khulnasoft_sysmon_acceleration": "khulnasoft_windows_sysmon_acceleration_keywords",
+    "khulnasoft_cim": "khulnasoft_cim_data_model",
 }
+
+
+def lazy_pipeline(factory_name: str) -> Callable:
+    def pipeline(*args, **kwargs):
+        from . import khulnasoft
+
+        return getattr(khulnasoft, factory_name)(*args, **kwargs)
+
+    pipeline.__name__ = pipeline.__qualname__ = factory_name
+    return pipeline
+
+
+pipelines: Dict[str, Callable] = {
+    name: lazy_pipeline(factory_name)
+    for name, factory_name in pipeline_factories.items()
+}
+
+
+def __getattr__(name: str):
+    if name in pipeline_factories.values():
+        from . import khulnasoft
+
+        return getattr(khulnasoft, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,3 +1,7 @@
+from dataclasses import dataclass, field
+import itertools
+from typing import Dict, List, Optional, Tuple, Union
+
 from sigma.pipelines.common import (
     logsource_windows,
     logsource_windows_process_creation,
@@ -15,13 +19,17 @@ from sigma.processing.transformations import (
     DetectionItemFailureTransformation,
     RuleFailureTransformation,
     SetStateTransformation,
+    Transformation,
 )
 from sigma.processing.conditions import (
     LogsourceCondition,
     ExcludeFieldCondition,
     RuleProcessingItemAppliedCondition,
+    IsSigmaCorrelationRuleCondition,
 )
 from sigma.processing.pipeline import ProcessingItem, ProcessingPipeline
+from sigma.rule import SigmaRule
+from sigma.correlations import SigmaCorrelationRule
 
 windows_sysmon_acceleration_keywords = {  # Map Sysmon event sources and keywords that are added to search for Sysmon optimization pipeline
     "process_creation": "ParentProcessGuid",
@@ -121,223 +129,383 @@ def khulnasoft_windows_sysmon_acceleration_keywords():
     )
 
 
+@dataclass
+class LogsourceDispatchTransformation(Transformation):
+    """
+    Apply the processing items that can match the log source of a rule. The items are indexed by the
+    (product, category, service) of their log source conditions once, the items for a log source are
+    looked up in this index instead of evaluating the conditions of all items for each rule. Items
+    without log source condition are applied to all rules. The candidate items are applied in their
+    original order with their own conditions, so the result is the same as with a flat pipeline.
+    The index is immutable, the candidates of each log source are cached as item positions.
+    """
+
+    items: List[ProcessingItem]
+    index: Dict[Tuple[Optional[str], ...], List[int]] = field(
+        init=False, repr=False, compare=False
+    )
+    unindexed: List[int] = field(init=False, repr=False, compare=False)
+    dispatch: Dict[Optional[Tuple[Optional[str], ...]], Tuple[int, ...]] = field(
+        init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        self.index = {}
+        self.unindexed = []
+        self.dispatch = {}
+        for position, item in enumerate(self.items):
+            conditions = self.logsource_conditions(item)
+            if conditions is None:
+                self.unindexed.append(position)
+            for condition in conditions or []:
+                self.index.setdefault(
+                    (condition.product, condition.category, condition.service), []
+                ).append(position)
+
+    @staticmethod
+    def logsource_conditions(
+        item: ProcessingItem,
+    ) -> Optional[List[LogsourceCondition]]:
+        """
+        Log source conditions of which one must match a rule for the item to be applied, or None if
+        the item can't be indexed by log source.
+        """
+        if item.rule_condition_negation:
+            return None
+        conditions = [
+            condition
+            for condition in item.rule_conditions
+            if isinstance(condition, LogsourceCondition)
+        ]
+        if not conditions:
+            return None
+        if item.rule_condition_linking is all:
+            return conditions[:1]
+        if item.rule_condition_linking is any and len(conditions) == len(
+            item.rule_conditions
+        ):
+            return conditions
+        return None
+
+    def candidates(
+        self, rule: Union[SigmaRule, SigmaCorrelationRule]
+    ) -> List[ProcessingItem]:
+        """Processing items that can match the rule in their original order."""
+        key = (
+            (rule.logsource.product, rule.logsource.category, rule.logsource.service)
+            if isinstance(rule, SigmaRule)
+            else None  # log source conditions don't match correlation rules
+        )
+        positions = self.dispatch.get(key)
+        if positions is None:
+            matching = set(self.unindexed)
+            if key is not None:
+                for generalized in itertools.product(
+                    *((value, None) if value is not None else (None,) for value in key)
+                ):
+                    matching.update(self.index.get(generalized, []))
+            # setdefault is atomic, concurrent lookups of the same log source store one result.
+            positions = self.dispatch.setdefault(key, tuple(sorted(matching)))
+        return [self.items[position] for position in positions]
+
+    def apply(
+        self,
+        pipeline: ProcessingPipeline,
+        rule: Union[SigmaRule, SigmaCorrelationRule],
+    ) -> None:
+        super().apply(pipeline, rule)
+        for item in self.candidates(rule):
+            if item.apply(pipeline, rule) and item.identifier:
+                pipeline.applied_ids.add(item.identifier)
+
+
 def khulnasoft_cim_data_model():
     return ProcessingPipeline(
         name="Khulnasoft CIM Data Model Mapping",
         allowed_backends={"khulnasoft"},
         priority=20,
-        items=[
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_sysmon_process_creation_unsupported_fields",
-                transformation=DetectionItemFailureTransformation(
-                    "The Khulnasoft Data Model Sigma backend supports only the following fields for process_creation log source: "
-                    + ",".join(khulnasoft_sysmon_process_creation_cim_mapping.keys())
-                ),
-                rule_conditions=[
-                    logsource_windows_process_creation(),
-                    logsource_linux_process_creation(),
-                ],
-                rule_condition_linking=any,
-                field_name_conditions=[
-                    ExcludeFieldCondition(
-                        fields=khulnasoft_sysmon_process_creation_cim_mapping.keys()
-                    )
-                ],
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_sysmon_process_creation",
-                transformation=FieldMappingTransformation(
-                    khulnasoft_sysmon_process_creation_cim_mapping
-                ),
-                rule_conditions=[
-                    logsource_windows_process_creation(),
-                    logsource_linux_process_creation(),
-                ],
-                rule_condition_linking=any,
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_fields_sysmon_process_creation",
-                transformation=SetStateTransformation(
-                    "fields", khulnasoft_sysmon_process_creation_cim_mapping.values()
-                ),
-                rule_conditions=[
-                    logsource_windows_process_creation(),
-                    logsource_linux_process_creation(),
-                ],
-                rule_condition_linking=any,
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_sysmon_process_creation_data_model_set",
-                transformation=SetStateTransformation(
-                    "data_model_set", "Endpoint.Processes"
-                ),
-                rule_conditions=[
-                    logsource_windows_process_creation(),
-                    logsource_linux_process_creation(),
-                ],
-                rule_condition_linking=any,
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_sysmon_registry_unsupported_fields",
-                transformation=DetectionItemFailureTransformation(
-                    "The Khulnasoft Data Model Sigma backend supports only the following fields for registry log source: "
-                    + ",".join(khulnasoft_windows_registry_cim_mapping.keys())
-                ),
-                rule_conditions=[
-                    logsource_windows_registry_add(),
-                    logsource_windows_registry_delete(),
-                    logsource_windows_registry_event(),
-                    logsource_windows_registry_set(),
-                ],
-                rule_condition_linking=any,
-                field_name_conditions=[
-                    ExcludeFieldCondition(
-                        fields=khulnasoft_windows_registry_cim_mapping.keys()
-                    )
-                ],
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_sysmon_registry",
-                transformation=FieldMappingTransformation(
-                    khulnasoft_windows_registry_cim_mapping
-                ),
-                rule_conditions=[
-                    logsource_windows_registry_add(),
-                    logsource_windows_registry_delete(),
-                    logsource_windows_registry_event(),
-                    logsource_windows_registry_set(),
-                ],
-                rule_condition_linking=any,
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_fields_sysmon_registry",
-                transformation=SetStateTransformation(
-                    "fields", khulnasoft_windows_registry_cim_mapping.values()
-                ),
-                rule_conditions=[
-                    logsource_windows_registry_add(),
-                    logsource_windows_registry_delete(),
-                    logsource_windows_registry_event(),
-                    logsource_windows_registry_set(),
-                ],
-                rule_condition_linking=any,
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_sysmon_registry_data_model_set",
-                transformation=SetStateTransformation(
-                    "data_model_set", "Endpoint.Registry"
-                ),
-                rule_conditions=[
-                    logsource_windows_registry_add(),
-                    logsource_windows_registry_delete(),
-                    logsource_windows_registry_event(),
-                    logsource_windows_registry_set(),
-                ],
-                rule_condition_linking=any,
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_sysmon_file_event_unsupported_fields",
-                transformation=DetectionItemFailureTransformation(
-                    "The Khulnasoft Data Model Sigma backend supports only the following fields for file_event log source: "
-                    + ",".join(khulnasoft_windows_file_event_cim_mapping.keys())
-                ),
-                rule_conditions=[
-                    logsource_windows_file_event(),
-                ],
-                field_name_conditions=[
-                    ExcludeFieldCondition(
-                        fields=khulnasoft_windows_file_event_cim_mapping.keys()
-                    )
-                ],
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_sysmon_file_event",
-                transformation=FieldMappingTransformation(
-                    khulnasoft_windows_file_event_cim_mapping
-                ),
-                rule_conditions=[
-                    logsource_windows_file_event(),
-                ],
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_fields_sysmon_file_event",
-                transformation=SetStateTransformation(
-                    "fields", khulnasoft_windows_file_event_cim_mapping.values()
-                ),
-                rule_conditions=[
-                    logsource_windows_file_event(),
-                ],
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_sysmon_file_event_data_model_set",
-                transformation=SetStateTransformation(
-                    "data_model_set", "Endpoint.Filesystem"
-                ),
-                rule_conditions=[
-                    logsource_windows_file_event(),
-                ],
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_web_proxy_unsupported_fields",
-                transformation=DetectionItemFailureTransformation(
-                    "The Khulnasoft Data Model Sigma backend supports only the following fields for web proxy log source: "
-                    + ",".join(khulnasoft_web_proxy_cim_mapping.keys())
-                ),
-                rule_conditions=[
-                    LogsourceCondition(category="proxy"),
-                ],
-                field_name_conditions=[
-                    ExcludeFieldCondition(
-                        fields=khulnasoft_web_proxy_cim_mapping.keys()
-                    )
-                ],
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_web_proxy",
-                transformation=FieldMappingTransformation(
-                    khulnasoft_web_proxy_cim_mapping
-                ),
-                rule_conditions=[
-                    LogsourceCondition(category="proxy"),
-                ],
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_fields_web_proxy",
-                transformation=SetStateTransformation(
-                    "fields", khulnasoft_web_proxy_cim_mapping.values()
-                ),
-                rule_conditions=[
-                    LogsourceCondition(category="proxy"),
-                ],
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_web_proxy_data_model_set",
-                transformation=SetStateTransformation("data_model_set", "Web.Proxy"),
-                rule_conditions=[
-                    LogsourceCondition(category="proxy"),
-                ],
-            ),
-            ProcessingItem(
-                identifier="khulnasoft_dm_mapping_log_source_not_supported",
-                rule_condition_linking=any,
-                transformation=RuleFailureTransformation(
-                    "Rule type not yet supported by the Khulnasoft data model CIM pipeline!"
-                ),
-                rule_condition_negation=True,
-                rule_conditions=[
-                    RuleProcessingItemAppliedCondition(
-                        "khulnasoft_dm_mapping_sysmon_process_creation"
+        items=khulnasoft_cim_data_model_items(),
+    )
+
+
+def khulnasoft_cim_data_model_items() -> List[ProcessingItem]:
+    """
+    Processing items of the CIM data model pipeline, the mappings of the log sources are dispatched
+    by one indexed processing item. The items are built for each pipeline instance, because pySigma
+    transformations store the pipeline they are applied by and can't be shared.
+    """
+    return [
+        ProcessingItem(
+            identifier="khulnasoft_dm_logsource_dispatch",
+            transformation=LogsourceDispatchTransformation(
+                [
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_mapping_sysmon_process_creation_unsupported_fields",
+                        transformation=DetectionItemFailureTransformation(
+                            "The Khulnasoft Data Model Sigma backend supports only the following fields for process_creation log source: "
+                            + ",".join(
+                                khulnasoft_sysmon_process_creation_cim_mapping.keys()
+                            )
+                        ),
+                        rule_conditions=[
+                            logsource_windows_process_creation(),
+                            logsource_linux_process_creation(),
+                        ],
+                        rule_condition_linking=any,
+                        field_name_conditions=[
+                            ExcludeFieldCondition(
+                                fields=list(
+                                    khulnasoft_sysmon_process_creation_cim_mapping
+                                )
+                            )
+                        ],
                     ),
-                    RuleProcessingItemAppliedCondition(
-                        "khulnasoft_dm_mapping_sysmon_registry"
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_mapping_sysmon_process_creation",
+                        transformation=FieldMappingTransformation(
+                            khulnasoft_sysmon_process_creation_cim_mapping
+                        ),
+                        rule_conditions=[
+                            logsource_windows_process_creation(),
+                            logsource_linux_process_creation(),
+                        ],
+                        rule_condition_linking=any,
                     ),
-                    RuleProcessingItemAppliedCondition(
-                        "khulnasoft_dm_mapping_sysmon_file_event"
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_fields_sysmon_process_creation",
+                        transformation=SetStateTransformation(
+                            "fields",
+                            list(
+                                khulnasoft_sysmon_process_creation_cim_mapping.values()
+                            ),
+                        ),
+                        rule_conditions=[
+                            logsource_windows_process_creation(),
+                            logsource_linux_process_creation(),
+                        ],
+                        rule_condition_linking=any,
                     ),
-                    RuleProcessingItemAppliedCondition(
-                        "khulnasoft_dm_mapping_web_proxy"
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_field_mapping_sysmon_process_creation",
+                        transformation=SetStateTransformation(
+                            "field_mapping",
+                            khulnasoft_sysmon_process_creation_cim_mapping,
+                        ),
+                        rule_conditions=[
+                            logsource_windows_process_creation(),
+                            logsource_linux_process_creation(),
+                        ],
+                        rule_condition_linking=any,
                     ),
-                ],
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_sysmon_process_creation_data_model_set",
+                        transformation=SetStateTransformation(
+                            "data_model_set", "Endpoint.Processes"
+                        ),
+                        rule_conditions=[
+                            logsource_windows_process_creation(),
+                            logsource_linux_process_creation(),
+                        ],
+                        rule_condition_linking=any,
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_mapping_sysmon_registry_unsupported_fields",
+                        transformation=DetectionItemFailureTransformation(
+                            "The Khulnasoft Data Model Sigma backend supports only the following fields for registry log source: "
+                            + ",".join(khulnasoft_windows_registry_cim_mapping.keys())
+                        ),
+                        rule_conditions=[
+                            logsource_windows_registry_add(),
+                            logsource_windows_registry_delete(),
+                            logsource_windows_registry_event(),
+                            logsource_windows_registry_set(),
+                        ],
+                        rule_condition_linking=any,
+                        field_name_conditions=[
+                            ExcludeFieldCondition(
+                                fields=list(khulnasoft_windows_registry_cim_mapping)
+                            )
+                        ],
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_mapping_sysmon_registry",
+                        transformation=FieldMappingTransformation(
+                            khulnasoft_windows_registry_cim_mapping
+                        ),
+                        rule_conditions=[
+                            logsource_windows_registry_add(),
+                            logsource_windows_registry_delete(),
+                            logsource_windows_registry_event(),
+                            logsource_windows_registry_set(),
+                        ],
+                        rule_condition_linking=any,
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_fields_sysmon_registry",
+                        transformation=SetStateTransformation(
+                            "fields",
+                            list(khulnasoft_windows_registry_cim_mapping.values()),
+                        ),
+                        rule_conditions=[
+                            logsource_windows_registry_add(),
+                            logsource_windows_registry_delete(),
+                            logsource_windows_registry_event(),
+                            logsource_windows_registry_set(),
+                        ],
+                        rule_condition_linking=any,
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_field_mapping_sysmon_registry",
+                        transformation=SetStateTransformation(
+                            "field_mapping", khulnasoft_windows_registry_cim_mapping
+                        ),
+                        rule_conditions=[
+                            logsource_windows_registry_add(),
+                            logsource_windows_registry_delete(),
+                            logsource_windows_registry_event(),
+                            logsource_windows_registry_set(),
+                        ],
+                        rule_condition_linking=any,
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_sysmon_registry_data_model_set",
+                        transformation=SetStateTransformation(
+                            "data_model_set", "Endpoint.Registry"
+                        ),
+                        rule_conditions=[
+                            logsource_windows_registry_add(),
+                            logsource_windows_registry_delete(),
+                            logsource_windows_registry_event(),
+                            logsource_windows_registry_set(),
+                        ],
+                        rule_condition_linking=any,
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_mapping_sysmon_file_event_unsupported_fields",
+                        transformation=DetectionItemFailureTransformation(
+                            "The Khulnasoft Data Model Sigma backend supports only the following fields for file_event log source: "
+                            + ",".join(khulnasoft_windows_file_event_cim_mapping.keys())
+                        ),
+                        rule_conditions=[
+                            logsource_windows_file_event(),
+                        ],
+                        field_name_conditions=[
+                            ExcludeFieldCondition(
+                                fields=list(khulnasoft_windows_file_event_cim_mapping)
+                            )
+                        ],
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_mapping_sysmon_file_event",
+                        transformation=FieldMappingTransformation(
+                            khulnasoft_windows_file_event_cim_mapping
+                        ),
+                        rule_conditions=[
+                            logsource_windows_file_event(),
+                        ],
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_fields_sysmon_file_event",
+                        transformation=SetStateTransformation(
+                            "fields",
+                            list(khulnasoft_windows_file_event_cim_mapping.values()),
+                        ),
+                        rule_conditions=[
+                            logsource_windows_file_event(),
+                        ],
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_field_mapping_sysmon_file_event",
+                        transformation=SetStateTransformation(
+                            "field_mapping", khulnasoft_windows_file_event_cim_mapping
+                        ),
+                        rule_conditions=[
+                            logsource_windows_file_event(),
+                        ],
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_mapping_sysmon_file_event_data_model_set",
+                        transformation=SetStateTransformation(
+                            "data_model_set", "Endpoint.Filesystem"
+                        ),
+                        rule_conditions=[
+                            logsource_windows_file_event(),
+                        ],
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_mapping_web_proxy_unsupported_fields",
+                        transformation=DetectionItemFailureTransformation(
+                            "The Khulnasoft Data Model Sigma backend supports only the following fields for web proxy log source: "
+                            + ",".join(khulnasoft_web_proxy_cim_mapping.keys())
+                        ),
+                        rule_conditions=[
+                            LogsourceCondition(category="proxy"),
+                        ],
+                        field_name_conditions=[
+                            ExcludeFieldCondition(
+                                fields=list(khulnasoft_web_proxy_cim_mapping)
+                            )
+                        ],
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_mapping_web_proxy",
+                        transformation=FieldMappingTransformation(
+                            khulnasoft_web_proxy_cim_mapping
+                        ),
+                        rule_conditions=[
+                            LogsourceCondition(category="proxy"),
+                        ],
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_fields_web_proxy",
+                        transformation=SetStateTransformation(
+                            "fields", list(khulnasoft_web_proxy_cim_mapping.values())
+                        ),
+                        rule_conditions=[
+                            LogsourceCondition(category="proxy"),
+                        ],
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_field_mapping_web_proxy",
+                        transformation=SetStateTransformation(
+                            "field_mapping", khulnasoft_web_proxy_cim_mapping
+                        ),
+                        rule_conditions=[
+                            LogsourceCondition(category="proxy"),
+                        ],
+                    ),
+                    ProcessingItem(
+                        identifier="khulnasoft_dm_mapping_web_proxy_data_model_set",
+                        transformation=SetStateTransformation(
+                            "data_model_set", "Web.Proxy"
+                        ),
+                        rule_conditions=[
+                            LogsourceCondition(category="proxy"),
+                        ],
+                    ),
+                ]
             ),
-        ],
-    )
+        ),
+        ProcessingItem(
+            identifier="khulnasoft_dm_mapping_log_source_not_supported",
+            rule_condition_linking=any,
+            transformation=RuleFailureTransformation(
+                "Rule type not yet supported by the Khulnasoft data model CIM pipeline!"
+            ),
+            rule_condition_negation=True,
+            rule_conditions=[
+                RuleProcessingItemAppliedCondition(
+                    "khulnasoft_dm_mapping_sysmon_process_creation"
+                ),
+                RuleProcessingItemAppliedCondition(
+                    "khulnasoft_dm_mapping_sysmon_registry"
+                ),
+                RuleProcessingItemAppliedCondition(
+                    "khulnasoft_dm_mapping_sysmon_file_event"
+                ),
+                RuleProcessingItemAppliedCondition("khulnasoft_dm_mapping_web_proxy"),
+                # Correlation rules are converted from the data models of their rules.
+                IsSigmaCorrelationRuleCondition(),
+            ],
+        ),
+    ]
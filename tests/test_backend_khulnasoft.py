@@ -1,8 +1,15 @@
-from sigma.exceptions import SigmaFeatureNotSupportedByBackendError
+from sigma.exceptions import (
+    SigmaConversionError,
+    SigmaFeatureNotSupportedByBackendError,
+)
 import pytest
 from sigma.backends.khulnasoft import KhulnasoftBackend
+from sigma.backends.khulnasoft.engine import KhulnasoftSearchEngine
 from sigma.collection import SigmaCollection
-from sigma.pipelines.khulnasoft import khulnasoft_cim_data_model
+from sigma.pipelines.khulnasoft import (
+    khulnasoft_cim_data_model,
+    khulnasoft_windows_pipeline,
+)
 
 
 @pytest.fixture
@@ -127,6 +134,87 @@ def test_khulnasoft_in_expression(khulnasoft_backend: KhulnasoftBackend):
     )
 
 
+def test_khulnasoft_in_expression_subsumed_values(
+    khulnasoft_backend: KhulnasoftBackend,
+):
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                r"""
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel:
+                    fieldA:
+                        - '*\windows\system32\powershell.exe'
+                        - '*\powershell.exe'
+                        - '*\PowerShell.EXE'
+                        - '*xabcx*'
+                        - '*abc*'
+                        - 'C:\Windows\Temp\*.ps1'
+                        - 'C:\Windows\*'
+                        - valueA
+                        - VALUEA
+                condition: sel
+        """
+            )
+        )
+        == ['fieldA IN ("*\\\\powershell.exe", "*abc*", "C:\\\\Windows\\*", "valueA")']
+    )
+
+
+def test_khulnasoft_in_expression_single_remaining_value(
+    khulnasoft_backend: KhulnasoftBackend,
+):
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                r"""
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel:
+                    fieldA:
+                        - '*\powershell.exe'
+                        - '*\windows\system32\powershell.exe'
+                condition: sel
+        """
+            )
+        )
+        == ['fieldA="*\\\\powershell.exe"']
+    )
+
+
+def test_khulnasoft_in_expression_wildcard_only(khulnasoft_backend: KhulnasoftBackend):
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel:
+                    fieldA:
+                        - valueA
+                        - '*'
+                        - valueB*
+                condition: sel
+        """
+            )
+        )
+        == ['fieldA="*"']
+    )
+
+
 def test_khulnasoft_field_name_with_whitespace(khulnasoft_backend: KhulnasoftBackend):
     assert (
         khulnasoft_backend.convert(
@@ -269,7 +357,7 @@ def test_khulnasoft_cidr_query(khulnasoft_backend: KhulnasoftBackend):
 
 
 def test_khulnasoft_cidr_or(khulnasoft_backend: KhulnasoftBackend):
-    with pytest.raises(SigmaFeatureNotSupportedByBackendError, match="ORing CIDR"):
+    assert (
         khulnasoft_backend.convert(
             SigmaCollection.from_yaml(
                 """
@@ -289,6 +377,92 @@ def test_khulnasoft_cidr_or(khulnasoft_backend: KhulnasoftBackend):
             """
             )
         )
+        == [
+            'fieldB="foo" fieldC="bar"\n| where (cidrmatch("10.0.0.0/8", fieldA) OR cidrmatch("192.168.0.0/16", fieldA))'
+        ]
+    )
+
+
+def test_khulnasoft_cidr_or_collapsed(khulnasoft_backend: KhulnasoftBackend):
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+                title: Test
+                status: test
+                logsource:
+                    category: test_category
+                    product: test_product
+                detection:
+                    sel:
+                        fieldA|cidr:
+                            - 10.0.0.0/9
+                            - 10.128.0.0/9
+                            - 10.1.0.0/16
+                        fieldB: foo
+                    condition: sel
+            """
+            )
+        )
+        == ['fieldB="foo"\n| where cidrmatch("10.0.0.0/8", fieldA)']
+    )
+
+
+def test_khulnasoft_cidr_or_not(khulnasoft_backend: KhulnasoftBackend):
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+                title: Test
+                status: test
+                logsource:
+                    category: test_category
+                    product: test_product
+                detection:
+                    sel:
+                        fieldB: foo
+                    filter:
+                        fieldA|cidr:
+                            - 192.168.0.0/16
+                            - 10.0.0.0/8
+                            - fe80::/10
+                    condition: sel and not filter
+            """
+            )
+        )
+        == [
+            'fieldB="foo"\n| where NOT (cidrmatch("10.0.0.0/8", fieldA) OR cidrmatch("192.168.0.0/16", fieldA) OR cidrmatch("fe80::/10", fieldA))'
+        ]
+    )
+
+
+def test_khulnasoft_cidr_query_explicit_or(khulnasoft_backend: KhulnasoftBackend):
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+                title: Test
+                status: test
+                logsource:
+                    category: test_category
+                    product: test_product
+                detection:
+                    sel1:
+                        fieldA|cidr:
+                            - 192.168.0.0/16
+                            - 10.0.0.0/8
+                    sel2:
+                        fieldB: foo
+                    sel3:
+                        fieldC|cidr: 172.16.0.0/12
+                    condition: sel1 or sel2 or sel3
+            """
+            )
+        )
+        == [
+            '\n| eval fieldACidrCondition=if(cidrmatch("10.0.0.0/8", fieldA) OR cidrmatch("192.168.0.0/16", fieldA), "true", "false")\n| eval fieldCCidrCondition=if(cidrmatch("172.16.0.0/12", fieldC), "true", "false")\n| search fieldACidrCondition="true" OR fieldB="foo" OR fieldCCidrCondition="true"'
+        ]
+    )
 
 
 def test_khulnasoft_fields_output(khulnasoft_backend: KhulnasoftBackend):
@@ -445,8 +619,7 @@ detection:
         SigmaCollection.from_yaml(rule), "data_model"
     ) == [
         """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Processes where
-Processes.process="test" by Processes.process Processes.dest Processes.process_current_directory Processes.process_path Processes.process_integrity_level Processes.original_file_name Processes.parent_process
-Processes.parent_process_path Processes.parent_process_guid Processes.parent_process_id Processes.process_guid Processes.process_id Processes.user
+Processes.process="test" by Processes.process Processes.dest Processes.user
 | `drop_dm_object_name(Processes)`
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
@@ -475,7 +648,7 @@ detection:
         SigmaCollection.from_yaml(rule), "data_model"
     ) == [
         """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Registry where
-Registry.registry_key_name="test" by Registry.dest Registry.registry_value_data Registry.action Registry.process_path Registry.process_guid Registry.process_id Registry.registry_key_name
+Registry.registry_key_name="test" by Registry.dest Registry.registry_key_name Registry.user
 | `drop_dm_object_name(Registry)`
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
@@ -504,7 +677,7 @@ detection:
         SigmaCollection.from_yaml(rule), "data_model"
     ) == [
         """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Registry where
-Registry.registry_key_name="test" by Registry.dest Registry.registry_value_data Registry.action Registry.process_path Registry.process_guid Registry.process_id Registry.registry_key_name
+Registry.registry_key_name="test" by Registry.dest Registry.registry_key_name Registry.user
 | `drop_dm_object_name(Registry)`
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
@@ -534,7 +707,7 @@ detection:
     ) == [
         """
 | tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Registry where
-Registry.registry_key_name="test" by Registry.dest Registry.registry_value_data Registry.action Registry.process_path Registry.process_guid Registry.process_id Registry.registry_key_name
+Registry.registry_key_name="test" by Registry.dest Registry.registry_key_name Registry.user
 | `drop_dm_object_name(Registry)`
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
@@ -563,7 +736,7 @@ detection:
         SigmaCollection.from_yaml(rule), "data_model"
     ) == [
         """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Registry where
-Registry.registry_key_name="test" by Registry.dest Registry.registry_value_data Registry.action Registry.process_path Registry.process_guid Registry.process_id Registry.registry_key_name
+Registry.registry_key_name="test" by Registry.dest Registry.registry_key_name Registry.user
 | `drop_dm_object_name(Registry)`
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
@@ -592,7 +765,7 @@ detection:
         SigmaCollection.from_yaml(rule), "data_model"
     ) == [
         """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Registry where
-Registry.registry_key_name="test" by Registry.dest Registry.registry_value_data Registry.action Registry.process_path Registry.process_guid Registry.process_id Registry.registry_key_name
+Registry.registry_key_name="test" by Registry.dest Registry.registry_key_name Registry.user
 | `drop_dm_object_name(Registry)`
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
@@ -621,7 +794,7 @@ detection:
         SigmaCollection.from_yaml(rule), "data_model"
     ) == [
         """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Filesystem where
-Filesystem.file_path="test" by Filesystem.dest Filesystem.file_create_time Filesystem.process_path Filesystem.process_guid Filesystem.process_id Filesystem.file_path
+Filesystem.file_path="test" by Filesystem.dest Filesystem.file_path Filesystem.user
 | `drop_dm_object_name(Filesystem)`
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
@@ -650,8 +823,7 @@ detection:
         SigmaCollection.from_yaml(rule), "data_model"
     ) == [
         """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Processes where
-Processes.process="test" by Processes.process Processes.dest Processes.process_current_directory Processes.process_path Processes.process_integrity_level Processes.original_file_name Processes.parent_process
-Processes.parent_process_path Processes.parent_process_guid Processes.parent_process_id Processes.process_guid Processes.process_id Processes.user
+Processes.process="test" by Processes.process Processes.dest Processes.user
 | `drop_dm_object_name(Processes)`
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
 | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
@@ -661,20 +833,1013 @@ Processes.parent_process_path Processes.parent_process_guid Processes.parent_pro
     ]
 
 
-def test_khulnasoft_data_model_no_data_model_specified():
-    khulnasoft_backend = KhulnasoftBackend()
+def test_khulnasoft_data_model_deferred():
+    khulnasoft_backend = KhulnasoftBackend(
+        processing_pipeline=khulnasoft_cim_data_model()
+    )
     rule = """
 title: Test
 status: test
 logsource:
+    category: process_creation
+    product: windows
+detection:
+    sel:
+        CommandLine|re: 'foo.*bar'
+        Image|endswith: '\\cmd.exe'
+        Computer|cidr: 10.0.0.0/8
+    filter:
+        User|re: 'adm.*'
+    condition: sel and not filter
+    """
+    assert khulnasoft_backend.convert(
+        SigmaCollection.from_yaml(rule), "data_model"
+    ) == [
+        """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Processes where
+Processes.process_path="*\\\\cmd.exe" by Processes.process Processes.dest Processes.process_path Processes.user
+| where cidrmatch("10.0.0.0/8", 'Processes.dest')
+| where match('Processes.process', "foo.*bar")
+| where NOT match('Processes.user', "adm.*")
+| `drop_dm_object_name(Processes)`
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
+""".replace(
+            "\n", " "
+        )
+    ]
+
+
+def test_khulnasoft_data_model_deferred_or():
+    khulnasoft_backend = KhulnasoftBackend(
+        processing_pipeline=khulnasoft_cim_data_model()
+    )
+    rule = """
+title: Test
+status: test
+logsource:
+    category: process_creation
+    product: windows
+detection:
+    sel1:
+        CommandLine|re: 'foo.*bar'
+    sel2:
+        Image|endswith: '\\cmd.exe'
+    sel3:
+        Computer|cidr:
+            - 10.0.0.0/8
+            - 192.168.0.0/16
+    condition: 1 of sel*
+    """
+    assert khulnasoft_backend.convert(
+        SigmaCollection.from_yaml(rule), "data_model"
+    ) == [
+        """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Processes
+by Processes.process Processes.dest Processes.process_path Processes.user
+| eval Processes.processCondition=if(match('Processes.process', "foo.*bar"), "true", "false")
+| eval Processes.destCidrCondition=if(cidrmatch("10.0.0.0/8", 'Processes.dest') OR cidrmatch("192.168.0.0/16", 'Processes.dest'), "true", "false")
+| search Processes.processCondition="true" OR Processes.process_path="*\\\\cmd.exe" OR Processes.destCidrCondition="true"
+| `drop_dm_object_name(Processes)`
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
+""".replace(
+            "\n", " "
+        )
+    ]
+
+
+def test_khulnasoft_data_model_group_by_fields():
+    khulnasoft_backend = KhulnasoftBackend(
+        processing_pipeline=khulnasoft_cim_data_model(),
+        data_model_identity_fields="dest, Processes.parent_process_name",
+    )
+    rule = """
+title: Test
+status: test
+logsource:
+    category: process_creation
+    product: windows
+fields:
+    - ParentImage
+detection:
+    sel:
+        ParentCommandLine: foo
+        Image: test
+    condition: sel
+    """
+    assert khulnasoft_backend.convert(SigmaCollection.from_yaml(rule), "data_model")[
+        0
+    ].startswith(
+        """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Processes where
+Processes.parent_process="foo" Processes.process_path="test" by Processes.dest Processes.process_path Processes.parent_process
+Processes.parent_process_path Processes.parent_process_name
+| `drop_dm_object_name(Processes)`""".replace(
+            "\n", " "
+        )
+    )
+
+
+def test_khulnasoft_data_model_group_by_fields_proxy():
+    rule = """
+title: Test
+status: test
+logsource:
+    category: proxy
+fields:
+    - cs-host
+detection:
+    sel:
+        c-uri|contains: evil
+    condition: sel
+    """
+    assert (
+        KhulnasoftBackend(processing_pipeline=khulnasoft_cim_data_model())
+        .convert(SigmaCollection.from_yaml(rule), "data_model")[0]
+        .startswith(
+            """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Web.Proxy where
+Web.url="*evil*" by Web.url Web.dest Web.user
+| `drop_dm_object_name(Web)`""".replace(
+                "\n", " "
+            )
+        )
+    )
+
+
+def test_khulnasoft_data_model_summariesonly():
+    khulnasoft_backend = KhulnasoftBackend(
+        processing_pipeline=khulnasoft_cim_data_model(),
+        data_model_summariesonly="true",
+    )
+    rule = """
+title: Test
+status: test
+logsource:
+    category: process_creation
+    product: windows
+detection:
+    sel:
+        CommandLine: test
+    condition: sel
+    """
+    assert khulnasoft_backend.convert(SigmaCollection.from_yaml(rule), "data_model")[
+        0
+    ].startswith(
+        '| tstats summariesonly=true allow_old_summaries=true fillnull_value="null" count'
+    )
+
+
+def test_khulnasoft_data_model_savedsearches_fallback():
+    khulnasoft_backend = KhulnasoftBackend(
+        processing_pipeline=khulnasoft_cim_data_model(),
+        data_model_summariesonly=True,
+        data_model_acceleration_lag="15m",
+    )
+    rule = """
+title: Test [1]
+status: test
+description: Test description
+logsource:
+    category: process_creation
     product: windows
-    service: security
 detection:
     sel:
         CommandLine: test
     condition: sel
     """
+    search = """tstats summariesonly={summariesonly} allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Processes where Processes.process="test" by Processes.process Processes.dest Processes.user | `drop_dm_object_name(Processes)` | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime) | convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime) """
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(rule), "data_model_savedsearches"
+        )
+        == f"""
+[default]
+dispatch.earliest_time = -30d
+dispatch.latest_time = now
+
+[Test 1]
+dispatch.latest_time = -15m
+description = Test description
+search = | {search.format(summariesonly="true")}
+
+[Test 1 - Fallback]
+dispatch.earliest_time = -15m
+dispatch.latest_time = now
+description = Test description
+search = | {search.format(summariesonly="false")}"""
+    )
+
+
+def test_khulnasoft_data_model_invalid_acceleration_lag():
     with pytest.raises(
-        SigmaFeatureNotSupportedByBackendError, match="No data model specified"
+        SigmaFeatureNotSupportedByBackendError,
+        match="Invalid data model acceleration lag",
     ):
-        khulnasoft_backend.convert(SigmaCollection.from_yaml(rule), "data_model")
+        KhulnasoftBackend(data_model_acceleration_lag="15 minutes")
+
+
+data_model_batch_rules = """
+title: Test 1
+id: 5013332f-8a70-4e04-bcc1-06a98a2cca2e
+status: test
+logsource:
+    category: process_creation
+    product: windows
+detection:
+    sel:
+        Image|endswith: '\\cmd.exe'
+        CommandLine|contains: '"/c'
+    condition: sel
+---
+title: Test 2
+status: test
+logsource:
+    category: file_event
+    product: windows
+detection:
+    sel:
+        TargetFilename|endswith: '.dll'
+    condition: sel
+---
+title: Test 3
+status: test
+logsource:
+    category: process_creation
+    product: windows
+detection:
+    sel:
+        ParentImage: explorer.exe
+    filter:
+        User: SYSTEM
+    condition: sel and not filter
+---
+title: Test 4
+status: test
+logsource:
+    category: process_creation
+    product: windows
+detection:
+    sel:
+        CommandLine|re: 'a.*b'
+    condition: sel
+"""
+
+
+def test_khulnasoft_data_model_batch():
+    khulnasoft_backend = KhulnasoftBackend(
+        processing_pipeline=khulnasoft_cim_data_model()
+    )
+    assert khulnasoft_backend.convert(
+        SigmaCollection.from_yaml(data_model_batch_rules), "data_model_batch"
+    ) == [
+        """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Processes where
+(Processes.process_path="*\\\\cmd.exe" Processes.process="*\\"/c*") OR (Processes.parent_process_path="explorer.exe" NOT Processes.user="SYSTEM")
+by Processes.process Processes.dest Processes.process_path Processes.user Processes.parent_process_path
+| eval rule_id=mvappend(if(searchmatch("Processes.process_path=\\"*\\\\\\\\cmd.exe\\" Processes.process=\\"*\\\\\\"/c*\\""), "5013332f-8a70-4e04-bcc1-06a98a2cca2e", null()),
+if(searchmatch("Processes.parent_process_path=\\"explorer.exe\\" NOT Processes.user=\\"SYSTEM\\""), "Test 3", null()))
+| `drop_dm_object_name(Processes)`
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
+""".replace(
+            "\n", " "
+        ),
+        """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Filesystem where
+(Filesystem.file_path="*.dll") by Filesystem.dest Filesystem.file_path Filesystem.user
+| eval rule_id=mvappend(if(searchmatch("Filesystem.file_path=\\"*.dll\\""), "Test 2", null()))
+| `drop_dm_object_name(Filesystem)`
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
+""".replace(
+            "\n", " "
+        ),
+        """| tstats summariesonly=false allow_old_summaries=true fillnull_value="null" count min(_time) as firstTime max(_time) as lastTime from datamodel=Endpoint.Processes
+by Processes.process Processes.dest Processes.user
+| where match('Processes.process', "a.*b")
+| `drop_dm_object_name(Processes)`
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(firstTime)
+| convert timeformat="%Y-%m-%dT%H:%M:%S" ctime(lastTime)
+""".replace(
+            "\n", " "
+        ),
+    ]
+
+
+def test_khulnasoft_data_model_batch_size():
+    khulnasoft_backend = KhulnasoftBackend(
+        processing_pipeline=khulnasoft_cim_data_model(), data_model_batch_size="1"
+    )
+    queries = khulnasoft_backend.convert(
+        SigmaCollection.from_yaml(data_model_batch_rules), "data_model_batch"
+    )
+    assert [query.count("searchmatch(") for query in queries] == [1, 1, 1, 0]
+    assert [query.split("datamodel=")[1].split(" ")[0] for query in queries] == [
+        "Endpoint.Processes",
+        "Endpoint.Processes",
+        "Endpoint.Filesystem",
+        "Endpoint.Processes",
+    ]
+
+
+def test_khulnasoft_data_model_no_data_model_specified():
+    khulnasoft_backend = KhulnasoftBackend()
+    rule = """
+title: Test
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        CommandLine: test
+    condition: sel
+    """
+    with pytest.raises(
+        SigmaFeatureNotSupportedByBackendError, match="No data model specified"
+    ):
+        khulnasoft_backend.convert(SigmaCollection.from_yaml(rule), "data_model")
+
+
+def test_khulnasoft_regex_or_suffix_per_query(khulnasoft_backend: KhulnasoftBackend):
+    rule = """
+title: Test
+status: test
+logsource:
+    category: test_category
+    product: test_product
+detection:
+    sel1:
+        fieldA|re: foo.*bar
+    sel2:
+        fieldA|re: boo.*foo
+    condition: sel1 or sel2
+    """
+    expected = [
+        '\n| rex field=fieldA "(?<fieldAMatch>foo.*bar)"\n| eval fieldACondition=if(isnotnull(fieldAMatch), "true", "false")\n| rex field=fieldA "(?<fieldAMatch2>boo.*foo)"\n| eval fieldACondition2=if(isnotnull(fieldAMatch2), "true", "false")\n| search fieldACondition="true" OR fieldACondition2="true"'
+    ]
+    assert khulnasoft_backend.convert(SigmaCollection.from_yaml(rule)) == expected
+    assert khulnasoft_backend.convert(SigmaCollection.from_yaml(rule)) == expected
+
+
+def test_khulnasoft_convert_many(khulnasoft_backend: KhulnasoftBackend):
+    rules = "\n---\n".join(
+        f"""
+title: Test {i}
+name: rule_{i}
+status: test
+logsource:
+    category: test_category
+    product: test_product
+detection:
+    sel1:
+        field{i}|re: foo.*bar
+    sel2:
+        field{i}|re:
+            - boo.*foo
+            - baz.*
+    sel3:
+        fieldB: value{i}
+    condition: sel1 or sel2 or sel3
+"""
+        for i in range(50)
+    )
+    assert khulnasoft_backend.convert_many(
+        SigmaCollection.from_yaml(rules), workers=8
+    ) == KhulnasoftBackend().convert(SigmaCollection.from_yaml(rules))
+
+
+def test_khulnasoft_convert_many_savedsearches_and_correlation(
+    khulnasoft_backend: KhulnasoftBackend,
+):
+    rules = """
+title: Base rule
+name: base_rule
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value1
+    condition: selection
+---
+title: Multiple occurrences of base event
+status: test
+correlation:
+    type: event_count
+    rules:
+        - base_rule
+    group-by:
+        - fieldC
+    timespan: 15m
+    condition:
+        gte: 10
+---
+title: Other rule
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldB: value2
+    condition: selection
+    """
+    for output_format in ("default", "savedsearches"):
+        assert khulnasoft_backend.convert_many(
+            SigmaCollection.from_yaml(rules), output_format, workers=2
+        ) == KhulnasoftBackend().convert(
+            SigmaCollection.from_yaml(rules), output_format
+        )
+
+
+def test_khulnasoft_convert_many_windows_pipeline():
+    services = ["security", "system", "sysmon", "powershell"]
+    rules = "\n---\n".join(
+        f"""
+title: Test {i}
+status: test
+logsource:
+    product: windows
+    service: {services[i % len(services)]}
+detection:
+    sel:
+        EventID: {i}
+        fieldA: value{i}
+    condition: sel
+"""
+        for i in range(64)
+    )
+    backend = KhulnasoftBackend(khulnasoft_windows_pipeline())
+    expected = KhulnasoftBackend(khulnasoft_windows_pipeline()).convert(
+        SigmaCollection.from_yaml(rules)
+    )
+    for _ in range(2):
+        assert (
+            backend.convert_many(SigmaCollection.from_yaml(rules), workers=8)
+            == expected
+        )
+
+
+def test_khulnasoft_convert_many_cim_data_model():
+    categories = ["process_creation", "file_event", "registry_set"]
+    rules = "\n---\n".join(
+        f"""
+title: Test {i}
+status: test
+logsource:
+    product: windows
+    category: {categories[i % len(categories)]}
+detection:
+    sel:
+        Image: value{i}
+    condition: sel
+"""
+        for i in range(30)
+    )
+    assert KhulnasoftBackend(khulnasoft_cim_data_model()).convert_many(
+        SigmaCollection.from_yaml(rules), "data_model", workers=4
+    ) == KhulnasoftBackend(khulnasoft_cim_data_model()).convert(
+        SigmaCollection.from_yaml(rules), "data_model"
+    )
+
+
+def test_khulnasoft_convert_many_collect_errors():
+    khulnasoft_backend = KhulnasoftBackend(collect_errors=True)
+    rules = "\n---\n".join(
+        f"""
+title: Test {i}
+status: test
+logsource:
+    category: test_category
+    product: test_product
+detection:
+    sel:
+        fieldA: value{i}
+    condition: sel
+"""
+        for i in range(10)
+    )
+    collection = SigmaCollection.from_yaml(rules)
+    assert khulnasoft_backend.convert_many(collection, "data_model", workers=4) == []
+    assert [rule for rule, _ in khulnasoft_backend.errors] == collection.rules
+
+
+def test_khulnasoft_regex_query_same_field_merged(
+    khulnasoft_backend: KhulnasoftBackend,
+):
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel1:
+                    fieldA|re: foo.*bar
+                    fieldB: foo
+                sel2:
+                    fieldA|re: ba(r|z)
+                    fieldC|re: boo
+                    fieldD: bar
+                sel3:
+                    fieldA|re: '"quoted"'
+                    fieldE: baz
+                condition: all of sel*
+        """
+            )
+        )
+        == [
+            'fieldB="foo" fieldD="bar" fieldE="baz"\n| regex fieldA="^(?=[\\s\\S]*?(?:foo.*bar))(?=[\\s\\S]*?(?:ba(r|z)))(?=[\\s\\S]*?(?:\\"quoted\\"))"\n| regex fieldC="boo"'
+        ]
+    )
+
+
+def test_khulnasoft_regex_query_same_field_negated_merged(
+    khulnasoft_backend: KhulnasoftBackend,
+):
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel:
+                    fieldA|re: foo.*bar
+                    fieldB: foo
+                filter1:
+                    fieldA|re: foo
+                filter2:
+                    fieldA|re: bar
+                condition: sel and not filter1 and not filter2
+        """
+            )
+        )
+        == [
+            'fieldB="foo"\n| regex fieldA="foo.*bar"\n| regex fieldA!="(?:foo)|(?:bar)"'
+        ]
+    )
+
+
+def test_khulnasoft_regex_query_backreference_not_merged(
+    khulnasoft_backend: KhulnasoftBackend,
+):
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel1:
+                    fieldA|re: (a)\\1
+                    fieldB: foo
+                sel2:
+                    fieldA|re: (?P<name>b)
+                sel3:
+                    fieldA|re: (?<=c)d
+                sel4:
+                    fieldA|re: e
+                condition: all of sel*
+        """
+            )
+        )
+        == [
+            'fieldB="foo"\n| regex fieldA="(a)\\\\1"\n| regex fieldA="(?P<name>b)"\n| regex fieldA="^(?=[\\s\\S]*?(?:(?<=c)d))(?=[\\s\\S]*?(?:e))"'
+        ]
+    )
+
+
+def test_khulnasoft_deferred_expressions_ordered_by_rank(
+    khulnasoft_backend: KhulnasoftBackend,
+):
+    assert (
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel:
+                    fieldA|re: foo.*bar
+                    fieldB: foo
+                    fieldC|cidr: 10.0.0.0/8
+                filter_regex:
+                    fieldD|re: adm.*
+                filter_cidr:
+                    fieldE|cidr: 192.168.0.0/16
+                condition: sel and not filter_regex and not filter_cidr
+        """
+            )
+        )
+        == [
+            'fieldB="foo"\n| where cidrmatch("10.0.0.0/8", fieldC)\n| regex fieldA="foo.*bar"\n| where NOT cidrmatch("192.168.0.0/16", fieldE)\n| regex fieldD!="adm.*"'
+        ]
+    )
+
+
+def test_khulnasoft_term_prefilters():
+    assert (
+        KhulnasoftBackend(term_prefilters="true").convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel:
+                    Image|endswith: '\\rundll32.exe'
+                    CommandLine|contains|all:
+                        - 'javascript:'
+                        - ' RunHTMLApplication '
+                    User: foo_bar
+                    source: WinEventLog
+                filter:
+                    ParentImage: 'C:\\Windows\\explorer.exe'
+                condition: sel and not filter
+        """
+            )
+        )
+        == [
+            'rundll32 exe RunHTMLApplication foo bar Image="*\\\\rundll32.exe" CommandLine="*javascript:*" CommandLine="* RunHTMLApplication *" User="foo_bar" source="WinEventLog" NOT ParentImage="C:\\\\Windows\\\\explorer.exe"'
+        ]
+    )
+
+
+def test_khulnasoft_term_prefilters_operator_words():
+    rule = """
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel:
+                    Message: 'Logon NOT allowed AND denied'
+                condition: sel
+        """
+    (query,) = KhulnasoftBackend(term_prefilters="true").convert(
+        SigmaCollection.from_yaml(rule)
+    )
+    assert query == 'Logon allowed denied Message="Logon NOT allowed AND denied"'
+    engine = KhulnasoftSearchEngine([{"Message": "Logon NOT allowed AND denied"}])
+    assert len(engine.search(query).rows) == 1
+
+
+def test_khulnasoft_term_prefilters_or():
+    assert (
+        KhulnasoftBackend(term_prefilters="term").convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel1:
+                    CommandLine|contains: ' -encodedcommand powershell'
+                    fieldA|re: foo.*bar
+                sel2:
+                    CommandLine|contains: ' -enc powershell '
+                    fieldB: powershell.exe
+                sel3:
+                    CommandLine|contains: ' -encodedcommand '
+                condition: 1 of sel*
+        """
+            )
+        )
+        == [
+            '\n| rex field=fieldA "(?<fieldAMatch>foo.*bar)"\n| eval fieldACondition=if(isnotnull(fieldAMatch), "true", "false")\n| search (CommandLine="* -encodedcommand powershell*" fieldACondition="true") OR (CommandLine="* -enc powershell *" fieldB="powershell.exe") OR CommandLine="* -encodedcommand *"'
+        ]
+    )
+
+
+def test_khulnasoft_term_prefilters_deferred():
+    assert (
+        KhulnasoftBackend(term_prefilters="term").convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel1:
+                    CommandLine|contains: ' -encodedcommand '
+                    fieldA|re: foo.*bar
+                sel2:
+                    CommandLine|contains: ' -encodedcommand powershell '
+                    fieldB|re: foo.*bar
+                condition: 1 of sel*
+        """
+            )
+        )
+        == [
+            'TERM(-encodedcommand)\n| rex field=fieldA "(?<fieldAMatch>foo.*bar)"\n| eval fieldACondition=if(isnotnull(fieldAMatch), "true", "false")\n| rex field=fieldB "(?<fieldBMatch>foo.*bar)"\n| eval fieldBCondition=if(isnotnull(fieldBMatch), "true", "false")\n| search (CommandLine="* -encodedcommand *" fieldACondition="true") OR (CommandLine="* -encodedcommand powershell *" fieldBCondition="true")'
+        ]
+    )
+
+
+def test_khulnasoft_term_prefilters_whole_terms():
+    assert (
+        KhulnasoftBackend(term_prefilters="term").convert(
+            SigmaCollection.from_yaml(
+                """
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel:
+                    Image|endswith: '\\rundll32.exe'
+                    CommandLine|contains: ' shell32.dll,Control_RunDLL '
+                    TargetFilename|contains: 'C:/Users/Public/evil.ps1'
+                    User: foo.bar
+                condition: sel
+        """
+            )
+        )
+        == [
+            'TERM(shell32.dll) TERM(Control_RunDLL) Image="*\\\\rundll32.exe" CommandLine="* shell32.dll,Control_RunDLL *" TargetFilename="*C:/Users/Public/evil.ps1*" User="foo.bar"'
+        ]
+    )
+
+
+def test_khulnasoft_term_prefilters_unknown_mode():
+    with pytest.raises(
+        SigmaFeatureNotSupportedByBackendError, match="Unknown term prefilter mode"
+    ):
+        KhulnasoftBackend(term_prefilters="bloom")
+
+
+def test_khulnasoft_consolidated_savedsearches():
+    assert (
+        KhulnasoftBackend(processing_pipeline=khulnasoft_windows_pipeline()).convert(
+            SigmaCollection.from_yaml(
+                """
+title: Test 1
+id: 5013332f-8a70-4e04-bcc1-06a98a2cca2e
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        EventID: 4688
+        CommandLine|contains: '"/c'
+    condition: sel
+---
+title: Test 2
+status: test
+logsource:
+    product: windows
+    service: sysmon
+detection:
+    sel:
+        EventID: 1
+    condition: sel
+---
+title: Test 3
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        EventID: 4624
+    filter:
+        - User: SYSTEM
+        - LogonType: 3
+    condition: sel and not filter
+---
+title: Test 4
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        CommandLine|re: 'a.*b'
+    condition: sel
+"""
+            ),
+            "consolidated_savedsearches",
+        )
+        == r'''
+[default]
+dispatch.earliest_time = -30d
+dispatch.latest_time = now
+
+[Consolidated search source="WinEventLog:Security"]
+description = Rules: Test 1, Test 3
+search = source="WinEventLog:Security" (EventCode=4688 CommandLine="*\"/c*") OR (EventCode=4624 NOT (User="SYSTEM" OR LogonType=3)) \
+| eval rule_id=mvappend(if(searchmatch("EventCode=4688 CommandLine=\"*\\\"/c*\""), "5013332f-8a70-4e04-bcc1-06a98a2cca2e", null()), if(searchmatch("EventCode=4624 NOT (User=\"SYSTEM\" OR LogonType=3)"), "Test 3", null()))
+
+[Consolidated search source="WinEventLog:Microsoft-Windows-Sysmon/Operational"]
+description = Rules: Test 2
+search = source="WinEventLog:Microsoft-Windows-Sysmon/Operational" (EventCode=1) \
+| eval rule_id=mvappend(if(searchmatch("EventCode=1"), "Test 2", null()))
+
+[Test 4]
+description = 
+search = source="WinEventLog:Security" \
+| regex CommandLine="a.*b"'''
+    )
+
+
+def test_khulnasoft_consolidated_savedsearches_correlation_not_supported():
+    with pytest.raises(
+        SigmaFeatureNotSupportedByBackendError, match="consolidated_savedsearches"
+    ):
+        KhulnasoftBackend().convert(
+            SigmaCollection.from_yaml(
+                """
+title: Base
+name: base
+status: test
+logsource:
+    category: test_category
+detection:
+    sel:
+        fieldA: value
+    condition: sel
+---
+title: Correlation
+status: test
+correlation:
+    type: value_count
+    rules:
+        - base
+    group-by:
+        - fieldB
+    timespan: 5m
+    condition:
+        field: fieldC
+        gte: 2
+"""
+            ),
+            "consolidated_savedsearches",
+        )
+
+
+def test_khulnasoft_explain_output():
+    explain = KhulnasoftBackend().convert(
+        SigmaCollection.from_yaml(
+            r"""
+title: Test
+status: test
+logsource:
+    category: test_category
+    product: test_product
+detection:
+    sel:
+        fieldA|endswith: foo.exe
+    filter:
+        - fieldB|re: 'a.*b'
+        - fieldC|re: 'c.*d'
+    condition: sel and not filter
+fields:
+    - fieldA
+"""
+        ),
+        "explain",
+    )
+    assert len(explain) == 1
+    assert explain[0]["score"] == 36
+    assert [finding["check"] for finding in explain[0]["findings"]] == [
+        "leading_wildcard",
+        "unscoped",
+        "or_regex_eval",
+        "or_regex_eval",
+        "search_head_stage",
+    ]
+    assert explain[0]["stages"] == [
+        {"command": "rex", "location": "indexer"},
+        {"command": "eval", "location": "indexer"},
+        {"command": "rex", "location": "indexer"},
+        {"command": "eval", "location": "indexer"},
+        {"command": "search", "location": "indexer"},
+        {"command": "table", "location": "search_head"},
+    ]
+
+
+def test_khulnasoft_explain_not_only_raw_regex():
+    explain = KhulnasoftBackend(khulnasoft_windows_pipeline()).convert(
+        SigmaCollection.from_yaml(
+            r"""
+title: Test
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        _raw|re: 'evil.*thing'
+    filter:
+        EventID: 4624
+    condition: not filter and sel
+"""
+        ),
+        "explain",
+    )
+    assert [finding["check"] for finding in explain[0]["findings"]] == [
+        "raw_regex",
+    ]
+    assert (
+        explain[0]["query"]
+        == 'source="WinEventLog:Security" NOT EventCode=4624\n| regex _raw="evil.*thing"'
+    )
+
+
+def test_khulnasoft_explain_correlation_not_supported():
+    with pytest.raises(SigmaFeatureNotSupportedByBackendError, match="explain"):
+        KhulnasoftBackend().convert(
+            SigmaCollection.from_yaml(
+                """
+title: Base
+name: base
+status: test
+logsource:
+    category: test_category
+detection:
+    sel:
+        fieldA: value
+    condition: sel
+---
+title: Correlation
+status: test
+correlation:
+    type: event_count
+    rules:
+        - base
+    group-by:
+        - fieldB
+    timespan: 5m
+    condition:
+        gte: 2
+"""
+            ),
+            "explain",
+        )
+
+
+def test_khulnasoft_cost_metadata_savedsearches():
+    output = KhulnasoftBackend(cost_metadata=True).convert(
+        SigmaCollection.from_yaml(
+            r"""
+title: Test
+status: test
+logsource:
+    category: test_category
+    product: test_product
+detection:
+    filter:
+        fieldA: foo
+    condition: not filter
+"""
+        ),
+        "savedsearches",
+    )
+    assert output.endswith(
+        """
+[Test]
+# cost.score = 25
+# cost.findings = not_only, unscoped
+# cost.search_head_stages = 
+description = 
+search = NOT fieldA="foo\""""
+    )
+
+
+def test_khulnasoft_cost_threshold():
+    rule = r"""
+title: Test
+status: test
+logsource:
+    category: test_category
+    product: test_product
+detection:
+    sel:
+        fieldA|contains: foo
+    condition: sel
+"""
+    assert KhulnasoftBackend(cost_threshold=15).convert(
+        SigmaCollection.from_yaml(rule)
+    ) == ['fieldA="*foo*"']
+    with pytest.raises(
+        SigmaConversionError, match="Query cost 15 exceeds threshold 10"
+    ):
+        KhulnasoftBackend(cost_threshold=10).convert(SigmaCollection.from_yaml(rule))
@@ -0,0 +1,119 @@
+from sigma.collection import SigmaCollection
+from sigma.backends.khulnasoft import KhulnasoftBackend
+from sigma.backends.khulnasoft.cache import KhulnasoftQueryCache
+from sigma.pipelines.khulnasoft import khulnasoft_windows_pipeline
+
+rule = """
+title: Test
+status: test
+logsource:
+    product: windows
+    service: security
+detection:
+    sel:
+        EventID: 4625
+        fieldA|re: foo.*bar
+    condition: sel
+"""
+
+
+def test_khulnasoft_cache_hit(tmp_path):
+    expected = KhulnasoftBackend(
+        processing_pipeline=khulnasoft_windows_pipeline()
+    ).convert(SigmaCollection.from_yaml(rule))
+    for _ in range(2):
+        khulnasoft_backend = KhulnasoftBackend(
+            processing_pipeline=khulnasoft_windows_pipeline(), cache_dir=tmp_path
+        )
+        assert khulnasoft_backend.convert(SigmaCollection.from_yaml(rule)) == expected
+        assert len(khulnasoft_backend.cache.entries) == 1
+
+
+def test_khulnasoft_cache_key_changes(tmp_path):
+    khulnasoft_backend = KhulnasoftBackend(cache_dir=tmp_path)
+    khulnasoft_backend.convert(SigmaCollection.from_yaml(rule))
+    khulnasoft_backend.convert(SigmaCollection.from_yaml(rule), "savedsearches")
+    khulnasoft_backend.convert(SigmaCollection.from_yaml(rule.replace("4625", "4624")))
+    KhulnasoftBackend(cache_dir=tmp_path, min_time="-1d").convert(
+        SigmaCollection.from_yaml(rule), "savedsearches"
+    )
+    assert KhulnasoftBackend(
+        processing_pipeline=khulnasoft_windows_pipeline(), cache_dir=tmp_path
+    ).convert(SigmaCollection.from_yaml(rule)) == [
+        'source="WinEventLog:Security" EventCode=4625\n| regex fieldA="foo.*bar"'
+    ]
+    assert len(list(tmp_path.glob("*.json"))) == 5
+
+
+def test_khulnasoft_cache_savedsearches_settings(tmp_path):
+    for value in ("A", "B", "A"):
+        assert (
+            KhulnasoftBackend(
+                cache_dir=tmp_path, query_settings=lambda x: {"custom.key": value}
+            )
+            .convert(SigmaCollection.from_yaml(rule), "savedsearches")
+            .endswith(
+                f'\n[Test]\ncustom.key = {value}\ndescription = \nsearch = EventID=4625 \\\n| regex fieldA="foo.*bar"'
+            )
+        )
+
+
+def test_khulnasoft_cache_correlation(tmp_path):
+    rules = """
+title: Base rule
+name: base_rule
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value1
+    condition: selection
+---
+title: Multiple occurrences of base event
+status: test
+correlation:
+    type: event_count
+    rules:
+        - base_rule
+    group-by:
+        - fieldC
+    timespan: 15m
+    condition:
+        gte: 10
+    """
+    expected = [
+        """fieldA="value1"
+
+| bin _time span=15m
+| stats count as event_count by _time fieldC
+
+| search event_count >= 10"""
+    ]
+    for _ in range(2):
+        assert (
+            KhulnasoftBackend(cache_dir=tmp_path).convert(
+                SigmaCollection.from_yaml(rules)
+            )
+            == expected
+        )
+
+
+def test_khulnasoft_cache_lru_eviction(tmp_path):
+    cache = KhulnasoftQueryCache(tmp_path, max_size=30)
+    cache.put("a", ["0123456789"])
+    cache.put("b", ["0123456789"])
+    assert cache.get("a") == ["0123456789"]
+    cache.put("c", ["0123456789"])
+    assert cache.get("b") is None
+    assert cache.get("a") == ["0123456789"]
+    assert cache.get("c") == ["0123456789"]
+    assert KhulnasoftQueryCache(tmp_path, max_size=30).size == cache.size == 28
+
+
+def test_khulnasoft_cache_clear(tmp_path):
+    cache = KhulnasoftQueryCache(tmp_path)
+    cache.put("a", ["query"])
+    cache.clear()
+    assert cache.get("a") is None
+    assert list(tmp_path.iterdir()) == []
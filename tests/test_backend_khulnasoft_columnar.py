@@ -0,0 +1,234 @@
+import pytest
+from test_backend_khulnasoft import khulnasoft_backend
+from test_backend_khulnasoft_engine import events
+from sigma.backends.khulnasoft import KhulnasoftBackend
+from sigma.backends.khulnasoft.columnar import ColumnarBatch, ColumnarMatcher
+from sigma.backends.khulnasoft.engine import KhulnasoftSearchEngine
+from sigma.collection import SigmaCollection
+from sigma.exceptions import SigmaFeatureNotSupportedByBackendError
+from sigma.pipelines.khulnasoft import (
+    khulnasoft_cim_data_model,
+    khulnasoft_windows_pipeline,
+)
+
+
+@pytest.fixture
+def batch():
+    return ColumnarBatch(events)
+
+
+def rule(detection: str, logsource: str = "category: test_category") -> str:
+    return f"""
+title: Test
+status: test
+logsource:
+    {logsource}
+detection:
+{detection}
+"""
+
+
+def matches(backend, batch, detection, logsource="category: test_category"):
+    (matcher,) = backend.convert(
+        SigmaCollection.from_yaml(rule(detection, logsource)), "columnar"
+    )
+    assert isinstance(matcher, ColumnarMatcher)
+    return matcher.positions(batch)
+
+
+def test_columnar_strings(khulnasoft_backend: KhulnasoftBackend, batch):
+    assert (
+        matches(
+            khulnasoft_backend,
+            batch,
+            r"""
+    sel:
+        Image|endswith:
+            - '\cmd.exe'
+            - '\powershell.exe'
+        User:
+            - ALICE
+            - bob
+            - carol
+    filter:
+        CommandLine|contains: 'net user'
+    condition: sel and not filter
+""",
+        )
+        == [0, 1]
+    )
+
+
+def test_columnar_regex_cidr_and_compare(khulnasoft_backend: KhulnasoftBackend, batch):
+    assert (
+        matches(
+            khulnasoft_backend,
+            batch,
+            r"""
+    sel1:
+        CommandLine|re: '-enc [A-Z]+'
+    sel2:
+        src_ip|cidr: 8.0.0.0/8
+    sel3:
+        process.pid|gte: 4000
+    condition: 1 of sel*
+""",
+        )
+        == [1, 2, 3]
+    )
+
+
+def test_columnar_null(khulnasoft_backend: KhulnasoftBackend, batch):
+    assert (
+        matches(
+            khulnasoft_backend,
+            batch,
+            """
+    sel:
+        User: null
+    condition: sel
+""",
+        )
+        == [2]
+    )
+
+
+def test_columnar_keywords(khulnasoft_backend: KhulnasoftBackend, batch):
+    detection = """
+    keywords:
+        - whoami
+    condition: keywords
+"""
+    assert matches(khulnasoft_backend, batch, detection) == [0]
+    raw_batch = ColumnarBatch(
+        [{"_raw": "user ran WHOAMI", "CommandLine": "x"}, {"CommandLine": "whoami"}]
+    )
+    assert matches(khulnasoft_backend, raw_batch, detection) == [0]
+
+
+def test_columnar_windows_pipeline():
+    backend = KhulnasoftBackend(khulnasoft_windows_pipeline())
+    batch = ColumnarBatch(
+        [
+            {
+                "EventCode": 1,
+                "source": "WinEventLog:Microsoft-Windows-Sysmon/Operational",
+                "Image": "C:\\cmd.exe",
+            },
+            {"EventCode": 1, "source": "WinEventLog:Security", "Image": "C:\\cmd.exe"},
+        ]
+    )
+    assert (
+        matches(
+            backend,
+            batch,
+            r"""
+    sel:
+        Image|endswith: '\cmd.exe'
+    condition: sel
+""",
+            "product: windows\n    service: sysmon",
+        )
+        == [0]
+    )
+
+
+def test_columnar_cim_data_model_field_names():
+    backend = KhulnasoftBackend(khulnasoft_cim_data_model())
+    batch = ColumnarBatch(
+        [{"Processes.process_path": "C:\\cmd.exe"}, {"Image": "C:\\cmd.exe"}]
+    )
+    assert (
+        matches(
+            backend,
+            batch,
+            r"""
+    sel:
+        Image|endswith: '\cmd.exe'
+    condition: sel
+""",
+            "product: windows\n    category: process_creation",
+        )
+        == [0]
+    )
+
+
+@pytest.mark.parametrize(
+    "detection",
+    [
+        r"""
+    sel:
+        Image|endswith:
+            - '\cmd.exe'
+            - '\explorer.exe'
+    filter:
+        User: alice
+    condition: sel and not filter
+""",
+        r"""
+    sel:
+        CommandLine|re: 'cmd\.exe /c \w+'
+    sel2:
+        src_ip|cidr: 192.168.0.0/16
+    condition: 1 of sel*
+""",
+        """
+    sel:
+        host: ws1
+        CommandLine|contains|all:
+            - cmd
+            - user
+    condition: sel
+""",
+    ],
+)
+def test_columnar_agrees_with_search_engine(detection, batch):
+    spl_backend, columnar_backend = KhulnasoftBackend(), KhulnasoftBackend()
+    (query,) = spl_backend.convert(SigmaCollection.from_yaml(rule(detection)))
+    (matcher,) = columnar_backend.convert(
+        SigmaCollection.from_yaml(rule(detection)), "columnar"
+    )
+    engine = KhulnasoftSearchEngine(events)
+    assert [engine.events[i]["_time"] for i in matcher.positions(batch)] == [
+        row["_time"] for row in engine.search(query).rows
+    ]
+
+
+def test_columnar_batch_multivalue_and_count():
+    batch = ColumnarBatch([{"a": ["x", "y"]}, {"a": "y"}, {"b": ""}])
+    assert batch.size == 3
+    assert batch.positions(batch.lookup("a", ["y"])) == [0, 1]
+    assert batch.count(batch.present("a")) == 2
+    assert batch.positions(batch.all ^ batch.present("b")) == [0, 1, 2]
+
+
+def test_columnar_correlation_not_supported(khulnasoft_backend: KhulnasoftBackend):
+    with pytest.raises(SigmaFeatureNotSupportedByBackendError, match="columnar"):
+        khulnasoft_backend.convert(
+            SigmaCollection.from_yaml(
+                """
+title: Base
+name: base
+status: test
+logsource:
+    category: test_category
+detection:
+    sel:
+        fieldA: value
+    condition: sel
+---
+title: Correlation
+status: test
+correlation:
+    type: event_count
+    rules:
+        - base
+    group-by:
+        - fieldB
+    timespan: 5m
+    condition:
+        gte: 2
+"""
+            ),
+            "columnar",
+        )
@@ -1,5 +1,37 @@
+import pytest
 from test_backend_khulnasoft import khulnasoft_backend
+from sigma.backends.khulnasoft import KhulnasoftBackend
 from sigma.collection import SigmaCollection
+from sigma.exceptions import (
+    SigmaConversionError,
+    SigmaFeatureNotSupportedByBackendError,
+)
+from sigma.pipelines.khulnasoft import khulnasoft_cim_data_model
+
+data_model_base_rules = r"""
+title: Process rule
+name: process_rule
+status: test
+logsource:
+    product: windows
+    category: process_creation
+detection:
+    selection:
+        Image|endswith: '\cmd.exe'
+    condition: selection
+---
+title: Registry rule
+name: registry_rule
+status: test
+logsource:
+    product: windows
+    category: registry_set
+detection:
+    selection:
+        TargetObject|re: 'Run[0-9]'
+    condition: selection
+---
+"""
 
 
 def test_event_count_correlation_rule_stats_query(khulnasoft_backend):
@@ -121,11 +153,500 @@ correlation:
     )
     assert khulnasoft_backend.convert(correlation_rule) == [
         """| multisearch
-[ search fieldA="value1" fieldB="value2" | eval event_type="base_rule_1" | rename fieldC as field ]
-[ search fieldA="value3" fieldB="value4" | eval event_type="base_rule_2" | rename fieldD as field ]
+[ search fieldA="value1" fieldB="value2" | eval event_type="base_rule_1" | rename fieldC as field | fields _time event_type fieldC field ]
+[ search fieldA="value3" fieldB="value4" | eval event_type="base_rule_2" | rename fieldD as field | fields _time event_type fieldC field ]
 
 | bin _time span=15m
 | stats dc(event_type) as event_type_count by _time fieldC
 
 | search event_type_count >= 2"""
     ]
+
+
+temporal_ordered_correlation_rule = """
+title: Base rule 1
+name: base_rule_1
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value1
+    condition: selection
+---
+title: Base rule 2
+name: base_rule_2
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value2
+    condition: selection
+---
+title: Base rule 3
+name: base_rule_3
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value3
+    condition: selection
+---
+title: Ordered temporal correlation rule
+status: test
+correlation:
+    type: temporal_ordered
+    rules:
+        - base_rule_1
+        - base_rule_2
+        - base_rule_3
+    group-by:
+        - fieldC
+    timespan: 15m
+"""
+
+
+def test_temporal_ordered_correlation_rule_stats_query(khulnasoft_backend):
+    correlation_rule = SigmaCollection.from_yaml(temporal_ordered_correlation_rule)
+    assert khulnasoft_backend.convert(correlation_rule) == [
+        """| multisearch
+[ search fieldA="value1" | eval event_type="base_rule_1" | fields _time event_type fieldC ]
+[ search fieldA="value2" | eval event_type="base_rule_2" | fields _time event_type fieldC ]
+[ search fieldA="value3" | eval event_type="base_rule_3" | fields _time event_type fieldC ]
+
+| eval event_time=_time
+| bin _time span=15m
+| eventstats min(eval(if(event_type="base_rule_1", event_time, null()))) as step_time_1 by _time fieldC
+| eventstats min(eval(if(event_type="base_rule_2" AND event_time>=step_time_1, event_time, null()))) as step_time_2 by _time fieldC
+| eventstats min(eval(if(event_type="base_rule_3" AND event_time>=step_time_2, event_time, null()))) as step_time_3 by _time fieldC
+| stats max(eval(mvcount(mvappend(step_time_1, step_time_2, step_time_3)))) as event_type_count by _time fieldC
+
+| search event_type_count >= 3"""
+    ]
+
+
+def test_temporal_ordered_correlation_rule_streamstats_not_supported(
+    khulnasoft_backend,
+):
+    correlation_rule = SigmaCollection.from_yaml(temporal_ordered_correlation_rule)
+    with pytest.raises(SigmaConversionError, match="streamstats"):
+        khulnasoft_backend.convert(correlation_rule, correlation_method="streamstats")
+
+
+def test_event_count_correlation_rule_streamstats_query(khulnasoft_backend):
+    correlation_rule = SigmaCollection.from_yaml(
+        """
+title: Base rule
+name: base_rule
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value1
+        fieldB: value2
+    condition: selection
+---
+title: Multiple occurrences of base event
+status: test
+correlation:
+    type: event_count
+    rules:
+        - base_rule
+    group-by:
+        - fieldC
+        - fieldD
+    timespan: 15m
+    condition:
+        gte: 10
+            """
+    )
+    assert khulnasoft_backend.convert(
+        correlation_rule, correlation_method="streamstats"
+    ) == [
+        """fieldA="value1" fieldB="value2"
+
+| streamstats time_window=15m count as event_count by fieldC fieldD
+
+| search event_count >= 10"""
+    ]
+
+
+def test_event_count_correlation_rule_streamstats_query_without_group_by(
+    khulnasoft_backend,
+):
+    correlation_rule = SigmaCollection.from_yaml(
+        """
+title: Base rule
+name: base_rule
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value1
+    condition: selection
+---
+title: Multiple occurrences of base event
+status: test
+correlation:
+    type: event_count
+    rules:
+        - base_rule
+    timespan: 1h
+    condition:
+        gt: 100
+            """
+    )
+    assert khulnasoft_backend.convert(
+        correlation_rule, correlation_method="streamstats"
+    ) == [
+        """fieldA="value1"
+
+| streamstats time_window=1h count as event_count
+
+| search event_count > 100"""
+    ]
+
+
+def test_value_count_correlation_rule_streamstats_query(khulnasoft_backend):
+    correlation_rule = SigmaCollection.from_yaml(
+        """
+title: Base rule
+name: base_rule
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value1
+        fieldB: value2
+    condition: selection
+---
+title: Multiple occurrences of base event
+status: test
+correlation:
+    type: value_count
+    rules:
+        - base_rule
+    group-by:
+        - fieldC
+    timespan: 15m
+    condition:
+        lt: 10
+        field: fieldD
+            """
+    )
+    assert khulnasoft_backend.convert(
+        correlation_rule, correlation_method="streamstats"
+    ) == [
+        """fieldA="value1" fieldB="value2"
+
+| streamstats time_window=15m dc(fieldD) as value_count by fieldC
+
+| search value_count < 10"""
+    ]
+
+
+def test_temporal_correlation_rule_streamstats_query(khulnasoft_backend):
+    correlation_rule = SigmaCollection.from_yaml(
+        """
+title: Base rule 1
+name: base_rule_1
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value1
+        fieldB: value2
+    condition: selection
+---
+title: Base rule 2
+name: base_rule_2
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value3
+        fieldB: value4
+    condition: selection
+---
+title: Temporal correlation rule
+status: test
+correlation:
+    type: temporal
+    rules:
+        - base_rule_1
+        - base_rule_2
+    group-by:
+        - fieldC
+    timespan: 15m
+"""
+    )
+    assert khulnasoft_backend.convert(
+        correlation_rule, correlation_method="streamstats"
+    ) == [
+        """| multisearch
+[ search fieldA="value1" fieldB="value2" | eval event_type="base_rule_1" | fields _time event_type fieldC ]
+[ search fieldA="value3" fieldB="value4" | eval event_type="base_rule_2" | fields _time event_type fieldC ]
+
+| streamstats time_window=15m dc(event_type) as event_type_count by fieldC
+
+| search event_type_count >= 2"""
+    ]
+
+
+def test_event_count_correlation_rule_data_model_query():
+    correlation_rule = SigmaCollection.from_yaml(
+        data_model_base_rules
+        + """
+title: Many cmd executions
+status: test
+correlation:
+    type: event_count
+    rules:
+        - process_rule
+    group-by:
+        - Computer
+    timespan: 15m
+    condition:
+        gte: 10
+"""
+    )
+    assert KhulnasoftBackend(khulnasoft_cim_data_model()).convert(
+        correlation_rule, "data_model"
+    )[-1] == (
+        r"""| tstats summariesonly=false allow_old_summaries=true count as event_count from datamodel=Endpoint.Processes where Processes.process_path="*\\cmd.exe" by _time span=15m Processes.dest
+| `drop_dm_object_name(Processes)`
+
+| search event_count >= 10"""
+    )
+
+
+def test_value_count_correlation_rule_data_model_query():
+    correlation_rule = SigmaCollection.from_yaml(
+        data_model_base_rules
+        + """
+title: Many users executing cmd
+status: test
+correlation:
+    type: value_count
+    rules:
+        - process_rule
+    group-by:
+        - Computer
+    timespan: 1h
+    condition:
+        gt: 3
+        field: User
+"""
+    )
+    assert KhulnasoftBackend(
+        khulnasoft_cim_data_model(), data_model_summariesonly=True
+    ).convert(correlation_rule, "data_model")[-1] == (
+        r"""| tstats summariesonly=true allow_old_summaries=true dc(Processes.user) as value_count from datamodel=Endpoint.Processes where Processes.process_path="*\\cmd.exe" by _time span=1h Processes.dest
+| `drop_dm_object_name(Processes)`
+
+| search value_count > 3"""
+    )
+
+
+def test_temporal_correlation_rule_data_model_query():
+    correlation_rule = SigmaCollection.from_yaml(
+        data_model_base_rules
+        + """
+title: cmd and Run key by same process
+status: test
+correlation:
+    type: temporal
+    rules:
+        - process_rule
+        - registry_rule
+    aliases:
+        process:
+            process_rule: ProcessGuid
+            registry_rule: ProcessGuid
+    group-by:
+        - Computer
+        - process
+    timespan: 15m
+"""
+    )
+    assert KhulnasoftBackend(khulnasoft_cim_data_model()).convert(
+        correlation_rule, "data_model"
+    )[-1] == (
+        r"""| tstats summariesonly=false allow_old_summaries=true count from datamodel=Endpoint.Processes where Processes.process_path="*\\cmd.exe" by _time span=15m Processes.dest Processes.process_guid
+| `drop_dm_object_name(Processes)`
+| rename process_guid as process
+| eval event_type="process_rule"
+| append [| tstats summariesonly=false allow_old_summaries=true count from datamodel=Endpoint.Registry by _time span=15m Registry.dest Registry.process_guid Registry.registry_key_name | where match('Registry.registry_key_name', "Run[0-9]") | `drop_dm_object_name(Registry)` | rename process_guid as process | eval event_type="registry_rule"]
+
+| stats dc(event_type) as event_type_count by _time dest process
+
+| search event_type_count >= 2"""
+    )
+
+
+def test_event_count_correlation_rule_data_model_multiple_rules():
+    correlation_rule = SigmaCollection.from_yaml(
+        data_model_base_rules
+        + """
+title: Many suspicious events
+status: test
+correlation:
+    type: event_count
+    rules:
+        - process_rule
+        - registry_rule
+    group-by:
+        - Computer
+    timespan: 15m
+    condition:
+        gte: 10
+"""
+    )
+    assert KhulnasoftBackend(khulnasoft_cim_data_model()).convert(
+        correlation_rule, "data_model_batch"
+    )[-1] == (
+        r"""| tstats summariesonly=false allow_old_summaries=true count from datamodel=Endpoint.Processes where Processes.process_path="*\\cmd.exe" by _time span=15m Processes.dest
+| `drop_dm_object_name(Processes)`
+| append [| tstats summariesonly=false allow_old_summaries=true count from datamodel=Endpoint.Registry by _time span=15m Registry.dest Registry.registry_key_name | where match('Registry.registry_key_name', "Run[0-9]") | `drop_dm_object_name(Registry)`]
+
+| stats sum(count) as event_count by _time dest
+
+| search event_count >= 10"""
+    )
+
+
+def test_correlation_rule_data_model_savedsearches_cached(tmp_path):
+    # The second conversion takes the base rule from the cache.
+    outputs = [
+        KhulnasoftBackend(khulnasoft_cim_data_model(), cache_dir=tmp_path).convert(
+            SigmaCollection.from_yaml(
+                data_model_base_rules
+                + """
+title: Many cmd executions
+status: test
+correlation:
+    type: event_count
+    rules:
+        - process_rule
+    timespan: 15m
+    condition:
+        gte: 10
+"""
+            ),
+            "data_model_savedsearches",
+        )
+        for _ in range(2)
+    ]
+    assert outputs[0] == outputs[1]
+    assert (
+        r"""
+[Many cmd executions]
+description = 
+search = | tstats summariesonly=false allow_old_summaries=true count as event_count from datamodel=Endpoint.Processes where Processes.process_path="*\\cmd.exe" by _time span=15m \
+| `drop_dm_object_name(Processes)` \
+ \
+| search event_count >= 10"""
+        in outputs[0]
+    )
+
+
+def test_correlation_rule_data_model_streamstats_not_supported():
+    correlation_rule = SigmaCollection.from_yaml(
+        data_model_base_rules
+        + """
+title: Many cmd executions
+status: test
+correlation:
+    type: event_count
+    rules:
+        - process_rule
+    timespan: 15m
+    condition:
+        gte: 10
+"""
+    )
+    with pytest.raises(SigmaFeatureNotSupportedByBackendError, match="streamstats"):
+        KhulnasoftBackend(khulnasoft_cim_data_model()).convert(
+            correlation_rule, "data_model", correlation_method="streamstats"
+        )
+
+
+def test_temporal_ordered_correlation_rule_data_model_not_supported():
+    correlation_rule = SigmaCollection.from_yaml(
+        data_model_base_rules
+        + """
+title: cmd then Run key
+status: test
+correlation:
+    type: temporal_ordered
+    rules:
+        - process_rule
+        - registry_rule
+    group-by:
+        - Computer
+    timespan: 15m
+"""
+    )
+    with pytest.raises(SigmaFeatureNotSupportedByBackendError, match="Ordered"):
+        KhulnasoftBackend(khulnasoft_cim_data_model()).convert(
+            correlation_rule, "data_model"
+        )
+
+
+def test_value_count_correlation_rule_multiple_rules_fields_projection(
+    khulnasoft_backend,
+):
+    correlation_rule = SigmaCollection.from_yaml(
+        """
+title: Base rule 1
+name: base_rule_1
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value1
+    condition: selection
+---
+title: Base rule 2
+name: base_rule_2
+status: test
+logsource:
+    category: test
+detection:
+    selection:
+        fieldA: value2
+    condition: selection
+---
+title: Many values
+status: test
+correlation:
+    type: value_count
+    rules:
+        - base_rule_1
+        - base_rule_2
+    group-by:
+        - src-host
+    timespan: 1h
+    condition:
+        gte: 5
+        field: user
+"""
+    )
+    assert khulnasoft_backend.convert(correlation_rule) == [
+        """| multisearch
+[ search fieldA="value1" | eval event_type="base_rule_1" | fields _time event_type "src-host" user ]
+[ search fieldA="value2" | eval event_type="base_rule_2" | fields _time event_type "src-host" user ]
+
+| bin _time span=1h
+| stats dc(user) as value_count by _time "src-host"
+
+| search value_count >= 5"""
+    ]
@@ -0,0 +1,296 @@
+import pytest
+from test_backend_khulnasoft import khulnasoft_backend
+from sigma.backends.khulnasoft import KhulnasoftBackend
+from sigma.backends.khulnasoft.engine import KhulnasoftSearchEngine, load_events
+from sigma.collection import SigmaCollection
+from sigma.exceptions import SigmaFeatureNotSupportedByBackendError
+
+events = [
+    {
+        "_time": "2024-01-01T00:00:00Z",
+        "Image": "C:\\Windows\\System32\\cmd.exe",
+        "CommandLine": "cmd.exe /c whoami",
+        "User": "alice",
+        "host": "ws1",
+        "src_ip": "10.1.2.3",
+    },
+    {
+        "_time": "2024-01-01T00:01:00Z",
+        "Image": "C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\POWERSHELL.EXE",
+        "CommandLine": "powershell -enc SQBFAFgA",
+        "User": "bob",
+        "host": "ws1",
+        "src_ip": "192.168.1.10",
+    },
+    {
+        "_time": "2024-01-01T00:02:00Z",
+        "Image": "C:\\Windows\\explorer.exe",
+        "host": "ws2",
+        "process": {"pid": 4711},
+    },
+    {
+        "_time": "2024-01-01T00:03:00Z",
+        "Image": "C:\\Temp\\cmd.exe",
+        "CommandLine": "cmd.exe /c net user",
+        "User": "carol",
+        "host": "ws1",
+        "src_ip": "8.8.8.8",
+    },
+]
+
+
+@pytest.fixture
+def engine():
+    return KhulnasoftSearchEngine(events)
+
+
+def search(backend, engine, rule):
+    return [
+        engine.search(query).rows
+        for query in backend.convert(SigmaCollection.from_yaml(rule))
+    ]
+
+
+def test_engine_search_wildcards_in_and_null(
+    khulnasoft_backend: KhulnasoftBackend, engine
+):
+    (rows,) = search(
+        khulnasoft_backend,
+        engine,
+        r"""
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            fields:
+                - Image
+                - User
+            detection:
+                sel:
+                    Image|endswith:
+                        - '\cmd.exe'
+                        - '\powershell.exe'
+                filter:
+                    User: carol
+                nouser:
+                    User: null
+                condition: sel and not filter and not nouser
+        """,
+    )
+    assert rows == [
+        {"Image": "C:\\Windows\\System32\\cmd.exe", "User": "alice"},
+        {
+            "Image": "C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\POWERSHELL.EXE",
+            "User": "bob",
+        },
+    ]
+
+
+def test_engine_search_regex_and_cidr(khulnasoft_backend: KhulnasoftBackend, engine):
+    (rows,) = search(
+        khulnasoft_backend,
+        engine,
+        r"""
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel:
+                    CommandLine|re: 'cmd\.exe /c \w+ user'
+                    src_ip|cidr: 8.0.0.0/8
+                condition: sel
+        """,
+    )
+    assert [row["User"] for row in rows] == ["carol"]
+
+
+def test_engine_search_or_regex_and_cidr(khulnasoft_backend: KhulnasoftBackend, engine):
+    (rows,) = search(
+        khulnasoft_backend,
+        engine,
+        r"""
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel1:
+                    CommandLine|re: '-enc [A-Za-z0-9+/=]+'
+                sel2:
+                    src_ip|cidr:
+                        - 10.0.0.0/8
+                        - 172.16.0.0/12
+                condition: 1 of sel*
+        """,
+    )
+    assert [row["User"] for row in rows] == ["alice", "bob"]
+
+
+def test_engine_search_keywords_and_nested_fields(engine):
+    assert len(engine.search('"whoami"').rows) == 1
+    assert engine.search("process.pid=4711").rows[0]["host"] == "ws2"
+
+
+def test_engine_stages(engine):
+    result = engine.search(
+        'Image="*\\\\cmd.exe"\n| regex CommandLine="net" | table User'
+    )
+    assert result.rows == [{"User": "carol"}]
+    assert [
+        (stage.command.split()[0], stage.input_rows, stage.output_rows)
+        for stage in result.stages
+    ] == [("search", 4, 2), ("regex", 2, 1), ("table", 1, 1)]
+    assert result.seconds == sum(stage.seconds for stage in result.stages)
+
+
+def test_engine_value_count_correlation(khulnasoft_backend: KhulnasoftBackend, engine):
+    rows = search(
+        khulnasoft_backend,
+        engine,
+        r"""
+title: Shell
+name: shell
+status: test
+logsource:
+    category: test_category
+    product: test_product
+detection:
+    sel:
+        Image|endswith:
+            - '\cmd.exe'
+            - '\powershell.exe'
+    condition: sel
+---
+title: Many users
+status: test
+correlation:
+    type: value_count
+    rules:
+        - shell
+    group-by:
+        - host
+    timespan: 5m
+    condition:
+        field: User
+        gte: 3
+""",
+    )[-1]
+    assert rows == [{"_time": 1704067200.0, "host": "ws1", "value_count": 3}]
+
+
+@pytest.mark.parametrize(
+    "correlation_type,condition",
+    [("temporal", 2), ("temporal_ordered", 2)],
+)
+def test_engine_temporal_correlation(
+    khulnasoft_backend: KhulnasoftBackend, engine, correlation_type, condition
+):
+    rule = f"""
+title: Cmd
+name: cmd
+status: test
+logsource:
+    category: test_category
+    product: test_product
+detection:
+    sel:
+        Image|endswith: '\\cmd.exe'
+    condition: sel
+---
+title: PowerShell
+name: powershell
+status: test
+logsource:
+    category: test_category
+    product: test_product
+detection:
+    sel:
+        Image|endswith: '\\powershell.exe'
+    condition: sel
+---
+title: Sequence
+status: test
+correlation:
+    type: {correlation_type}
+    rules:
+        - powershell
+        - cmd
+    group-by:
+        - host
+    timespan: 5m
+    condition:
+        gte: {condition}
+"""
+    rows = search(khulnasoft_backend, engine, rule)[-1]
+    assert [row["host"] for row in rows] == ["ws1"]
+
+
+def test_engine_temporal_ordered_correlation_order(engine):
+    result = engine.search(
+        """| multisearch
+[ search Image="*\\\\powershell.exe" | eval event_type="powershell" | fields _time event_type host ]
+[ search User="alice" | eval event_type="cmd" | fields _time event_type host ]
+| eval event_time=_time
+| bin _time span=5m
+| eventstats min(eval(if(event_type="powershell", event_time, null()))) as step_time_1 by _time host
+| eventstats min(eval(if(event_type="cmd" AND event_time>=step_time_1, event_time, null()))) as step_time_2 by _time host
+| stats max(eval(mvcount(mvappend(step_time_1, step_time_2)))) as event_type_count by _time host"""
+    )
+    assert result.rows == [
+        {"_time": 1704067200.0, "host": "ws1", "event_type_count": 1}
+    ]
+
+
+def test_engine_streamstats_time_window(engine):
+    result = engine.search(
+        'host="ws1" | streamstats time_window=2m count as event_count by host | search event_count >= 2'
+    )
+    assert [row["User"] for row in result.rows] == ["bob"]
+
+
+def test_engine_unsupported_command(engine):
+    with pytest.raises(SigmaFeatureNotSupportedByBackendError, match="tstats"):
+        engine.search("| tstats count from datamodel=Endpoint.Processes")
+
+
+def test_engine_load_events(tmp_path):
+    jsonl = tmp_path / "events.jsonl"
+    jsonl.write_text('{"a": "1", "b": ["x", "y"]}\n\n{"a": "2"}\n')
+    csv = tmp_path / "events.csv"
+    csv.write_text("a,b\n3,\n4,z\n")
+    engine = KhulnasoftSearchEngine.from_files([jsonl, csv])
+    assert engine.events == [
+        {"a": "1", "b": ["x", "y"]},
+        {"a": "2"},
+        {"a": "3"},
+        {"a": "4", "b": "z"},
+    ]
+    assert [row["a"] for row in engine.search("b=y OR b=z").rows] == ["1", "4"]
+    assert list(load_events(jsonl))[0] == {"a": "1", "b": ["x", "y"]}
+
+
+def test_engine_search_or_case_insensitive_regex(
+    khulnasoft_backend: KhulnasoftBackend, engine
+):
+    (rows,) = search(
+        khulnasoft_backend,
+        engine,
+        r"""
+            title: Test
+            status: test
+            logsource:
+                category: test_category
+                product: test_product
+            detection:
+                sel1:
+                    CommandLine|re|i: 'POWERSHELL -ENC .*'
+                sel2:
+                    User: carol
+                condition: 1 of sel*
+        """,
+    )
+    assert [row["User"] for row in rows] == ["bob", "carol"]
@@ -0,0 +1,235 @@
+import io
+import os
+from sigma.collection import SigmaCollection
+from sigma.backends.khulnasoft import KhulnasoftBackend
+from sigma.backends.khulnasoft.savedsearches import (
+    SavedSearchesConf,
+    SavedSearchesWatcher,
+    SavedSearchesWriter,
+)
+
+
+def rule(title, value):
+    return f"""
+title: {title}
+status: test
+logsource:
+    category: test_category
+    product: test_product
+fields:
+    - fieldA
+detection:
+    sel:
+        fieldA: {value}
+        fieldB|re: foo.*bar
+    condition: sel
+"""
+
+
+def write_rule(path, title, value, mtime):
+    path.write_text(rule(title, value))
+    os.utime(path, (mtime, mtime))
+
+
+def test_khulnasoft_savedsearches_conf_roundtrip():
+    output = KhulnasoftBackend().convert(
+        SigmaCollection.from_yaml(
+            rule("Test 1", "foo") + "\n---\n" + rule("Test 2", "[bar]")
+        ),
+        "savedsearches",
+    )
+    conf = SavedSearchesConf.parse(output)
+    assert (
+        conf.header
+        == "\n[default]\ndispatch.earliest_time = -30d\ndispatch.latest_time = now\n"
+    )
+    assert [stanza.split("\n")[1] for _, stanza in conf.stanzas] == [
+        "[Test 1]",
+        "[Test 2]",
+    ]
+    assert conf.render() == output
+
+
+def test_khulnasoft_savedsearches_conf_continued_stanza_header():
+    text = "\n[default]\nkey = value\n\n[Test]\nsearch = foo \\\n[bar]\n\n[Test 2]\nsearch = bar"
+    conf = SavedSearchesConf.parse(text)
+    assert [stanza for _, stanza in conf.stanzas] == [
+        "\n[Test]\nsearch = foo \\\n[bar]",
+        "\n[Test 2]\nsearch = bar",
+    ]
+    assert conf.render() == text
+
+
+def test_khulnasoft_savedsearches_watcher(tmp_path):
+    rules = tmp_path / "rules"
+    rules.mkdir()
+    output = tmp_path / "savedsearches.conf"
+    khulnasoft_backend = KhulnasoftBackend()
+    write_rule(rules / "a.yml", "Test A", "a", 1000)
+    write_rule(rules / "b.yml", "Test B", "b", 1000)
+
+    def expected(*rule_yaml):
+        return KhulnasoftBackend().convert(
+            SigmaCollection.from_yaml("\n---\n".join(rule_yaml)), "savedsearches"
+        )
+
+    watcher = SavedSearchesWatcher(khulnasoft_backend, [rules], output)
+    assert watcher.poll() == {
+        "added": [rules / "a.yml", rules / "b.yml"],
+        "changed": [],
+        "removed": [],
+    }
+    assert output.read_text() == expected(rule("Test A", "a"), rule("Test B", "b"))
+
+    write_rule(rules / "a.yml", "Test A", "changed", 2000)
+    write_rule(rules / "c.yml", "Test C", "c", 2000)
+    (rules / "b.yml").unlink()
+    assert watcher.poll() == {
+        "added": [rules / "c.yml"],
+        "changed": [rules / "a.yml"],
+        "removed": [rules / "b.yml"],
+    }
+    assert output.read_text() == expected(
+        rule("Test A", "changed"), rule("Test C", "c")
+    )
+
+    assert watcher.poll() == {"added": [], "changed": [], "removed": []}
+
+
+def test_khulnasoft_savedsearches_watcher_existing_conf(tmp_path):
+    rules = tmp_path / "rules"
+    rules.mkdir()
+    output = tmp_path / "savedsearches.conf"
+    write_rule(rules / "a.yml", "Test A", "a", 1000)
+    write_rule(rules / "b.yml", "Test B", "b", 3000)
+    output.write_text(
+        "\n[default]\ncustom = setting\n\n[Manual]\nsearch = index=main\n\n"
+        + KhulnasoftBackend()
+        .convert(
+            SigmaCollection.from_yaml(
+                rule("Test A", "a") + "\n---\n" + rule("Test B", "old")
+            ),
+            "savedsearches",
+        )
+        .split("\n", 5)[5]
+    )
+    os.utime(output, (2000, 2000))
+
+    watcher = SavedSearchesWatcher(KhulnasoftBackend(), [rules], output)
+    assert watcher.poll() == {"added": [rules / "b.yml"], "changed": [], "removed": []}
+    assert output.read_text() == (
+        "\n[default]\ncustom = setting\n\n[Manual]\nsearch = index=main\n\n"
+        + KhulnasoftBackend()
+        .convert(
+            SigmaCollection.from_yaml(
+                rule("Test A", "a") + "\n---\n" + rule("Test B", "b")
+            ),
+            "savedsearches",
+        )
+        .split("\n", 5)[5]
+    )
+
+
+def test_khulnasoft_savedsearches_watcher_conversion_error(tmp_path):
+    rules = tmp_path / "rules"
+    rules.mkdir()
+    output = tmp_path / "savedsearches.conf"
+    write_rule(rules / "a.yml", "Test A", "a", 1000)
+    watcher = SavedSearchesWatcher(KhulnasoftBackend(), [rules], output)
+    watcher.poll()
+    content = output.read_text()
+
+    (rules / "a.yml").write_text(
+        rule("Test A", "a").replace("condition: sel", "condition: missing")
+    )
+    os.utime(rules / "a.yml", (2000, 2000))
+    assert watcher.poll()["changed"] == [rules / "a.yml"]
+    assert rules / "a.yml" in watcher.errors
+    assert output.read_text() == content
+
+
+def test_khulnasoft_savedsearches_watcher_invalid_yaml(tmp_path):
+    rules = tmp_path / "rules"
+    rules.mkdir()
+    output = tmp_path / "savedsearches.conf"
+    write_rule(rules / "a.yml", "Test A", "a", 1000)
+    watcher = SavedSearchesWatcher(KhulnasoftBackend(), [rules], output)
+    watcher.poll()
+    content = output.read_text()
+
+    (rules / "a.yml").write_text(rule("Test A", "b").replace("    sel:", "    sel: ["))
+    os.utime(rules / "a.yml", (2000, 2000))
+    assert watcher.poll()["changed"] == [rules / "a.yml"]
+    assert rules / "a.yml" in watcher.errors
+    assert output.read_text() == content
+
+    write_rule(rules / "a.yml", "Test A", "b", 3000)
+    assert watcher.poll()["changed"] == [rules / "a.yml"]
+    assert watcher.errors == {}
+    assert 'fieldA="b"' in output.read_text()
+
+
+def test_khulnasoft_savedsearches_watcher_disappearing_file(tmp_path, monkeypatch):
+    rules = tmp_path / "rules"
+    rules.mkdir()
+    output = tmp_path / "savedsearches.conf"
+    write_rule(rules / "a.yml", "Test A", "a", 1000)
+    watcher = SavedSearchesWatcher(KhulnasoftBackend(), [rules], output)
+    watcher.poll()
+    content = output.read_text()
+
+    # b.yml is listed but removed before its modification time is read.
+    resolve_paths = SigmaCollection.resolve_paths
+    monkeypatch.setattr(
+        SigmaCollection,
+        "resolve_paths",
+        lambda *args: [*resolve_paths(*args), rules / "b.yml"],
+    )
+    assert watcher.poll() == {"added": [], "changed": [], "removed": []}
+    monkeypatch.undo()
+
+    # c.yml is removed after the scan and before its conversion.
+    write_rule(rules / "c.yml", "Test C", "c", 2000)
+    scan = watcher.scan
+
+    def scan_and_remove():
+        mtimes = scan()
+        (rules / "c.yml").unlink()
+        return mtimes
+
+    monkeypatch.setattr(watcher, "scan", scan_and_remove)
+    assert watcher.poll()["added"] == [rules / "c.yml"]
+    assert isinstance(watcher.errors[rules / "c.yml"], FileNotFoundError)
+    assert output.read_text() == content
+    monkeypatch.undo()
+
+    assert watcher.poll()["removed"] == [rules / "c.yml"]
+    assert watcher.errors == {}
+    assert output.read_text() == content
+
+
+def test_khulnasoft_savedsearches_writer():
+    rules = "\n---\n".join(rule(f"Test {i}", f"value{i}") for i in range(3))
+    stream = io.StringIO()
+    SavedSearchesWriter(KhulnasoftBackend(), stream).write(
+        SigmaCollection.from_yaml(rules)
+    )
+    assert stream.getvalue() == KhulnasoftBackend().convert(
+        SigmaCollection.from_yaml(rules), "savedsearches"
+    )
+
+
+def test_khulnasoft_savedsearches_writer_empty():
+    stream = io.StringIO()
+    SavedSearchesWriter(KhulnasoftBackend(), stream)
+    assert stream.getvalue() == KhulnasoftBackend().finalize_output_savedsearches([])
+
+
+def test_khulnasoft_savedsearches_writer_files(tmp_path):
+    for i in range(3):
+        (tmp_path / f"{i}.yml").write_text(rule(f"Test {i}", f"value{i}"))
+    stream = io.StringIO()
+    SavedSearchesWriter(KhulnasoftBackend(), stream).write_files([tmp_path])
+    assert stream.getvalue() == KhulnasoftBackend().convert(
+        SigmaCollection.load_ruleset(sorted(tmp_path.glob("*.yml"))), "savedsearches"
+    )
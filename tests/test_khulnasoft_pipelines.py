@@ -1,3 +1,7 @@
+import subprocess
+import sys
+from pathlib import Path
+
 import pytest
 from sigma.collection import SigmaCollection
 from sigma.backends.khulnasoft import KhulnasoftBackend
@@ -5,6 +9,7 @@ from sigma.pipelines.khulnasoft import (
     khulnasoft_windows_pipeline,
     khulnasoft_windows_sysmon_acceleration_keywords,
     khulnasoft_cim_data_model,
+    pipelines,
 )
 from sigma.pipelines.common import windows_logsource_mapping
 from sigma.exceptions import SigmaTransformationError
@@ -385,3 +390,86 @@ def test_khulnasoft_dm_unsupported_logsource():
             """
             )
         )
+
+
+def test_khulnasoft_dm_items_not_shared():
+    pipeline, other = khulnasoft_cim_data_model(), khulnasoft_cim_data_model()
+    assert pipeline.items == other.items
+    assert not any(
+        item is other_item or item.transformation is other_item.transformation
+        for item, other_item in zip(pipeline.items, other.items)
+    )
+    dispatch, other_dispatch = (
+        pipeline.items[0].transformation,
+        other.items[0].transformation,
+    )
+    assert not any(
+        item is other_item
+        for item, other_item in zip(dispatch.items, other_dispatch.items)
+    )
+
+
+@pytest.mark.parametrize(
+    "logsource,identifiers",
+    [
+        (
+            "category: file_event\n    product: windows",
+            {"khulnasoft_dm_mapping_sysmon_file_event"},
+        ),
+        (
+            "category: process_creation\n    product: linux",
+            {"khulnasoft_dm_mapping_sysmon_process_creation"},
+        ),
+        (
+            "category: proxy\n    product: zeek",
+            {"khulnasoft_dm_mapping_web_proxy"},
+        ),
+        ("category: image_load\n    product: windows", set()),
+    ],
+)
+def test_khulnasoft_dm_logsource_dispatch(logsource, identifiers):
+    dispatch = khulnasoft_cim_data_model().items[0].transformation
+    rule = SigmaCollection.from_yaml(
+        f"""
+title: Test
+status: test
+logsource:
+    {logsource}
+detection:
+    sel:
+        Image: test
+    condition: sel
+"""
+    ).rules[0]
+    candidates = {
+        item.identifier
+        for item in dispatch.candidates(rule)
+        if item.identifier.startswith("khulnasoft_dm_mapping_")
+        and not item.identifier.endswith(("_unsupported_fields", "_data_model_set"))
+    }
+    assert candidates == identifiers
+
+
+def test_khulnasoft_pipelines_lazy_import():
+    code = """
+import sys
+import sigma.backends.khulnasoft
+from sigma.pipelines.khulnasoft import pipelines
+lazy = {"sigma.pipelines.khulnasoft.khulnasoft", "sigma.backends.khulnasoft.columnar"}
+print(sorted(lazy & set(sys.modules)))
+pipelines["khulnasoft_cim"]()
+print("sigma.pipelines.khulnasoft.khulnasoft" in sys.modules)
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=Path(__file__).parent.parent,
+    )
+    assert result.stdout.split("\n")[:2] == ["[]", "True"]
+
+
+def test_khulnasoft_pipelines_registry():
+    assert pipelines["khulnasoft_cim"].__name__ == "khulnasoft_cim_data_model"
+    assert pipelines["khulnasoft_windows"]().name == khulnasoft_windows_pipeline().name